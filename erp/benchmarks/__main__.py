@@ -0,0 +1,42 @@
+import argparse
+import os
+import sys
+
+import django
+
+
+# runs one of the benchmarks of benchmarks.suites against a scratch database and cache,
+# e.g. python -m benchmarks interval --size 100000 (from the erp directory)
+# the seeded data is rolled back once the benchmark is done
+def main(argv=None):
+    os.environ["DJANGO_SETTINGS_MODULE"] = "benchmarks.settings"
+    django.setup()
+
+    from django.conf import settings
+    from django.core.management import call_command
+
+    from erp import settings as erp_settings
+
+    from .suites import BENCHMARKS
+
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Run a performance benchmark.")
+    parser.add_argument("name", choices=sorted(BENCHMARKS))
+    parser.add_argument("--size", type=int, help="Number of rows to seed.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement.")
+    options = parser.parse_args(argv)
+
+    # refuses to seed or flush the database or the cache of the application
+    if not getattr(settings, "BENCHMARK_SCRATCH", False):
+        sys.exit("refusing to run: the benchmarks need benchmarks.settings")
+    if str(settings.DATABASES["default"]["NAME"]) == str(erp_settings.DATABASES["default"]["NAME"]):
+        sys.exit("refusing to run: BENCHMARK_DATABASE is the application database")
+    if settings.CACHES["default"].get("LOCATION") == erp_settings.CACHES["default"].get("LOCATION"):
+        sys.exit("refusing to run: BENCHMARK_REDIS_URL is the application cache")
+
+    call_command("migrate", verbosity=0)
+    bench, default_size = BENCHMARKS[options.name]
+    bench(size=options.size or default_size, repeat=options.repeat, log=print)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+# settings of the benchmark runner: the erp settings pointed at a scratch database and cache
+# the benchmarks seed and flush rows and cache keys, they never run against the real ones
+#
+#   python -m benchmarks interval --size 100000
+#   BENCHMARK_REDIS_URL=redis://127.0.0.1:6379/15 python -m benchmarks dashboard
+
+import os
+
+from erp.settings import *  # noqa: F401,F403
+from erp.settings import BASE_DIR
+
+BENCHMARK_SCRATCH = True
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('BENCHMARK_DATABASE', BASE_DIR / 'benchmark.sqlite3'),
+    }
+}
+
+SHARD_DATABASES = ['default']
+
+# a local memory cache, or a scratch redis database to time the redis round trips
+if os.environ.get('BENCHMARK_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': os.environ['BENCHMARK_REDIS_URL'],
+            'OPTIONS': {
+                'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            },
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
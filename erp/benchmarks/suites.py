@@ -0,0 +1,501 @@
+import random
+import statistics
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from uuid import uuid4
+
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.test import Client, RequestFactory, override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from erp_app import billing, caching, dashboard, reminders, renderers, throttling
+from erp_app.middleware import COMPRESSORS
+from erp_app.models import Invoice, LeaseManager, Payment, Property, Tenant, UnitRoom
+from erp_app.serializers import TenantSerializer
+
+# the benchmarks seed, flush and time against the database and cache of benchmarks.settings,
+# a scratch SQLite file and a local memory cache, see benchmarks/__main__.py
+# every benchmark runs inside a transaction that is rolled back at the end,
+# so the seeded rows never stay in the database
+
+
+# creates n tenants with random leases spread over ten years around today
+def seed_tenants(n, batch_size=10000, seed=42) -> None:
+    rng = random.Random(seed)
+    origin = timezone.now() - timedelta(days=365 * 5)
+    for offset in range(0, n, batch_size):
+        tenants = []
+        for i in range(offset, min(offset + batch_size, n)):
+            lease_start = origin + timedelta(days=rng.randrange(0, 365 * 9))
+            tenants.append(Tenant(
+                name=f"Bench Tenant {i}",
+                lease_start=lease_start,
+                lease_end=lease_start + timedelta(days=rng.randrange(30, 365 * 3)),
+                next_payment_due=lease_start + timedelta(days=31),
+                monthly_rent=Decimal(rng.randrange(500, 5000)),
+                unit="",
+            ))
+        Tenant.objects.bulk_create(tenants, batch_size=batch_size)
+
+
+# median wall time of fn over `repeat` runs, in milliseconds
+def timed(fn, repeat=5) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+# active_on / overlapping with the composite interval index against the same
+# filters once the index is dropped (the two single-column indexes only)
+def bench_interval(size=1_000_000, repeat=5, log=print) -> None:
+    today = timezone.localdate()
+    queries = {
+        "active_on(today)": lambda: Tenant.objects.active_on(today).count(),
+        "overlapping(next 30 days)": lambda: Tenant.objects.overlapping(today, today + timedelta(days=30)).count(),
+        "active_on(today) first 1000 ids": lambda: list(
+            Tenant.objects.active_on(today).order_by("lease_end").values_list("id", flat=True)[:1000]
+        ),
+    }
+
+    with transaction.atomic():
+        log(f"seeding {size} leases...")
+        seed_tenants(size)
+        if connection.vendor == "sqlite":
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+
+        indexed = {name: timed(fn, repeat) for name, fn in queries.items()}
+        with connection.cursor() as cursor:
+            cursor.execute("DROP INDEX tenant_lease_interval_idx")
+        naive = {name: timed(fn, repeat) for name, fn in queries.items()}
+
+        log(f"{'query':<35}{'interval index':>16}{'naive':>12}{'speedup':>10}")
+        for name in queries:
+            log(f"{name:<35}{indexed[name]:>14.1f}ms{naive[name]:>10.1f}ms{naive[name] / indexed[name]:>9.1f}x")
+
+        transaction.set_rollback(True)
+
+
+# /api/tenant/ serialization: TenantSerializer + DRF's JSONRenderer against the
+# .values() rows + FastJSONRenderer fast path, then the compressed response sizes
+def bench_serialization(size=100_000, repeat=5, log=print) -> None:
+    request = Request(RequestFactory().get("/api/tenant/"))
+    queryset = Tenant.objects.all()
+    orjson = renderers.orjson
+
+    def serializer_path():
+        data = TenantSerializer(TenantSerializer.setup_queryset(queryset, request), many=True).data
+        return JSONRenderer().render(data)
+
+    def values_path():
+        return renderers.dumps(TenantSerializer.values_rows(queryset, request))
+
+    def values_path_json():
+        renderers.orjson = None
+        try:
+            return renderers.dumps(TenantSerializer.values_rows(queryset, request))
+        finally:
+            renderers.orjson = orjson
+
+    paths = {
+        "ModelSerializer + JSONRenderer": serializer_path,
+        "values() + json": values_path_json,
+    }
+    if orjson is not None:
+        paths["values() + orjson"] = values_path
+
+    with transaction.atomic():
+        log(f"seeding {size} tenants...")
+        seed_tenants(size)
+
+        timings = {name: timed(fn, repeat) for name, fn in paths.items()}
+        baseline = timings["ModelSerializer + JSONRenderer"]
+        log(f"{'path':<35}{'time':>12}{'rows/s':>14}{'speedup':>10}")
+        for name, elapsed in timings.items():
+            log(f"{name:<35}{elapsed:>10.1f}ms{size / elapsed * 1000:>14,.0f}{baseline / elapsed:>9.1f}x")
+
+        body = values_path()
+        log(f"response: {len(body) / 1024:,.0f} KiB uncompressed")
+        for encoding, compress in COMPRESSORS.items():
+            started = time.perf_counter()
+            compressed = compress(body)
+            elapsed = (time.perf_counter() - started) * 1000
+            log(f"  {encoding:<6}{len(compressed) / 1024:>10,.0f} KiB{elapsed:>10.1f}ms")
+
+        transaction.set_rollback(True)
+
+
+# a property with `units` unit rooms, every room rented by its own tenant
+def seed_building(address, units) -> Property:
+    property = Property.objects.create_with_rooms(
+        address=address,
+        unit_numbers=[f"{address[:3]}{i:03d}" for i in range(units)],
+    )
+    seed_tenants(units)
+    tenants = list(Tenant.objects.order_by("-id").values_list("id", flat=True)[:units])
+    rooms = list(property.unit_rooms.order_by("id"))
+    for room, tenant_id in zip(rooms, tenants):
+        room.tenant_id = tenant_id
+    UnitRoom.objects.bulk_update(rooms, ["tenant"])
+    Property.tenants.through.objects.bulk_create([
+        Property.tenants.through(property_id=property.id, tenant_id=tenant_id) for tenant_id in tenants
+    ])
+    Property.objects.filter(id=property.id).recount_current_units()
+    property.refresh_from_db()
+    return property
+
+
+# queries and time of the property teardown paths on a small building and on a
+# `size` units building: the query counts must not grow with the number of units
+def bench_teardown(size=100, repeat=5, log=print) -> None:
+    def measure(address, units):
+        results = {}
+        operations = {
+            "Property.remove_tenant": lambda p: p.remove_tenant(p.tenants.first()),
+            "UnitRoom.remove_property": lambda p: p.unit_rooms.first().remove_property(),
+            "Property.delete_property": lambda p: p.delete_property(),
+        }
+        for name, operation in operations.items():
+            queries, timings = [], []
+            for run in range(repeat):
+                with transaction.atomic():
+                    property = seed_building(f"{address}-{run}", units)
+                    started = time.perf_counter()
+                    with CaptureQueriesContext(connection) as captured:
+                        operation(property)
+                    timings.append((time.perf_counter() - started) * 1000)
+                    queries.append(len(captured))
+                    transaction.set_rollback(True)
+            results[name] = (max(queries), statistics.median(timings))
+        return results
+
+    small = measure("Small", 10)
+    large = measure("Large", size)
+
+    log(f"{'operation':<28}{'10 units':>16}{f'{size} units':>18}")
+    for name in small:
+        log(f"{name:<28}{small[name][0]:>5} queries{small[name][1]:>6.1f}ms"
+            f"{large[name][0]:>7} queries{large[name][1]:>6.1f}ms")
+
+
+# accepts every POST after `latency` seconds, stands in for the remote webhook receiver of bench_reminders
+class SinkHandler(BaseHTTPRequestHandler):
+    latency = 0.05
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        time.sleep(self.latency)
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+# one run of send_reminders over `size` tenants, each due a lease expiry and a payment
+# reminder, through the in-memory email backend and a local webhook receiver,
+# at different concurrencies
+def bench_reminders(size=100_000, repeat=1, log=print) -> None:
+    now = timezone.now()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SinkHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    sinks = {
+        "email (locmem)": reminders.EmailSink("django.core.mail.backends.locmem.EmailBackend"),
+        "webhook": reminders.WebhookSink(f"http://127.0.0.1:{server.server_port}/"),
+    }
+
+    try:
+        with transaction.atomic():
+            log(f"seeding {size} tenants...")
+            seed_tenants(size)
+            Tenant.objects.update(
+                lease_end=now + timedelta(days=10),
+                next_payment_due=now + timedelta(days=1),
+            )
+
+            log(f"{'sink':<18}{'concurrency':>12}{'time':>12}{'reminders/s':>14}")
+            for name, sink in sinks.items():
+                for concurrency in (1, 8, 32):
+                    timings = []
+                    for _ in range(repeat):
+                        with transaction.atomic():
+                            started = time.perf_counter()
+                            stats = reminders.send_reminders(sink, now=now, concurrency=concurrency)
+                            timings.append((time.perf_counter() - started) * 1000)
+                            transaction.set_rollback(True)
+                        # the in-memory backend keeps every message
+                        mail.outbox = []
+                    sent = sum(counts["sent"] for counts in stats.values())
+                    elapsed = statistics.median(timings)
+                    log(f"{name:<18}{concurrency:>12}{elapsed:>10.1f}ms{sent / elapsed * 1000:>14,.0f}")
+
+            transaction.set_rollback(True)
+    finally:
+        server.shutdown()
+
+
+# rollover_due_dates over `size` tenants, two thirds of them with the invoices of
+# their first three due months paid
+def bench_rollover(size=100_000, repeat=1, log=print) -> None:
+    now = timezone.now()
+    with transaction.atomic():
+        log(f"seeding {size} tenants...")
+        seed_tenants(size)
+
+        rows = Tenant.objects.filter(name__startswith="Bench Tenant").order_by("id").values_list(
+            "id", "lease_start", "next_payment_due", "monthly_rent",
+        )
+        for offset in range(0, size, 10000):
+            invoices = []
+            for tenant_id, lease_start, due, rent in rows[offset:offset + 10000]:
+                if tenant_id % 3 == 0:
+                    continue
+                for month in range(3):
+                    period = billing.add_months(due.date().replace(day=1), month)
+                    invoices.append(Invoice(
+                        tenant_id=tenant_id,
+                        period=period,
+                        amount=rent,
+                        due_date=billing.due_date_for(lease_start, period),
+                        status=Invoice.PAID,
+                    ))
+            invoices = Invoice.objects.bulk_create(invoices, batch_size=10000)
+            Payment.objects.bulk_create(
+                [Payment(invoice=i, tenant_id=i.tenant_id, amount=i.amount) for i in invoices],
+                batch_size=10000,
+            )
+
+        log(f"{'run':<10}{'time':>12}{'queries':>10}{'scanned':>10}{'advanced':>10}")
+        for run in ("first", "second"):
+            started = time.perf_counter()
+            with CaptureQueriesContext(connection) as captured:
+                result = billing.rollover_due_dates(now=now)
+            elapsed = (time.perf_counter() - started) * 1000
+            log(f"{run:<10}{elapsed:>10.1f}ms{len(captured):>10}{result['scanned']:>10}{result['advanced']:>10}")
+
+        transaction.set_rollback(True)
+
+
+# one worker shared by a client polling /api/property/ twice a second and a client
+# flooding the unpaginated /api/tenant/ over `size` tenants, for 2 * repeat seconds
+# per scenario: the polite client alone, the flood without throttling and throttled at two rates
+# the polite latency runs from the moment its request was due, waiting for the worker included
+# busy: share of the worker's time spent on the flood's served (200) and throttled (429) requests
+def bench_throttling(size=20_000, repeat=5, log=print) -> None:
+    duration = 2 * repeat
+    polite_rate = 2
+    rate = getattr(settings, "API_THROTTLE_RATE", None) or throttling.THROTTLE_RATE
+    scenarios = {
+        "polite client alone": (False, None),
+        "flood, throttling off": (True, None),
+        f"flood, {rate}": (True, rate),
+        "flood, 12/min": (True, "12/min"),
+    }
+
+    with transaction.atomic():
+        log(f"seeding {size} tenants...")
+        seed_tenants(size)
+        log(f"throttle: {rate}, burst {getattr(settings, 'API_THROTTLE_BURST', throttling.THROTTLE_BURST)}, "
+            f"{type(throttling.token_buckets()).__name__}")
+
+        log(f"{'scenario':<24}{'polite/s':>10}{'p50':>10}{'p95':>10}{'polite 429':>12}"
+            f"{'flood 200':>11}{'flood 429':>11}{'busy 200':>10}{'busy 429':>10}")
+        for run, (name, (flood, scenario_rate)) in enumerate(scenarios.items()):
+            # new addresses every run, the buckets of the previous run are not reused
+            polite = Client(REMOTE_ADDR=f"10.{run}.0.1")
+            greedy = Client(REMOTE_ADDR=f"10.{run}.0.2")
+            latencies, polite_codes, flood_codes, flood_seconds = [], Counter(), Counter(), Counter()
+
+            with override_settings(API_THROTTLE_RATE=scenario_rate):
+                # the flood has spent its burst already, the runs show the steady state
+                while scenario_rate and flood and greedy.get("/api/property/").status_code != 429:
+                    pass
+                started = time.perf_counter()
+                due = started
+                while (now := time.perf_counter()) - started < duration:
+                    if now >= due:
+                        polite_codes[polite.get("/api/property/").status_code] += 1
+                        latencies.append((time.perf_counter() - due) * 1000)
+                        due += 1 / polite_rate
+                    elif flood:
+                        status = greedy.get("/api/tenant/").status_code
+                        flood_codes[status] += 1
+                        flood_seconds[status] += time.perf_counter() - now
+                    else:
+                        time.sleep(due - now)
+                elapsed = time.perf_counter() - started
+
+            p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]
+            log(f"{name:<24}{polite_codes[200] / elapsed:>10.2f}{statistics.median(latencies):>8.1f}ms"
+                f"{p95:>8.1f}ms{polite_codes[429]:>12}{flood_codes[200]:>11}{flood_codes[429]:>11}"
+                f"{flood_seconds[200] * 100 / elapsed:>9.0f}%{flood_seconds[429] * 100 / elapsed:>9.0f}%")
+
+        transaction.set_rollback(True)
+
+    key = "erp_app:throttle:bench"
+    log(f"take_token: {timed(lambda: throttling.take_token(key, 10 ** 9, 1.0), repeat) * 1000:.0f}us per request")
+
+
+# `size` threads reading one cached aggregate that takes 100ms to compute, three ways:
+# - hard expiry: the key is gone and every thread asks for it at once
+# - stale expiry: the key is past its timeout, within its stale window
+# - steady load: a 2s timeout for 4 * repeat seconds, every thread reading back to back
+# single_flight against the plain get / compute / set, counting the computations and the
+# reads that waited for one; under steady load single_flight refreshes early, so it computes
+# a bit more often than the key expires but no read but the refreshing one waits
+def bench_stampede(size=64, repeat=5, log=print) -> None:
+    compute_seconds = 0.1
+    computes = Counter()
+
+    def compute(name):
+        def run():
+            computes[name] += 1
+            time.sleep(compute_seconds)
+            return Decimal("1234.50")
+        return run
+
+    def plain(key, fn, timeout):
+        value = cache.get(key)
+        if value is None:
+            value = fn()
+            cache.set(key, value, timeout)
+        return value
+
+    helpers = {"get / compute / set": plain, "single_flight": caching.single_flight}
+
+    # runs read() in `size` threads released at once, returns the latencies in ms
+    def stampede(read):
+        barrier = threading.Barrier(size)
+        latencies = []
+
+        def client():
+            barrier.wait()
+            started = time.perf_counter()
+            read()
+            latencies.append((time.perf_counter() - started) * 1000)
+
+        threads = [threading.Thread(target=client) for _ in range(size)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return latencies
+
+    log(f"{size} threads, {compute_seconds * 1000:.0f}ms per computation")
+    log(f"{'scenario':<16}{'helper':<22}{'expiries':>9}{'computes':>10}{'waited':>8}{'p50':>10}{'max':>10}")
+
+    def row(scenario, name, expiries, computed, latencies):
+        waited = sum(1 for latency in latencies if latency > compute_seconds * 500)
+        log(f"{scenario:<16}{name:<22}{expiries:>9}{computed:>10}{waited:>8}"
+            f"{statistics.median(latencies):>8.1f}ms{max(latencies):>8.1f}ms")
+
+    for name, helper in helpers.items():
+        key = f"erp_app:bench:stampede:{uuid4().hex}"
+        latencies = []
+        for _ in range(repeat):
+            cache.delete(key)
+            latencies += stampede(lambda: helper(key, compute(("hard", name)), 60))
+        row("hard expiry", name, repeat, computes["hard", name], latencies)
+
+    key = f"erp_app:bench:stampede:{uuid4().hex}"
+    latencies = []
+    for _ in range(repeat):
+        cache.set(key, {"value": Decimal("1234.50"), "delta": compute_seconds, "expires_at": time.time() - 1}, 60)
+        latencies += stampede(lambda: caching.single_flight(key, compute("stale"), 60))
+    row("stale expiry", "single_flight", repeat, computes["stale"], latencies)
+
+    duration, timeout = 4 * repeat, 2
+    for name, helper in helpers.items():
+        key = f"erp_app:bench:stampede:{uuid4().hex}"
+        deadline = time.perf_counter() + duration
+        latencies = []
+
+        def steady():
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                helper(key, compute(("steady", name)), timeout)
+                latencies.append((time.perf_counter() - started) * 1000)
+                time.sleep(0.001)
+
+        threads = [threading.Thread(target=steady) for _ in range(size)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        row("steady load", name, duration // timeout, computes["steady", name], latencies)
+
+
+# the home view dashboard over `size` tenants in 100-unit buildings, ten per lease manager:
+# the computation of the figures, then 50 * repeat requests served from the cache, then
+# requests with a tenant saved before every tenth one for a little longer than
+# DASHBOARD_MIN_AGE, so the changes are recomputed once by a request
+def bench_dashboard(size=100_000, repeat=5, log=print) -> None:
+    client = Client(REMOTE_ADDR="10.0.0.1")
+
+    def latencies(requests=None, seconds=None, change_every=None):
+        timings = []
+        deadline = time.perf_counter() + (seconds or 0)
+        while len(timings) < (requests or 0) or time.perf_counter() < deadline:
+            if change_every and len(timings) % change_every == 0:
+                Tenant.objects.filter(name__startswith="Bench Tenant").first().save()
+            started = time.perf_counter()
+            client.get("/")
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings
+
+    with transaction.atomic():
+        log(f"seeding {size} tenants...")
+        for building in range(size // Property.MAXIMUM_UNITS):
+            property = seed_building(f"{building:03d} Bench Street", Property.MAXIMUM_UNITS)
+            if building % 10 == 0:
+                manager = LeaseManager.objects.create(name=f"Bench Manager {building // 10}")
+            manager.add_property(property)
+
+        cache.delete(dashboard.DASHBOARD_KEY)
+        started = time.perf_counter()
+        with CaptureQueriesContext(connection) as captured:
+            dashboard.get_dashboard()
+        log(f"computation: {(time.perf_counter() - started) * 1000:.1f}ms, {len(captured)} queries")
+
+        log(f"{'requests':<28}{'requests':>10}{'computed':>10}{'p50':>10}{'p95':>10}{'max':>10}")
+        for name, run in (
+            ("cached", lambda: latencies(requests=50 * repeat)),
+            ("a change every 10 requests", lambda: latencies(
+                seconds=dashboard.DASHBOARD_MIN_AGE + repeat, change_every=10,
+            )),
+        ):
+            computed_at = cache.get(dashboard.DASHBOARD_KEY)["computed_at"]
+            timings = run()
+            computed = int(cache.get(dashboard.DASHBOARD_KEY)["computed_at"] != computed_at)
+            p95 = statistics.quantiles(timings, n=20)[-1]
+            log(f"{name:<28}{len(timings):>10}{computed:>10}{statistics.median(timings):>8.1f}ms"
+                f"{p95:>8.1f}ms{max(timings):>8.1f}ms")
+
+        transaction.set_rollback(True)
+    cache.delete(dashboard.DASHBOARD_KEY)
+
+
+# name: (function, default size)
+BENCHMARKS = {
+    "interval": (bench_interval, 1_000_000),
+    "serialization": (bench_serialization, 100_000),
+    "teardown": (bench_teardown, 100),
+    "reminders": (bench_reminders, 100_000),
+    "rollover": (bench_rollover, 100_000),
+    "throttling": (bench_throttling, 20_000),
+    "stampede": (bench_stampede, 64),
+    "dashboard": (bench_dashboard, 100_000),
+}
@@ -49,12 +49,16 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # brotli/gzip compression of the /api/ responses, must run before the toolbar
+    "erp_app.middleware.APICompressionMiddleware",
     "debug_toolbar.middleware.DebugToolbarMiddleware",
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # buffers the audit events of every request
+    "erp_app.middleware.AuditMiddleware",
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -66,10 +70,19 @@ CACHES = {
         'LOCATION': 'redis://127.0.0.1:6379/1',  # Adjust the URL as needed
         'OPTIONS': {
             'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            # fail fast when Redis is down, the API throttling falls back to per process buckets
+            'SOCKET_CONNECT_TIMEOUT': 1,
+            'SOCKET_TIMEOUT': 1,
         }
     }
 }
 
+# token bucket throttling of the list APIs, see erp_app.throttling
+# a client may send API_THROTTLE_BURST requests at once, then API_THROTTLE_RATE
+# (None turns the throttling off)
+API_THROTTLE_RATE = '120/min'
+API_THROTTLE_BURST = 30
+
 ROOT_URLCONF = 'erp.urls'
 
 TEMPLATES = [
@@ -101,6 +114,12 @@ DATABASES = {
     }
 }
 
+# databases holding the lease manager portfolios, see erp_app.shards
+# erp/settings_sharded.py spreads them over several local SQLite files
+SHARD_DATABASES = ['default']
+
+DATABASE_ROUTERS = ['erp_app.shards.ShardRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -156,3 +175,11 @@ STATICFILES_FINDERS = (
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# lease and payment reminders (python manage.py send_reminders)
+# written to files in development, configure an SMTP backend in production
+EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
+EMAIL_FILE_PATH = BASE_DIR / 'sent_emails'
+DEFAULT_FROM_EMAIL = 'reminders@erp.local'
+# reminders of tenants without an email address go to this mailbox
+REMINDER_DEFAULT_RECIPIENT = 'front-desk@erp.local'
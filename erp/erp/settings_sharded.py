@@ -0,0 +1,18 @@
+# the portfolios spread over four local SQLite files, the default one included
+# (the default database also holds the shard map, the audit log, auth and sessions)
+#
+#   DJANGO_SETTINGS_MODULE=erp.settings_sharded python manage.py migrate_shards
+#   DJANGO_SETTINGS_MODULE=erp.settings_sharded python manage.py runserver
+
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, DATABASES
+
+SHARD_COUNT = 4
+
+for index in range(1, SHARD_COUNT):
+    DATABASES[f'shard_{index}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / f'shard_{index}.sqlite3',
+    }
+
+SHARD_DATABASES = ['default', *(f'shard_{index}' for index in range(1, SHARD_COUNT))]
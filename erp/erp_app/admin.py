@@ -1,10 +1,27 @@
-from django.contrib import admin
-from .models import Property, Tenant, UnitRoom, LeaseManager
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.db.models import Prefetch
+from .models import Property, Tenant, UnitRoom, LeaseManager, Invoice, Payment, AuditEvent, ArchivedTenant
 
 
 class UnitRoomInline(admin.TabularInline):
     model = UnitRoom
     extra = 1  # Number of empty forms to show by default
+    fields = ("unit_number", "tenant")
+    # a plain id input instead of a <select> of every tenant on every room row
+    raw_id_fields = ("tenant",)
+
+
+# extra input shown next to the admin action dropdown
+# used by the reassign_lease_manager action
+class PropertyActionForm(ActionForm):
+    lease_manager = forms.ModelChoiceField(
+        queryset=LeaseManager.objects.all().order_by("name"),
+        required=False,
+        label="Lease manager",
+    )
+
 
 class PropertyAdmin(admin.ModelAdmin):
     list_display = (
@@ -15,28 +32,84 @@ class PropertyAdmin(admin.ModelAdmin):
         "display_total_rent",
         "display_occupancy_rate",
     )
+    action_form = PropertyActionForm
+    actions = ("reassign_lease_manager", "release_all_units", "recount_current_units")
+
+    # the changelist columns are computed in the changelist query itself:
+    # tenant count, total rent and occupancy are annotations and the tenant
+    # names come from a single prefetch, so no query runs per row
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        return queryset.with_stats().prefetch_related(
+            Prefetch("tenants", queryset=Tenant.objects.only("id", "name").order_by("name"))
+        )
 
     """
     params: obj - the model that will be using
     """
-    
+
     def display_tenants(self, obj):
         return ', '.join(tenant.name for tenant in obj.tenants.all())
     display_tenants.short_description = 'Tenants'
-    
+    display_tenants.admin_order_field = "tenant_count"
+
     def display_total_rent(self, obj):
-        return obj.calculate_total_rent()
+        return obj.total_rent
     display_total_rent.short_description = "Total Rent"
-    
+    display_total_rent.admin_order_field = "total_rent"
+
     def display_occupancy_rate(self, obj):
-        return str(obj.calculate_occupancy_rate()) + "%"
+        return str(round(obj.occupancy_rate, 2)) + "%"
     display_occupancy_rate.short_description = "Occupancy Rate"
-    
+    display_occupancy_rate.admin_order_field = "occupancy_rate"
+
+    # bulk actions, each one is a handful of set-based queries
+    # the action queryset is re-filtered by id to drop the changelist annotations
+
+    def reassign_lease_manager(self, request, queryset):
+        lease_manager = LeaseManager.objects.filter(id=request.POST.get("lease_manager") or None).first()
+        if lease_manager is None:
+            self.message_user(request, "Select a lease manager first.", messages.ERROR)
+            return
+        count = Property.objects.filter(id__in=queryset.values("id")).assign_lease_manager(lease_manager)
+        self.message_user(request, f"{count} properties assigned to {lease_manager}.", messages.SUCCESS)
+    reassign_lease_manager.short_description = "Reassign to the selected lease manager"
+
+    def release_all_units(self, request, queryset):
+        count = Property.objects.filter(id__in=queryset.values("id")).release_units()
+        self.message_user(request, f"{count} tenants released.", messages.SUCCESS)
+    release_all_units.short_description = "Release all units"
+
+    def recount_current_units(self, request, queryset):
+        count = Property.objects.filter(id__in=queryset.values("id")).recount_current_units()
+        self.message_user(request, f"Current units recounted for {count} properties.", messages.SUCCESS)
+    recount_current_units.short_description = "Recount current units"
+
 
     inlines = [UnitRoomInline]
 
+# the audit trail is append-only, the admin can only read it
+class AuditEventAdmin(admin.ModelAdmin):
+    list_display = ("created_at", "action", "object_type", "object_repr", "property_id", "actor")
+    list_filter = ("action", "object_type")
+    date_hierarchy = "created_at"
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
 admin.site.register(UnitRoom)
 admin.site.register(Tenant)
 admin.site.register(LeaseManager)
+admin.site.register(Invoice)
+admin.site.register(Payment)
+admin.site.register(ArchivedTenant)
+admin.site.register(AuditEvent, AuditEventAdmin)
 # register the Property model to the PropertyAdmin as obj
-admin.site.register(Property, PropertyAdmin)
\ No newline at end of file
+admin.site.register(Property, PropertyAdmin)
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ErpAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'erp_app'
+
+    def ready(self):
+        # register the signal handlers
+        from . import signals  # noqa: F401
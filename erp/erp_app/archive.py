@@ -0,0 +1,93 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from . import caching, dashboard, search
+from .models import ArchivedTenant, Invoice, LeaseManager, Property, ReminderLog, Tenant, UnitRoom
+
+# a lease is archived this long after it ended
+ARCHIVE_AFTER_DAYS = 365
+
+# tenants moved per chunk, every chunk is one transaction
+ARCHIVE_BATCH_SIZE = 2000
+
+# the Tenant columns copied to the archive
+ARCHIVED_FIELDS = ["id", "name", "lease_start", "lease_end", "next_payment_due", "monthly_rent", "unit", "email"]
+
+
+# expired tenants that can leave the live table: the lease ended before `before`,
+# no unit room is rented to them and they have no invoices (the ledger keeps
+# pointing at the live row)
+def archivable_tenants(before, database="default"):
+    return Tenant.objects.using(database).filter(lease_end__lt=before).exclude(
+        Exists(UnitRoom.objects.filter(tenant=OuterRef("pk"))),
+    ).exclude(
+        Exists(Invoice.objects.filter(tenant=OuterRef("pk"))),
+    )
+
+
+# copies a chunk of tenants and their property links to the archive, then removes
+# them from the live tables, all in one transaction. the chunk is checked again
+# inside the transaction, a tenant who got a room or an invoice meanwhile stays
+# the live rows are deleted with plain DELETEs instead of Tenant.delete(), which
+# would send the per-tenant signals; the search documents, the updated_at of the
+# linked properties and the cached figures are handled in bulk instead
+def archive_chunk(tenant_ids, before, archived_at=None, database="default") -> int:
+    archived_at = archived_at or timezone.now()
+
+    with transaction.atomic(using=database):
+        tenant_ids = list(archivable_tenants(before, database).filter(id__in=tenant_ids).values_list("id", flat=True))
+        links = Property.tenants.through.objects.using(database).filter(tenant_id__in=tenant_ids)
+        tenants = Tenant.objects.using(database).filter(id__in=tenant_ids)
+
+        archived = ArchivedTenant.objects.using(database).bulk_create(
+            [ArchivedTenant(**row, archived_at=archived_at) for row in tenants.values(*ARCHIVED_FIELDS)],
+            ignore_conflicts=True,
+        )
+        ArchivedTenant.properties.through.objects.using(database).bulk_create(
+            [
+                ArchivedTenant.properties.through(archivedtenant_id=tenant_id, property_id=property_id)
+                for tenant_id, property_id in links.values_list("tenant_id", "property_id")
+            ],
+            ignore_conflicts=True,
+        )
+        search.index_queryset(ArchivedTenant.objects.using(database).filter(id__in=tenant_ids))
+
+        property_ids = list(links.values_list("property_id", flat=True).distinct())
+        Property.objects.using(database).filter(id__in=property_ids).update(updated_at=archived_at)
+        links._raw_delete(links.db)
+        reminders = ReminderLog.objects.using(database).filter(tenant_id__in=tenant_ids)
+        reminders._raw_delete(reminders.db)
+        search.unindex_queryset(tenants)
+        tenants._raw_delete(tenants.db)
+
+    # the tenant counts of the dashboard and of the stats of the managers of the properties
+    managers = LeaseManager.objects.using(database).filter(properties__in=property_ids)
+    for manager_id in managers.values_list("id", flat=True).distinct():
+        caching.expire(caching.manager_stats_key(manager_id, database))
+    dashboard.mark_changed()
+    return len(archived)
+
+
+# moves every tenant whose lease ended more than `days` ago to the archive
+# the candidates are read by keyset pagination on the id, chunk by chunk
+# returns the number of archived tenants and chunks
+# archives the tenants of one shard database, the command runs it on every shard
+def archive_tenants(days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH_SIZE, dry_run=False, log=None,
+                    database="default") -> dict:
+    before = timezone.now() - timedelta(days=days)
+    candidates = archivable_tenants(before, database).order_by("id")
+    archived = chunks = 0
+    last_id = 0
+    while True:
+        tenant_ids = list(candidates.filter(id__gt=last_id).values_list("id", flat=True)[:batch_size])
+        if not tenant_ids:
+            break
+        last_id = tenant_ids[-1]
+        chunks += 1
+        archived += len(tenant_ids) if dry_run else archive_chunk(tenant_ids, before, database=database)
+        if log:
+            log(f"chunk {chunks}: archived up to tenant {last_id}")
+    return {"archived": archived, "chunks": chunks}
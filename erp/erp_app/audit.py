@@ -0,0 +1,84 @@
+import contextvars
+from contextlib import contextmanager
+from functools import partial
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import AuditEvent, Property
+
+# events written per bulk_create, a bigger buffer is flushed early
+AUDIT_BUFFER_SIZE = 500
+
+# recording an event never touches the database:
+# - the event is handed to transaction.on_commit of the database holding obj, so it only
+#   exists once the change is committed (right away in autocommit) and is dropped if the
+#   change rolls back. the events themselves always go to the default database
+# - committed events collect in the buffer of the current request (AuditMiddleware)
+#   or worker (buffered()), which writes them with one bulk_create when it closes
+# - without a buffer the committed event is written on its own
+
+
+class AuditBuffer:
+    def __init__(self, actor=""):
+        self.actor = actor
+        self.events = []
+        self.closed = False
+
+    def append(self, event) -> None:
+        # a transaction that commits after the buffer was flushed writes directly
+        if self.closed:
+            write([event])
+            return
+        self.events.append(event)
+        if len(self.events) >= AUDIT_BUFFER_SIZE:
+            self.flush()
+
+    def flush(self) -> None:
+        events, self.events = self.events, []
+        write(events)
+
+
+_current_buffer = contextvars.ContextVar("audit_buffer", default=None)
+
+
+def write(events) -> None:
+    if events:
+        AuditEvent.objects.bulk_create(events, batch_size=AUDIT_BUFFER_SIZE)
+
+
+# buffers the events recorded inside the block and writes them when it exits
+# e.g. with audit.buffered(actor="run_billing"): ...
+@contextmanager
+def buffered(actor=""):
+    buffer = AuditBuffer(actor)
+    token = _current_buffer.set(buffer)
+    try:
+        yield buffer
+    finally:
+        _current_buffer.reset(token)
+        buffer.closed = True
+        buffer.flush()
+
+
+# records that `action` happened to obj (a Tenant, Property or UnitRoom)
+# property: the Property (or its id) involved, data: JSON details of the change
+def record(action, obj, property=None, **data) -> None:
+    buffer = _current_buffer.get()
+    if isinstance(obj, Property) and property is None:
+        property = obj
+
+    event = AuditEvent(
+        action=action,
+        object_type=obj._meta.model_name,
+        object_id=obj.pk,
+        object_repr=str(obj)[:200],
+        property_id=getattr(property, "pk", property),
+        actor=buffer.actor if buffer else "",
+        data=data,
+        created_at=timezone.now(),
+    )
+    transaction.on_commit(
+        partial(buffer.append, event) if buffer else partial(write, [event]),
+        using=obj._state.db or "default",
+    )
@@ -0,0 +1,187 @@
+import calendar
+from collections import defaultdict
+from datetime import date, datetime, time
+
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Invoice, Payment, Tenant
+
+# tenants billed per bulk_create / transaction
+BILLING_BATCH_SIZE = 2000
+
+# tenants read per rollover chunk
+ROLLOVER_BATCH_SIZE = 5000
+
+
+# adds calendar months to a date or datetime, clamping the day to the end of the month
+# e.g. Jan 31 + 1 month -> Feb 28 (or 29)
+def add_months(value, months: int):
+    month_index = value.month - 1 + months
+    year = value.year + month_index // 12
+    month = month_index % 12 + 1
+    day = min(value.day, calendar.monthrange(year, month)[1])
+    return value.replace(year=year, month=month, day=day)
+
+
+# aware datetimes of the first instant of the period and of the next month
+def month_bounds(period: date) -> tuple[datetime, datetime]:
+    start = timezone.make_aware(datetime.combine(period.replace(day=1), time.min))
+    return start, add_months(start, 1)
+
+
+# the invoice is due on the lease start's day of the month, clamped to the month length
+def due_date_for(lease_start: datetime, period: date) -> datetime:
+    start, _ = month_bounds(period)
+    day = min(lease_start.day, calendar.monthrange(start.year, start.month)[1])
+    return start.replace(day=day)
+
+
+# tenants with a lease covering at least part of the period
+def active_tenants(period: date, database="default"):
+    start, end = month_bounds(period)
+    return Tenant.objects.using(database).filter(lease_start__lt=end, lease_end__gte=start)
+
+
+# generates the invoices of a month for every active tenant
+# - tenants are read by keyset pagination (id > last id) in chunks of batch_size
+# - every chunk is one bulk_create in its own transaction
+# - tenants who already have an invoice for the period are left out of the scan, so an
+#   interrupted run (or one after invoices written elsewhere) bills exactly the missing
+#   tenants when re-run; the (tenant, period) unique constraint skips concurrent duplicates
+# - next_payment_due is advanced for every billed tenant with one UPDATE at the end
+# - bills the tenants of one shard database, the command runs it on every shard
+def run_billing(period: date, batch_size=BILLING_BATCH_SIZE, log=None, database="default") -> dict:
+    period = period.replace(day=1)
+    existing = Invoice.objects.using(database).filter(period=period)
+    before = existing.count()
+
+    billed = Invoice.objects.filter(tenant=OuterRef("pk"), period=period)
+    tenants = active_tenants(period, database).exclude(Exists(billed)).order_by("id")
+    last_id = 0
+    batches = 0
+    while True:
+        rows = list(
+            tenants.filter(id__gt=last_id).values_list("id", "monthly_rent", "lease_start")[:batch_size]
+        )
+        if not rows:
+            break
+        with transaction.atomic(using=database):
+            Invoice.objects.using(database).bulk_create(
+                [
+                    Invoice(
+                        tenant_id=tenant_id,
+                        period=period,
+                        amount=monthly_rent,
+                        due_date=due_date_for(lease_start, period),
+                    )
+                    for tenant_id, monthly_rent, lease_start in rows
+                ],
+                batch_size=batch_size,
+                ignore_conflicts=True,
+            )
+        last_id = rows[-1][0]
+        batches += 1
+        if log:
+            log(f"batch {batches}: billed up to tenant {last_id}")
+
+    # the next payment due is the oldest invoice still open
+    oldest_open = Invoice.objects.filter(
+        tenant=OuterRef("pk"),
+        status=Invoice.OPEN,
+    ).order_by("due_date").values("due_date")[:1]
+    advanced = Tenant.objects.using(database).filter(
+        id__in=existing.values("tenant_id"),
+    ).update(
+        next_payment_due=Coalesce(Subquery(oldest_open), F("next_payment_due")),
+        updated_at=timezone.now(),
+    )
+
+    return {
+        "period": period,
+        "created": existing.count() - before,
+        "batches": batches,
+        "advanced": advanced,
+    }
+
+
+# the due date after `due` on the lease start's day of the month, at midnight like the invoices
+def next_due_date(lease_start: datetime, due: datetime) -> datetime:
+    return due_date_for(lease_start, add_months(due.date().replace(day=1), 1))
+
+
+# next_payment_due has three writers, all following one rule: it is the due date of the
+# oldest month not paid yet, never later than the lease end
+#   - run_billing, after issuing a month: the oldest open invoice
+#   - Invoice.record_payment, when an invoice is paid: the oldest open invoice, or the
+#     month after the latest invoice when everything is paid
+#   - rollover_due_dates, nightly: the first month after the paid ones, for the months
+#     that are not invoiced yet
+# the last writer wins; once a month is invoiced all three write the same date
+#
+# nightly rollover of next_payment_due: a passed due date moves to the next month once
+# the invoice of its month is paid, and keeps moving while the following invoices are
+# paid too. a due date that would pass the end of the lease stops at the lease end.
+# unpaid months stay overdue
+# - only tenants with payments recorded, a passed due date and a lease still running
+#   at that date are read, in keyset chunks of (next_payment_due, id) over its index
+# - every chunk reads the paid invoice periods of its tenants in one query and writes
+#   the new due dates with one UPDATE ... WHERE id IN (...) per distinct date, in one
+#   transaction. re-running is a no-op
+# - rolls over the tenants of one shard database, the command runs it on every shard
+def rollover_due_dates(now=None, batch_size=ROLLOVER_BATCH_SIZE, log=None, database="default") -> dict:
+    now = now or timezone.now()
+    started = timezone.now()
+    tenants = Tenant.objects.using(database).filter(
+        Exists(Payment.objects.filter(tenant=OuterRef("pk"))),
+        next_payment_due__lt=now,
+        # a rolled over due date may still be in the range, it is not read twice
+        updated_at__lt=started,
+    ).filter(
+        next_payment_due__lt=F("lease_end"),
+    ).order_by("next_payment_due", "id")
+
+    last = None
+    scanned = advanced = chunks = 0
+    while True:
+        chunk = tenants
+        if last is not None:
+            chunk = tenants.filter(
+                Q(next_payment_due__gt=last[0]) | Q(next_payment_due=last[0], id__gt=last[1])
+            )
+        rows = list(chunk.values_list("id", "lease_start", "lease_end", "next_payment_due")[:batch_size])
+        if not rows:
+            break
+        last = (rows[-1][3], rows[-1][0])
+        chunks += 1
+        scanned += len(rows)
+
+        paid = set(Invoice.objects.using(database).filter(
+            tenant_id__in=[row[0] for row in rows],
+            status=Invoice.PAID,
+            period__gte=min(row[3] for row in rows).date().replace(day=1),
+        ).values_list("tenant_id", "period"))
+
+        # tenants of a chunk have close due dates, so they share a few new ones
+        by_due = defaultdict(list)
+        for tenant_id, lease_start, lease_end, due in rows:
+            next_due = due
+            while next_due < lease_end and (tenant_id, next_due.date().replace(day=1)) in paid:
+                next_due = min(next_due_date(lease_start, next_due), lease_end)
+            if next_due != due:
+                by_due[next_due].append(tenant_id)
+
+        updated_at = timezone.now()
+        with transaction.atomic(using=database):
+            for next_due, tenant_ids in by_due.items():
+                Tenant.objects.using(database).filter(id__in=tenant_ids).update(
+                    next_payment_due=next_due, updated_at=updated_at,
+                )
+        rolled = sum(len(tenant_ids) for tenant_ids in by_due.values())
+        advanced += rolled
+        if log:
+            log(f"chunk {chunks}: {rolled} of {len(rows)} tenants rolled over")
+
+    return {"scanned": scanned, "advanced": advanced, "chunks": chunks}
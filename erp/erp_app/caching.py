@@ -0,0 +1,207 @@
+import logging
+import math
+import random
+import threading
+import time
+from concurrent.futures import Future
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# how long a rendered table row stays in the cache (a day)
+# rows are versioned by updated_at, so stale rows are never served, only evicted
+ROW_CACHE_TIMEOUT = 60 * 60 * 24
+
+# how long the figures of a lease manager's portfolio are fresh (five minutes)
+MANAGER_STATS_TIMEOUT = 60 * 5
+
+# the figures of a property are versioned by updated_at like the rows
+PROPERTY_STATS_TIMEOUT = 60 * 60 * 24
+
+# how long past its timeout a value is still served while a single request recomputes it
+STALE_TIMEOUT = 60 * 60
+
+# a recompute holds the lock of its key at most this long, then another process takes over
+LOCK_TIMEOUT = 30
+
+# how often a process waiting for another process's recompute looks for the value, in seconds
+LOCK_POLL_INTERVAL = 0.05
+
+# how long the stale mark of an expired key is kept, longer than the timeout of any expired key
+STALE_MARK_TIMEOUT = 60 * 60 * 24
+
+# probabilistic early refresh (XFetch): the higher, the earlier before its timeout a value is
+# recomputed, in proportion to how long it took to compute
+EARLY_REFRESH_BETA = 1.0
+
+# the recomputes running in this process, {key: Future}
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+
+# builds the cache key of a single rendered row
+# the key changes whenever the object is saved (updated_at), so there is no need
+# to delete keys on update, the old ones simply expire
+def row_cache_key(template_name, obj) -> str:
+    stamp = obj.updated_at.timestamp() if getattr(obj, "updated_at", None) else 0
+    # the total rent column depends on the current month
+    month = timezone.now().strftime("%Y%m")
+    return f"erp_app:row:{template_name}:{obj._meta.model_name}:{obj.pk}:{stamp}:{month}"
+
+
+# renders the given template once per object, serving every row it can from the cache
+# returns a list of (object, html) tuples in the same order as the objects
+# one get_many for the whole page, one set_many for the rows that were missing
+def render_cached_rows(objects, template_name, context_name) -> list[tuple]:
+    objects = list(objects)
+    keys = [row_cache_key(template_name, obj) for obj in objects]
+    cached = cache.get_many(keys)
+
+    missing = {}
+    rows = []
+    for key, obj in zip(keys, objects):
+        html = cached.get(key)
+        if html is None:
+            html = render_to_string(template_name, {context_name: obj})
+            missing[key] = html
+        rows.append((obj, html))
+
+    if missing:
+        cache.set_many(missing, ROW_CACHE_TIMEOUT)
+    return rows
+
+
+# the cached value of `key`, computed by compute() when it is missing, stale or picked
+# for an early refresh; at most one computation per key runs at a time:
+# - the threads of a process wait on the Future of the one computing the key
+# - processes take a lock in the cache (cache.add, SET NX in Redis), the others wait for the value
+# - while a stale value is recomputed (up to stale_timeout past its timeout), it is served
+#   to everyone else without waiting
+# - every request may refresh a fresh value early, the more likely the closer it is to its
+#   timeout and the longer it took to compute, so busy keys are mostly refreshed before they expire
+# - a value marked stale by expire() is refreshed like one past its timeout, the value and
+#   its mark are read with one get_many
+def single_flight(key, compute, timeout, stale_timeout=STALE_TIMEOUT, beta=EARLY_REFRESH_BETA):
+    mark_key = f"{key}:stale_after"
+    found = cache.get_many([key, mark_key])
+    entry = found.get(key)
+    if entry is not None and not _should_refresh(entry, found.get(mark_key), beta):
+        return entry["value"]
+
+    with _in_flight_lock:
+        future = _in_flight.get(key)
+        computing = future is None
+        if computing:
+            future = _in_flight[key] = Future()
+    if not computing:
+        if entry is not None:
+            return entry["value"]
+        return future.result(timeout=LOCK_TIMEOUT)
+
+    try:
+        value = _recompute(key, compute, entry, timeout, stale_timeout)
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    else:
+        future.set_result(value)
+        return value
+    finally:
+        with _in_flight_lock:
+            del _in_flight[key]
+
+
+# the expiry of an entry, moved earlier by a stale mark (changed_at, min_age) set after
+# its computation started
+def _expires_at(entry, mark) -> float:
+    if mark is None:
+        return entry["expires_at"]
+    changed_at, min_age = mark
+    if changed_at < entry.get("computed_at", 0):
+        return entry["expires_at"]
+    return min(entry["expires_at"], entry.get("computed_at", 0) + min_age)
+
+
+# XFetch: refresh once now - delta * beta * ln(rand) reaches the timeout, always when stale
+def _should_refresh(entry, mark, beta) -> bool:
+    return time.time() - entry["delta"] * beta * math.log(1.0 - random.random()) >= _expires_at(entry, mark)
+
+
+def _recompute(key, compute, entry, timeout, stale_timeout):
+    lock_key = f"{key}:lock"
+    token = uuid4().hex
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while not cache.add(lock_key, token, LOCK_TIMEOUT):
+        # another process is computing the key
+        if entry is not None:
+            return entry["value"]
+        if time.monotonic() > deadline:
+            # the lock outlived LOCK_TIMEOUT, its holder is gone
+            break
+        time.sleep(LOCK_POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None and entry["expires_at"] > time.time():
+            return entry["value"]
+
+    try:
+        # computed_at is when the computation started, a change marked while it runs
+        # makes the new value stale already
+        computed_at = time.time()
+        started = time.perf_counter()
+        value = compute()
+        cache.set(
+            key,
+            {
+                "value": value,
+                "delta": time.perf_counter() - started,
+                "computed_at": computed_at,
+                "expires_at": time.time() + timeout,
+            },
+            timeout + stale_timeout,
+        )
+        return value
+    finally:
+        if cache.get(lock_key) == token:
+            cache.delete(lock_key)
+
+
+# recomputes the value of a single_flight key now, e.g. from a scheduled command
+def refresh(key, compute, timeout, stale_timeout=STALE_TIMEOUT):
+    return _recompute(key, compute, None, timeout, stale_timeout)
+
+
+# marks the value of a single_flight key stale once it is min_age seconds old: it is still
+# served, but the next request after that recomputes it, so a burst of changes costs a
+# single recompute per min_age
+# the mark is a separate key written with a single set, the entry itself is never
+# rewritten, so a value computed meanwhile is not overwritten; a value whose computation
+# started after the mark ignores it
+# called from the save signals: a cache error is logged, never raised to the writer
+def expire(key, min_age=0) -> None:
+    try:
+        cache.set(f"{key}:stale_after", (time.time(), min_age), STALE_MARK_TIMEOUT)
+    except Exception:
+        logger.exception("Could not mark %s stale.", key)
+
+
+def manager_stats_key(manager_id, database="default") -> str:
+    month = timezone.now().strftime("%Y%m")
+    return f"erp_app:stats:manager:{database}:{manager_id}:{month}"
+
+
+# LeaseManager.portfolio_stats, recomputed at most every MANAGER_STATS_TIMEOUT
+def manager_stats(lease_manager) -> dict:
+    key = manager_stats_key(lease_manager.pk, lease_manager._state.db)
+    return single_flight(key, lease_manager.portfolio_stats, MANAGER_STATS_TIMEOUT)
+
+
+# Property.stats, versioned by updated_at (touched by every tenant change) like the rows
+def property_stats(property) -> dict:
+    stamp = property.updated_at.timestamp() if property.updated_at else 0
+    month = timezone.now().strftime("%Y%m")
+    key = f"erp_app:stats:property:{property._state.db}:{property.pk}:{stamp}:{month}"
+    return single_flight(key, property.stats, PROPERTY_STATS_TIMEOUT)
@@ -0,0 +1,174 @@
+from django.db import transaction
+from django.db.models import Count, Exists, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import search
+from .models import Property, Tenant, UnitRoom
+
+# rows (properties or tenants) compared per chunk
+CONSISTENCY_BATCH_SIZE = 5000
+
+# discrepancies kept per check in the report, the counts are always complete
+MAX_SAMPLES = 20
+
+# occupancy is stored four times: UnitRoom.tenant, the Property.tenants links,
+# Property.current_units and Tenant.unit. the occupied unit rooms are the source
+# of truth, every other copy is derived from them:
+#   current_units  - a property's current_units is its number of occupied rooms
+#   missing_links  - the tenant of a room must be linked to the room's property
+#   orphan_links   - tenants linked to a property without holding one of its rooms
+#   detached_rooms - a room without a property must not keep a tenant
+#   tenant_units   - a tenant's unit is the unit number of its room ("" if none)
+CHECKS = ("current_units", "missing_links", "orphan_links", "detached_rooms", "tenant_units")
+
+# checks reported but never repaired: a link without a room is legitimate, removing a
+# tenant from its room (tenant_unit_room_remove_view) keeps the tenant on the property
+REPORT_ONLY_CHECKS = ("orphan_links",)
+
+
+# id ranges of a model read by keyset pagination: (first id, last id) of every chunk
+def keyset_chunks(queryset, batch_size):
+    last_id = 0
+    while True:
+        ids = list(queryset.filter(id__gt=last_id).order_by("id").values_list("id", flat=True)[:batch_size])
+        if not ids:
+            return
+        yield ids[0], ids[-1]
+        last_id = ids[-1]
+
+
+def _occupied_rooms():
+    return UnitRoom.objects.filter(
+        property=OuterRef("pk"),
+        tenant__isnull=False,
+    ).values("property").annotate(total=Count("id")).values("total")
+
+
+def _expected_unit():
+    return Coalesce(
+        Subquery(UnitRoom.objects.filter(
+            tenant=OuterRef("pk"),
+            property__isnull=False,
+        ).order_by("unit_number").values("unit_number")[:1]),
+        Value(""),
+    )
+
+
+# every check of a chunk is a single query returning only the drifted rows
+
+def find_current_units(first, last, database="default"):
+    return Property.objects.using(database).filter(id__range=(first, last)).annotate(
+        occupied=Coalesce(Subquery(_occupied_rooms()), 0),
+    ).exclude(current_units=F("occupied")).values_list("id", "current_units", "occupied")
+
+
+def find_missing_links(first, last, database="default"):
+    linked = Property.tenants.through.objects.filter(
+        property_id=OuterRef("property_id"),
+        tenant_id=OuterRef("tenant_id"),
+    )
+    return UnitRoom.objects.using(database).filter(
+        property_id__gte=first,
+        property_id__lte=last,
+        tenant__isnull=False,
+    ).exclude(Exists(linked)).values_list("property_id", "tenant_id").distinct()
+
+
+def find_orphan_links(first, last, database="default"):
+    held = UnitRoom.objects.filter(
+        property_id=OuterRef("property_id"),
+        tenant_id=OuterRef("tenant_id"),
+    )
+    return Property.tenants.through.objects.using(database).filter(
+        property_id__gte=first,
+        property_id__lte=last,
+    ).exclude(Exists(held)).values_list("id", "property_id", "tenant_id")
+
+
+def find_detached_rooms(first, last, database="default"):
+    return UnitRoom.objects.using(database).filter(
+        tenant_id__gte=first,
+        tenant_id__lte=last,
+        property__isnull=True,
+    ).values_list("id", "tenant_id")
+
+
+def find_tenant_units(first, last, database="default"):
+    return Tenant.objects.using(database).filter(id__range=(first, last)).annotate(
+        expected_unit=_expected_unit(),
+    ).exclude(unit=F("expected_unit")).values_list("id", "unit", "expected_unit")
+
+
+# repairs of a chunk, bulk statements over the drifted rows only
+# (.update() and raw through-table writes skip auto_now and the signals,
+# so updated_at and the search index are maintained here)
+
+def repair_property_chunk(current_units, missing_links, database="default"):
+    through = Property.tenants.through
+    property_ids = {row[0] for row in current_units}
+    property_ids |= {property_id for property_id, _ in missing_links}
+    tenant_ids = {tenant_id for _, tenant_id in missing_links}
+
+    now = timezone.now()
+    with transaction.atomic(using=database):
+        through.objects.using(database).bulk_create(
+            [through(property_id=p, tenant_id=t) for p, t in missing_links],
+            ignore_conflicts=True,
+        )
+        Property.objects.using(database).filter(id__in=[row[0] for row in current_units]).recount_current_units()
+        Property.objects.using(database).filter(id__in=property_ids).update(updated_at=now)
+        Tenant.objects.using(database).filter(id__in=tenant_ids).update(updated_at=now)
+
+
+def repair_tenant_chunk(detached_rooms, tenant_units, database="default"):
+    now = timezone.now()
+    with transaction.atomic(using=database):
+        UnitRoom.objects.using(database).filter(id__in=[room_id for room_id, _ in detached_rooms]).update(tenant=None)
+        tenants = Tenant.objects.using(database).filter(id__in=[row[0] for row in tenant_units])
+        tenants.update(unit=_expected_unit(), updated_at=now)
+        search.index_queryset(tenants)
+        Property.objects.using(database).filter(tenants__in=tenants).update(updated_at=now)
+
+
+# compares the copies of the occupancy data chunk by chunk, properties first then tenants
+# with repair=True every drifted chunk is fixed in its own transaction before moving on
+# (the REPORT_ONLY_CHECKS are counted, not repaired)
+# returns {check: {"count": n, "samples": [...]}} and the number of chunks scanned
+# checks the rows of one shard database, the command runs it on every shard
+def check_occupancy(repair=False, batch_size=CONSISTENCY_BATCH_SIZE, log=None, database="default") -> dict:
+    report = {check: {"count": 0, "samples": []} for check in CHECKS}
+    chunks = 0
+
+    def collect(check, rows):
+        report[check]["count"] += len(rows)
+        samples = report[check]["samples"]
+        samples.extend(rows[:MAX_SAMPLES - len(samples)])
+
+    for first, last in keyset_chunks(Property.objects.using(database), batch_size):
+        current_units = list(find_current_units(first, last, database))
+        missing_links = list(find_missing_links(first, last, database))
+        orphan_links = list(find_orphan_links(first, last, database))
+        collect("current_units", current_units)
+        collect("missing_links", missing_links)
+        collect("orphan_links", orphan_links)
+        if repair and (current_units or missing_links):
+            repair_property_chunk(current_units, missing_links, database)
+        chunks += 1
+        if log:
+            log(f"properties {first}-{last}: {len(current_units)} counters, "
+                f"{len(missing_links)} missing links, {len(orphan_links)} links without a room")
+
+    for first, last in keyset_chunks(Tenant.objects.using(database), batch_size):
+        detached_rooms = list(find_detached_rooms(first, last, database))
+        tenant_units = list(find_tenant_units(first, last, database))
+        collect("detached_rooms", detached_rooms)
+        collect("tenant_units", tenant_units)
+        if repair and (detached_rooms or tenant_units):
+            repair_tenant_chunk(detached_rooms, tenant_units, database)
+        chunks += 1
+        if log:
+            log(f"tenants {first}-{last}: {len(detached_rooms)} detached rooms, "
+                f"{len(tenant_units)} unit strings")
+
+    return {"repaired": repair, "chunks": chunks, "checks": report}
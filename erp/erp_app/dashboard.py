@@ -0,0 +1,88 @@
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import caching, shards
+from .models import Property, Tenant
+
+# the figures of the home view dashboard, computed on every shard and served from the cache
+DASHBOARD_KEY = "erp_app:dashboard"
+
+# fresh for ten minutes; any change to a tenant, property, room or lease manager marks it
+# stale earlier (see signals), python manage.py refresh_dashboard from cron keeps it warm
+DASHBOARD_TIMEOUT = 60 * 10
+
+# changes mark the dashboard stale no sooner than this many seconds after its computation,
+# so a stream of changes costs one recompute (about 250ms at 100k tenants) per 30 seconds
+DASHBOARD_MIN_AGE = 30
+
+
+# the figures of one shard's whole portfolio, the properties without a lease manager included
+# three aggregate queries, no row is loaded
+def shard_totals(database) -> dict:
+    now = timezone.now()
+    this_month = now.replace(day=1)
+    links = Property.tenants.through.objects.using(database)
+
+    totals = Property.objects.using(database).aggregate(
+        property_count=Count("id"),
+        units=Coalesce(Sum("units"), 0),
+        occupied_units=Coalesce(Sum("current_units"), 0),
+    )
+    totals.update(Tenant.objects.using(database).filter(id__in=links.values("tenant_id")).aggregate(
+        tenant_count=Count("id"),
+        # the same tenants as LeaseManager.find_tenants_with_overdue_rent
+        overdue=Count("id", filter=Q(next_payment_due__lt=now)),
+        expiring=Count("id", filter=Q(
+            lease_end__gte=now,
+            lease_end__lt=now + timedelta(days=shards.EXPIRING_DAYS),
+        )),
+    ))
+    # the sum of Property.calculate_total_rent over every property
+    totals["total_rent"] = links.filter(
+        tenant__lease_end__gte=this_month,
+    ).exclude(
+        tenant__unit="",
+    ).aggregate(total=Sum("tenant__monthly_rent"))["total"] or Decimal(0)
+    return totals
+
+
+# the whole portfolio and every lease manager's share of it, over every shard
+def compute_dashboard() -> dict:
+    started = time.perf_counter()
+    results = shards.scatter(shard_totals)
+    totals = {
+        key: sum((result[key] for result in results.values()), Decimal(0) if key == "total_rent" else 0)
+        for key in shards.PORTFOLIO_FIGURES
+    }
+    totals["occupancy_rate"] = round(totals["occupied_units"] * 100 / totals["units"], 2) if totals["units"] else 0
+
+    managers = shards.portfolio_report()["managers"]
+    for row in managers:
+        row["occupancy_rate"] = round(row["occupied_units"] * 100 / row["units"], 2) if row["units"] else 0
+    return {
+        "totals": totals,
+        "managers": managers,
+        "expiring_days": shards.EXPIRING_DAYS,
+        "computed_at": timezone.now(),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+# the dashboard from the cache, recomputed by a single request once it is stale
+def get_dashboard() -> dict:
+    return caching.single_flight(DASHBOARD_KEY, compute_dashboard, DASHBOARD_TIMEOUT)
+
+
+def refresh_dashboard() -> dict:
+    return caching.refresh(DASHBOARD_KEY, compute_dashboard, DASHBOARD_TIMEOUT)
+
+
+# the dashboard is served until the next request recomputes it, DASHBOARD_MIN_AGE at the earliest
+# (a cache error is logged, a save never fails on it)
+def mark_changed() -> None:
+    caching.expire(DASHBOARD_KEY, min_age=DASHBOARD_MIN_AGE)
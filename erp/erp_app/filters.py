@@ -1,7 +1,22 @@
 import django_filters
-from erp_app.models import Tenant, Property
+from erp_app.models import Tenant, Property, UnitRoom, AuditEvent
+from erp_app import search
 
-class TenantFilter(django_filters.FilterSet):
+
+# full-text prefix search (?q=), shared by the list views and the REST APIs
+class SearchFilterSet(django_filters.FilterSet):
+    q = django_filters.CharFilter(method="filter_search", label="Search")
+
+    def filter_search(self, queryset, name, value):
+        return search.search(queryset, value)
+
+
+class TenantFilter(SearchFilterSet):
+    
+    # lease interval lookups, see TenantQuerySet.active_on / overlapping
+    active_on = django_filters.DateFilter(method="filter_active_on", label="Active on")
+    active_from = django_filters.DateFilter(method="filter_overlapping", label="Active from")
+    active_to = django_filters.DateFilter(method="filter_overlapping", label="Active to")
     
     ordering = django_filters.OrderingFilter(
         fields=(
@@ -23,7 +38,16 @@ class TenantFilter(django_filters.FilterSet):
         #     "unit": ["icontains"],
         # }
 
-class PropertyFilter(django_filters.FilterSet):
+    def filter_active_on(self, queryset, name, value):
+        return queryset.active_on(value)
+    
+    # applied one after the other, active_from and active_to give the full overlap window
+    def filter_overlapping(self, queryset, name, value):
+        if name == "active_from":
+            return queryset.overlapping(value, None)
+        return queryset.overlapping(None, value)
+
+class PropertyFilter(SearchFilterSet):
     
     ordering = django_filters.OrderingFilter(
         fields=(
@@ -43,4 +67,57 @@ class PropertyFilter(django_filters.FilterSet):
         #     "next_payment_due": ["lte", "gte"],
         #     "monthly_rent": ["lte", "gte"],
         #     "unit": ["icontains"],
-        # }
\ No newline at end of file
+        # }
+
+
+# vacancy search over unit rooms, the rent band is the average rent of the
+# current tenants of the room's property
+class VacantUnitFilter(django_filters.FilterSet):
+    manager = django_filters.NumberFilter(field_name="property__lease_manager", label="Lease manager")
+    property = django_filters.NumberFilter(field_name="property_id", label="Property")
+    property_type = django_filters.ChoiceFilter(
+        field_name="property__property_type",
+        choices=list(Property.PROPERTY_TYPE_CHOICES.items()),
+        label="Property type",
+    )
+    min_rent = django_filters.NumberFilter(method="filter_rent_band", label="Minimum rent")
+    max_rent = django_filters.NumberFilter(method="filter_rent_band", label="Maximum rent")
+
+    class Meta:
+        model = UnitRoom
+        fields = []
+
+    def filter_rent_band(self, queryset, name, value):
+        lookup = "average_rent__gte" if name == "min_rent" else "average_rent__lte"
+        properties = Property.objects.with_average_rent().filter(**{lookup: value})
+        return queryset.filter(property__in=properties.values("id"))
+
+
+# the same filters for the per-property vacancy counts
+class VacantPropertyFilter(django_filters.FilterSet):
+    manager = django_filters.NumberFilter(field_name="lease_manager", label="Lease manager")
+    property_type = django_filters.ChoiceFilter(
+        choices=list(Property.PROPERTY_TYPE_CHOICES.items()),
+        label="Property type",
+    )
+    min_rent = django_filters.NumberFilter(field_name="average_rent", lookup_expr="gte", label="Minimum rent")
+    max_rent = django_filters.NumberFilter(field_name="average_rent", lookup_expr="lte", label="Maximum rent")
+
+    class Meta:
+        model = Property
+        fields = []
+
+
+# audit trail lookups, by object (?object_type=tenant&object_id=1), by property
+# and by time range (?start=&end=), each one served by an AuditEvent index
+class AuditEventFilter(django_filters.FilterSet):
+    object_type = django_filters.CharFilter()
+    object_id = django_filters.NumberFilter()
+    property = django_filters.NumberFilter(field_name="property_id")
+    action = django_filters.ChoiceFilter(choices=list(AuditEvent.ACTION_CHOICES.items()))
+    start = django_filters.IsoDateTimeFilter(field_name="created_at", lookup_expr="gte")
+    end = django_filters.IsoDateTimeFilter(field_name="created_at", lookup_expr="lt")
+
+    class Meta:
+        model = AuditEvent
+        fields = []
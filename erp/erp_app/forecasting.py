@@ -0,0 +1,171 @@
+import numpy as np
+from django.db.models.functions import ExtractMonth, ExtractYear
+from django.utils import timezone
+
+from . import shards
+from .models import LeaseManager, Property
+
+# supported forecast horizons, in months
+MIN_FORECAST_MONTHS = 1
+MAX_FORECAST_MONTHS = 36
+
+# a renewed lease is assumed to run for another year
+DEFAULT_RENEWAL_TERM = 12
+
+
+# months are handled as a single integer: year * 12 + (month - 1)
+def month_index(value) -> int:
+    return value.year * 12 + value.month - 1
+
+
+def month_label(index: int) -> str:
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+# loads every (property, tenant) lease link of a database as columnar arrays in one query
+# the lease months are computed by the database, so no datetime is built in Python
+# one row per link: the lease managers are loaded apart (load_manager_links), joining
+# them here would repeat the links of a property with several managers
+# tenants without a unit room pay no rent, as in Property.calculate_total_rent
+# returns: property ids, start months, end months, rents
+def load_leases(lease_manager=None, properties=None, database="default") -> dict:
+    links = Property.tenants.through.objects.using(database).exclude(tenant__unit="")
+    if lease_manager is not None:
+        links = links.using(lease_manager._state.db).filter(property__lease_manager=lease_manager)
+    if properties is not None:
+        links = links.filter(property__in=properties)
+
+    rows = links.annotate(
+        start_month=ExtractYear("tenant__lease_start") * 12 + ExtractMonth("tenant__lease_start") - 1,
+        end_month=ExtractYear("tenant__lease_end") * 12 + ExtractMonth("tenant__lease_end") - 1,
+    ).values_list(
+        "property_id",
+        "start_month",
+        "end_month",
+        "tenant__monthly_rent",
+    )
+
+    columns = list(zip(*rows)) or [(), (), (), ()]
+    property_ids, start_months, end_months, rents = columns
+    return {
+        "property_ids": np.array(property_ids, dtype=np.int64),
+        "start_months": np.array(start_months, dtype=np.int64),
+        "end_months": np.array(end_months, dtype=np.int64),
+        "rents": np.array(rents, dtype=np.float64),
+    }
+
+
+# loads every (property, lease manager) link of a database as columnar arrays in one query
+# returns: property ids, manager ids
+def load_manager_links(lease_manager=None, properties=None, database="default") -> dict:
+    links = LeaseManager.properties.through.objects.using(database)
+    if lease_manager is not None:
+        links = links.using(lease_manager._state.db).filter(leasemanager=lease_manager)
+    if properties is not None:
+        links = links.filter(property__in=properties)
+
+    columns = list(zip(*links.values_list("property_id", "leasemanager_id"))) or [(), ()]
+    property_ids, manager_ids = columns
+    return {
+        "property_ids": np.array(property_ids, dtype=np.int64),
+        "manager_ids": np.array(manager_ids, dtype=np.int64),
+    }
+
+
+# the lease links and manager links of the forecast: from the shard of the lease manager
+# (or of the properties), or gathered from every shard for the whole portfolio
+def load_portfolio(lease_manager=None, properties=None) -> tuple[dict, dict]:
+    if lease_manager is not None or properties is not None:
+        database = lease_manager._state.db if lease_manager is not None else properties.db
+        return (
+            load_leases(lease_manager, properties, database),
+            load_manager_links(lease_manager, properties, database),
+        )
+
+    leases = shards.scatter(lambda database: load_leases(database=database))
+    links = shards.scatter(lambda database: load_manager_links(database=database))
+    return concatenate(list(leases.values())), concatenate(list(links.values()))
+
+
+# joins the columnar arrays of several shards
+def concatenate(parts) -> dict:
+    return {column: np.concatenate([part[column] for part in parts]) for column in parts[0]}
+
+
+# expected share of the rent collected by every lease for every forecast month
+# shape (leases, months): 1 while the lease runs, 0 before it starts and
+# renewal_probability ** n in the n-th renewal term after it ends
+def expected_weights(start_months, end_months, months, renewal_probability=0.0,
+                     renewal_term=DEFAULT_RENEWAL_TERM):
+    months = months[np.newaxis, :]
+    starts = start_months[:, np.newaxis]
+    ends = end_months[:, np.newaxis]
+
+    active = (starts <= months) & (months <= ends)
+    weights = active.astype(np.float64)
+
+    if renewal_probability > 0:
+        after_end = months > ends
+        renewals = np.ceil((months - ends) / renewal_term)
+        weights += np.power(renewal_probability, renewals, where=after_end, out=np.zeros_like(weights))
+
+    return weights
+
+
+# sums the (leases, months) revenue matrix per group id: one bincount per month
+def group_totals(group_ids, revenue):
+    groups, inverse = np.unique(group_ids, return_inverse=True)
+    totals = np.empty((len(groups), revenue.shape[1]), dtype=np.float64)
+    for column in range(revenue.shape[1]):
+        totals[:, column] = np.bincount(inverse, weights=revenue[:, column], minlength=len(groups))
+    return groups, totals
+
+
+# sums the per property totals (property_ids sorted, as returned by group_totals) per lease manager
+# a property with several lease managers counts in the total of each of them, so the
+# manager totals can add up to more than the portfolio total; -1 groups the unmanaged properties
+def manager_totals(property_ids, by_property, manager_links):
+    linked = np.isin(manager_links["property_ids"], property_ids)
+    link_property_ids = manager_links["property_ids"][linked]
+    unmanaged = ~np.isin(property_ids, link_property_ids)
+
+    group_ids = np.concatenate([manager_links["manager_ids"][linked], np.full(unmanaged.sum(), -1, dtype=np.int64)])
+    rows = np.concatenate([by_property[np.searchsorted(property_ids, link_property_ids)], by_property[unmanaged]])
+    return group_totals(group_ids, rows)
+
+
+# month-by-month expected revenue for the next `months` months
+# lease_manager / properties limit the forecast to part of the portfolio
+# renewal_probability: chance (0..1) that an ending lease renews for another renewal_term months
+def forecast_revenue(months=12, renewal_probability=0.0, renewal_term=DEFAULT_RENEWAL_TERM,
+                     lease_manager=None, properties=None, start=None) -> dict:
+    months = min(max(int(months), MIN_FORECAST_MONTHS), MAX_FORECAST_MONTHS)
+    renewal_probability = min(max(float(renewal_probability), 0.0), 1.0)
+    first_month = month_index(start or timezone.now())
+    forecast_months = np.arange(first_month, first_month + months, dtype=np.int64)
+
+    leases, manager_links = load_portfolio(lease_manager=lease_manager, properties=properties)
+    weights = expected_weights(
+        leases["start_months"],
+        leases["end_months"],
+        forecast_months,
+        renewal_probability=renewal_probability,
+        renewal_term=renewal_term,
+    )
+    revenue = weights * leases["rents"][:, np.newaxis]
+
+    property_ids, by_property = group_totals(leases["property_ids"], revenue)
+    manager_ids, by_manager = manager_totals(property_ids, by_property, manager_links)
+
+    return {
+        "months": [month_label(m) for m in forecast_months],
+        "renewal_probability": renewal_probability,
+        "total": np.round(revenue.sum(axis=0), 2).tolist(),
+        "by_property": {
+            int(pid): np.round(row, 2).tolist() for pid, row in zip(property_ids, by_property)
+        },
+        "by_manager": {
+            # -1 groups the properties without a lease manager
+            int(mid): np.round(row, 2).tolist() for mid, row in zip(manager_ids, by_manager)
+        },
+    }
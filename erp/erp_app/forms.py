@@ -1,6 +1,8 @@
 from django import forms
 from django.db.models import Q
+from . import shards
 from .models import Property, Tenant, UnitRoom, LeaseManager
+from .widgets import TypeaheadSelect, TypeaheadSelectMultiple
 
 FORM_STYLE = (
     "block w-full px-3 py-2 text-gray-900 placeholder-gray-400 "
@@ -51,12 +53,14 @@ class TenantForm(forms.ModelForm):
             "lease_start",
             "lease_end",
             "monthly_rent",
+            "email",
         ]
         labels = {
             "name": "Tenant Name",
             "lease_start": "Start Lease Date",
             "lease_end": "End Lease Date",
             "monthly_rent": "Monthly Rent",
+            "email": "Email (reminders)",
         }
         
         FORM_STYLE = "block w-full px-3 py-2 border border-gray-300 rounded-md shadow-sm focus:outline-none focus:ring-1 focus:ring-blue-500 sm:text-sm"
@@ -82,6 +86,10 @@ class TenantForm(forms.ModelForm):
                 "placeholder": "e.g 500",
                 "class": FORM_STYLE,
             }),
+            "email": forms.EmailInput(attrs={
+                "placeholder": "tenant@example.com",
+                "class": FORM_STYLE,
+            }),
         }
     
         
@@ -132,9 +140,10 @@ class UnitRoomForm(forms.ModelForm):
     
 
 class PropertyAddTenantForm(forms.ModelForm):
+    # options are fetched from the typeahead API, validation only loads the chosen pk
     tenant = forms.ModelChoiceField(
         queryset=Tenant.objects.all(),  # Get choices from the Tenant`` model
-        widget=forms.Select(attrs={
+        widget=TypeaheadSelect("tenant", attrs={
             "placeholder": "Tenant",
             "class": FORM_STYLE,
         }),
@@ -163,7 +172,7 @@ class PropertyAddTenantForm(forms.ModelForm):
     
     def clean_tenant(self):
         tenant = self.cleaned_data.get('tenant')
-        if tenant and Property.objects.filter(tenants=tenant).exists():
+        if tenant and Property.objects.using(tenant._state.db).filter(tenants=tenant).exists():
             raise forms.ValidationError("This tenant is already assigned to a property.")
         
         return tenant
@@ -174,10 +183,13 @@ class PropertyAddTenantForm(forms.ModelForm):
         
         if property_id:
             # Filter the queryset based on the property_id
-            self.fields['tenant'].queryset = Tenant.objects.filter(
+            # the choices are on the shard of the property
+            database = self.instance._state.db or "default"
+            self.fields['tenant'].queryset = Tenant.objects.using(database).filter(
                 properties__isnull=True
                 )
-            self.fields['unit'].queryset = UnitRoom.objects.filter(
+            self.fields['tenant'].widget.database = database
+            self.fields['unit'].queryset = UnitRoom.objects.using(database).filter(
                 property_id=property_id, 
                 tenant__isnull=True
                 )
@@ -209,8 +221,8 @@ class PropertyRemoveTenantForm(forms.ModelForm):
         
         if property_id:
             # Filter the queryset based on the property_id
-            self.fields['tenant'].queryset = Tenant.objects.filter(
-                properties=Property.objects.get(id=property_id)
+            self.fields['tenant'].queryset = Tenant.objects.using(self.instance._state.db or "default").filter(
+                properties__id=property_id
                 )
             
 
@@ -248,7 +260,7 @@ class PropertyAddUnitRoomForm(forms.ModelForm):
         
         if property_id:
             # Filter the queryset based on the property_id
-            self.fields['unit_room'].queryset = UnitRoom.objects.filter(property__isnull=True)
+            self.fields['unit_room'].queryset = UnitRoom.objects.using(self.instance._state.db or "default").filter(property__isnull=True)
     
     
 class PropertyRemoveUnitRoomForm(forms.ModelForm):
@@ -277,20 +289,21 @@ class PropertyRemoveUnitRoomForm(forms.ModelForm):
         
         if property_id:
             # Filter the queryset based on the property_id
-            self.fields['unit_room'].queryset = UnitRoom.objects.filter(property_id=property_id)
+            self.fields['unit_room'].queryset = UnitRoom.objects.using(self.instance._state.db or "default").filter(property_id=property_id)
     
 
 class LeaseManagerForm(forms.ModelForm):
+    # options are fetched from the typeahead API, validation only loads the chosen pks
     properties = forms.ModelMultipleChoiceField(
         queryset=Property.objects.none(),
-        widget=forms.SelectMultiple(attrs={
+        widget=TypeaheadSelectMultiple("property", attrs={
             "placholder": "Properties",
             "class": FORM_STYLE,
         }),
     )
     class Meta:
         model = LeaseManager
-        fields = ['name', 'properties']
+        fields = ['name', 'email', 'properties']
 
     def clean_properties(self):
         properties = self.cleaned_data.get('properties')
@@ -311,6 +324,17 @@ class LeaseManagerForm(forms.ModelForm):
         
         self.fields['properties'].queryset = Property.objects.filter(lease_manager__isnull=True)
 
+    # a new lease manager is placed on a shard with its properties, see shards.create_manager
+    def save(self, commit=True):
+        if not commit or self.instance.pk is not None:
+            return super().save(commit)
+        self.instance = shards.create_manager(
+            self.cleaned_data["name"],
+            email=self.cleaned_data["email"],
+            properties=self.cleaned_data["properties"],
+        )
+        return self.instance
+
 
 class GenerateLeaseExpiryReportForm(forms.ModelForm):
     properties = forms.ModelChoiceField(
@@ -349,9 +373,10 @@ class GenerateLeaseExpiryReportForm(forms.ModelForm):
 
 
 class AddPropertyToLeaseManagerForm(forms.ModelForm):
+    # options are fetched from the typeahead API, validation only loads the chosen pk
     properties = forms.ModelChoiceField(
         queryset=Property.objects.none(),  # Start with an empty queryset
-        widget=forms.Select(attrs={
+        widget=TypeaheadSelect("property", attrs={
             "placeholder": "Properties",
             "class": FORM_STYLE,  # Replace FORM_STYLE with actual class if needed
         }),
@@ -368,7 +393,9 @@ class AddPropertyToLeaseManagerForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
         if lease_manager:
             # Filter the properties queryset based on the related properties of the LeaseManager instance
-            self.fields['properties'].queryset = Property.objects.filter(lease_manager=None)
+            # the unassigned properties on the manager's shard
+            self.fields['properties'].queryset = Property.objects.using(lease_manager._state.db).filter(lease_manager=None)
+            self.fields['properties'].widget.database = lease_manager._state.db
             # print("hi")
             # print(self.fields['properties'].queryset)
             # lease_manager.properties.all()
@@ -394,4 +421,4 @@ class AddUnitRoomToTenantForm(forms.ModelForm):
 
         if property:
             for p in property:            
-                self.fields['unit_room'].queryset = UnitRoom.objects.filter(property=p)
\ No newline at end of file
+                self.fields['unit_room'].queryset = UnitRoom.objects.using(p._state.db).filter(property=p)
\ No newline at end of file
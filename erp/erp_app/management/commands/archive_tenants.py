@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from erp_app import shards
+from erp_app.archive import ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE, archive_tenants
+
+
+# moves the long expired, unassigned tenants and their property links to the archive tables
+# e.g. python manage.py archive_tenants --days 730
+class Command(BaseCommand):
+    help = "Move tenants whose lease ended long ago out of the live Tenant table."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=ARCHIVE_AFTER_DAYS,
+            help="Archive leases that ended more than this many days ago.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=ARCHIVE_BATCH_SIZE,
+            help="Tenants moved per transaction.",
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Only count the tenants to archive.")
+        parser.add_argument(
+            "--database",
+            choices=shards.shard_databases(),
+            help="Only archive the tenants on this shard (defaults to every shard).",
+        )
+
+    def handle(self, *args, **options):
+        if options["days"] < 0 or options["batch_size"] < 1:
+            raise CommandError("--days must not be negative and --batch-size must be positive.")
+
+        verb = "would be archived" if options["dry_run"] else "archived"
+        for database in [options["database"]] if options["database"] else shards.shard_databases():
+            result = archive_tenants(
+                days=options["days"],
+                batch_size=options["batch_size"],
+                dry_run=options["dry_run"],
+                log=self.stdout.write if options["verbosity"] > 1 else None,
+                database=database,
+            )
+            self.stdout.write(self.style.SUCCESS(
+                f"{database}: {result['archived']} tenants {verb} in {result['chunks']} chunks."
+            ))
@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from erp_app import shards
+from erp_app.consistency import CONSISTENCY_BATCH_SIZE, REPORT_ONLY_CHECKS, check_occupancy
+
+
+# compares current_units, the property/tenant links, the unit rooms and the tenant units
+# e.g. python manage.py check_occupancy --repair
+class Command(BaseCommand):
+    help = "Report (and optionally repair) drift between the copies of the occupancy data."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--repair",
+            action="store_true",
+            help="Fix every discrepancy from the unit rooms, in bulk updates (the orphan links are only reported).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=CONSISTENCY_BATCH_SIZE,
+            help="Properties or tenants compared per chunk.",
+        )
+        parser.add_argument(
+            "--database",
+            choices=shards.shard_databases(),
+            help="Only check the rows on this shard (defaults to every shard).",
+        )
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be a positive number.")
+
+        total = chunks = 0
+        for database in [options["database"]] if options["database"] else shards.shard_databases():
+            result = check_occupancy(
+                repair=options["repair"],
+                batch_size=options["batch_size"],
+                log=self.stdout.write if options["verbosity"] > 1 else None,
+                database=database,
+            )
+            chunks += result["chunks"]
+
+            self.stdout.write(f"{database}:")
+            for check, found in result["checks"].items():
+                if check in REPORT_ONLY_CHECKS:
+                    self.stdout.write(f"  {check} (report only): {found['count']}")
+                else:
+                    total += found["count"]
+                    self.stdout.write(f"  {check}: {found['count']}")
+                for sample in found["samples"]:
+                    self.stdout.write(f"      {sample}")
+
+        if not total:
+            self.stdout.write(self.style.SUCCESS(f"No drift found in {chunks} chunks."))
+        elif options["repair"]:
+            self.stdout.write(self.style.SUCCESS(f"{total} discrepancies repaired."))
+        else:
+            self.stdout.write(self.style.WARNING(
+                f"{total} discrepancies found, run with --repair to fix them."
+            ))
@@ -0,0 +1,53 @@
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from erp_app.models import Property, UnitRoom
+
+
+# onboards a building with all of its unit rooms in one transaction
+# e.g. python manage.py create_property "12 Main St" --pattern A-01..A-100
+#      python manage.py create_property "12 Main St" --rooms A-01 A-02 --units 10
+#      python manage.py create_property "12 Main St" --file rooms.json  (a JSON list of unit numbers)
+class Command(BaseCommand):
+    help = "Create a property and its unit rooms from a pattern, a list or a JSON file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("address")
+        parser.add_argument(
+            "--type",
+            choices=sorted(Property.PROPERTY_TYPE_CHOICES),
+            default=Property.PRIVATE,
+            help="Property type.",
+        )
+        parser.add_argument("--units", type=int, help="Number of units (defaults to the number of rooms).")
+        rooms = parser.add_mutually_exclusive_group(required=True)
+        rooms.add_argument("--pattern", help="Unit number range, e.g. A-01..A-100.")
+        rooms.add_argument("--rooms", nargs="+", help="Unit numbers.")
+        rooms.add_argument("--file", help="JSON file holding a list of unit numbers.")
+
+    def handle(self, *args, **options):
+        try:
+            if options["pattern"]:
+                unit_numbers = UnitRoom.expand_pattern(options["pattern"])
+            elif options["file"]:
+                with open(options["file"]) as file:
+                    unit_numbers = [str(number) for number in json.load(file)]
+            else:
+                unit_numbers = options["rooms"]
+
+            property = Property.objects.create_with_rooms(
+                address=options["address"],
+                unit_numbers=unit_numbers,
+                units=options["units"],
+                property_type=options["type"],
+            )
+        except ValidationError as e:
+            raise CommandError("; ".join(e.messages))
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Cannot read {options['file']}: {e}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{property} created with {len(unit_numbers)} unit rooms."
+        ))
@@ -0,0 +1,42 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from erp_app.snapshot import SNAPSHOT_BATCH_SIZE, SNAPSHOT_FORMATS, default_format, export_snapshot
+
+
+# dumps the portfolio as a zip of Parquet (or compressed CSV) tables
+# e.g. python manage.py export_snapshot --output portfolio.zip
+class Command(BaseCommand):
+    help = "Export tenants, properties, unit rooms, their links and manager assignments as columnar tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", required=True, help="Path of the zip archive.")
+        parser.add_argument(
+            "--format",
+            choices=SNAPSHOT_FORMATS,
+            help="Table format (defaults to parquet when pyarrow is installed, csv otherwise).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=SNAPSHOT_BATCH_SIZE,
+            help="Rows read per query.",
+        )
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be a positive number.")
+
+        fmt = options["format"] or default_format()
+        try:
+            counts = export_snapshot(options["output"], fmt=fmt, batch_size=options["batch_size"])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        for table, count in counts.items():
+            self.stdout.write(f"{table}: {count} rows")
+        self.stdout.write(self.style.SUCCESS(
+            f"{fmt} snapshot written to {options['output']} "
+            f"({os.path.getsize(options['output']) / 1024:.1f} KiB)."
+        ))
@@ -0,0 +1,77 @@
+import os
+import time
+from datetime import datetime, time as day_time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from erp_app.billing import add_months
+from erp_app import shards
+from erp_app.reports import REPORT_FORMATS, generate_reports
+
+
+# month end lease expiry, overdue and revenue reports of every lease manager, in parallel
+# e.g. python manage.py generate_reports --output reports/2024-10 --format json --workers 8
+class Command(BaseCommand):
+    help = "Write the lease expiry, overdue and revenue reports of every lease manager."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", required=True, help="Directory of the report files.")
+        parser.add_argument("--format", choices=REPORT_FORMATS, default="csv")
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Worker processes (defaults to the number of cores, 1 runs without a pool).",
+        )
+        parser.add_argument(
+            "--month",
+            help="Month of the lease expiry report as YYYY-MM (defaults to the current month).",
+        )
+        parser.add_argument(
+            "--managers",
+            type=int,
+            nargs="+",
+            help="Only report on these lease manager ids.",
+        )
+
+    def handle(self, *args, **options):
+        if options["month"]:
+            try:
+                start = datetime.strptime(options["month"], "%Y-%m")
+            except ValueError:
+                raise CommandError("--month must be formatted as YYYY-MM.")
+        else:
+            start = datetime.combine(timezone.localdate().replace(day=1), day_time.min)
+        # the last instant of the month, the expiry report range is inclusive
+        end = add_months(start, 1) - timedelta(microseconds=1)
+
+        if options["workers"] < 1:
+            raise CommandError("--workers must be a positive number.")
+
+        # the managers of every shard
+        manager_ids = [manager.id for manager in shards.all_managers()]
+        if options["managers"]:
+            manager_ids = [manager_id for manager_id in manager_ids if manager_id in options["managers"]]
+
+        started = time.perf_counter()
+        busy = 0
+        for done, result in enumerate(generate_reports(
+            manager_ids,
+            start,
+            end,
+            options["output"],
+            fmt=options["format"],
+            workers=options["workers"],
+        ), start=1):
+            busy += result["seconds"]
+            self.stdout.write(
+                f"[{done}/{len(manager_ids)}] {result['name']} (#{result['manager_id']}): "
+                f"{result['rows']} rows in {result['seconds']:.2f}s"
+            )
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(manager_ids)} managers reported to {options['output']} in {elapsed:.2f}s "
+            f"({busy:.2f}s of report time, {busy / elapsed if elapsed else 0:.1f}x parallelism)."
+        ))
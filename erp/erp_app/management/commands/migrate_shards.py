@@ -0,0 +1,19 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from erp_app import shards
+
+
+# migrates every shard database and gives each one its own id range
+# e.g. DJANGO_SETTINGS_MODULE=erp.settings_sharded python manage.py migrate_shards
+class Command(BaseCommand):
+    help = "Apply the migrations to every shard database and reserve their id ranges."
+
+    def handle(self, *args, **options):
+        for index, database in enumerate(shards.shard_databases()):
+            self.stdout.write(f"Migrating {database}...")
+            call_command("migrate", database=database, verbosity=max(options["verbosity"] - 1, 0))
+            tables = shards.reserve_id_range(database, index)
+            if tables:
+                self.stdout.write(f"  ids of {tables} tables start at {index * shards.SHARD_ID_RANGE + 1}")
+        self.stdout.write(self.style.SUCCESS("Every shard is migrated."))
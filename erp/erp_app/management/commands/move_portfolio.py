@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from erp_app import shards
+from erp_app.models import LeaseManager
+
+
+# moves a lease manager's portfolio to another shard database
+# e.g. python manage.py move_portfolio 12 shard_2
+class Command(BaseCommand):
+    help = "Move a lease manager with its properties, rooms and tenants to another shard."
+
+    def add_arguments(self, parser):
+        parser.add_argument("manager_id", type=int)
+        parser.add_argument("database", help="Target shard, one of settings.SHARD_DATABASES.")
+
+    def handle(self, *args, **options):
+        try:
+            counts = shards.move_portfolio(options["manager_id"], options["database"])
+        except LeaseManager.DoesNotExist:
+            raise CommandError(f"Lease manager {options['manager_id']} does not exist.")
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if not counts:
+            self.stdout.write(f"Lease manager {options['manager_id']} is already on {options['database']}.")
+            return
+        for table, count in counts.items():
+            self.stdout.write(f"{table}: {count}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Lease manager {options['manager_id']} moved to {options['database']}."
+        ))
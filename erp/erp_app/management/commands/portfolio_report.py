@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from erp_app.shards import portfolio_report
+
+
+# portfolio figures of every lease manager, gathered from every shard in parallel
+# e.g. python manage.py portfolio_report --sequential
+class Command(BaseCommand):
+    help = "Print the properties, units, occupancy, tenants and rent of every lease manager."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sequential",
+            action="store_true",
+            help="Query the shards one after the other instead of in parallel.",
+        )
+
+    def handle(self, *args, **options):
+        report = portfolio_report(parallel=not options["sequential"])
+
+        self.stdout.write(
+            f"{'id':>14} {'manager':<24}{'shard':<10}{'properties':>11}{'units':>8}"
+            f"{'occupied':>10}{'tenants':>9}{'rent':>14}"
+        )
+        for row in report["managers"]:
+            self.stdout.write(
+                f"{row['id']:>14} {row['name'][:23]:<24}{row['database']:<10}{row['property_count']:>11}"
+                f"{row['units']:>8}{row['occupied_units']:>10}{row['tenant_count']:>9}{row['total_rent']:>14}"
+            )
+        totals = report["totals"]
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(report['managers'])} managers on {len(report['databases'])} databases: "
+            f"{totals['property_count']} properties, {totals['occupancy_rate']}% occupied, "
+            f"{totals['tenant_count']} tenants, {totals['total_rent']} monthly rent "
+            f"({report['seconds']}s)"
+        ))
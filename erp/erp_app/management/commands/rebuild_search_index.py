@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from erp_app import search, shards
+from erp_app.models import ArchivedTenant, Property, Tenant, UnitRoom
+
+
+# rebuilds the full-text search index from scratch
+# saves and deletes keep the index in sync, this is only needed after bulk
+# queryset updates or raw SQL that bypassed the model signals
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index of tenants (live and archived), properties and unit rooms."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--database",
+            choices=shards.shard_databases(),
+            help="Only rebuild the index on this shard (defaults to every shard).",
+        )
+
+    def handle(self, *args, **options):
+        for database in [options["database"]] if options["database"] else shards.shard_databases():
+            if not search.fts_enabled(database):
+                self.stdout.write(f"Search index is only used on SQLite, nothing to do on {database}.")
+                continue
+            for model in (Tenant, ArchivedTenant, Property, UnitRoom):
+                search.rebuild_index(model, using=database)
+                self.stdout.write(f"Indexed {model.__name__} rows of {database}.")
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt."))
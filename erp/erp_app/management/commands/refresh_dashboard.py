@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from erp_app.dashboard import refresh_dashboard
+
+
+# recomputes the home view dashboard, meant to run from cron every few minutes
+# so the requests are always served from the cache
+# e.g. */5 * * * * python manage.py refresh_dashboard
+class Command(BaseCommand):
+    help = "Recompute the portfolio figures of the home view dashboard."
+
+    def handle(self, *args, **options):
+        result = refresh_dashboard()
+        totals = result["totals"]
+        self.stdout.write(self.style.SUCCESS(
+            f"Dashboard refreshed in {result['seconds']}s: {len(result['managers'])} managers, "
+            f"{totals['units']} units, {totals['occupancy_rate']}% occupied, {totals['total_rent']} monthly rent."
+        ))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from erp_app import shards
+from erp_app.billing import ROLLOVER_BATCH_SIZE, rollover_due_dates
+
+
+# moves the passed payment due dates whose invoices are paid to the next month,
+# meant to run from cron every night, e.g. python manage.py rollover_due_dates
+class Command(BaseCommand):
+    help = "Roll the paid, passed payment due dates over to the next calendar month."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=ROLLOVER_BATCH_SIZE,
+            help="Tenants rolled over per bulk update.",
+        )
+        parser.add_argument(
+            "--database",
+            choices=shards.shard_databases(),
+            help="Only roll over the due dates on this shard (defaults to every shard).",
+        )
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be a positive number.")
+
+        for database in [options["database"]] if options["database"] else shards.shard_databases():
+            result = rollover_due_dates(
+                batch_size=options["batch_size"],
+                log=self.stdout.write if options["verbosity"] > 1 else None,
+                database=database,
+            )
+            self.stdout.write(self.style.SUCCESS(
+                f"{database}: {result['advanced']} of {result['scanned']} due dates rolled over "
+                f"in {result['chunks']} chunks."
+            ))
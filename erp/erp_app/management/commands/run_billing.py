@@ -0,0 +1,53 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from erp_app import shards
+from erp_app.billing import BILLING_BATCH_SIZE, run_billing
+
+
+# generates the monthly rent invoices, e.g. python manage.py run_billing --month 2024-10
+class Command(BaseCommand):
+    help = "Generate the rent invoices of a month for every active tenant."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--month",
+            help="Billed month as YYYY-MM (defaults to the current month).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=BILLING_BATCH_SIZE,
+            help="Tenants billed per bulk insert.",
+        )
+        parser.add_argument(
+            "--database",
+            choices=shards.shard_databases(),
+            help="Only bill the tenants on this shard (defaults to every shard).",
+        )
+
+    def handle(self, *args, **options):
+        if options["month"]:
+            try:
+                period = datetime.strptime(options["month"], "%Y-%m").date()
+            except ValueError:
+                raise CommandError("--month must be formatted as YYYY-MM.")
+        else:
+            period = timezone.localdate().replace(day=1)
+
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be a positive number.")
+
+        for database in [options["database"]] if options["database"] else shards.shard_databases():
+            result = run_billing(
+                period,
+                batch_size=options["batch_size"],
+                log=self.stdout.write if options["verbosity"] > 1 else None,
+                database=database,
+            )
+            self.stdout.write(self.style.SUCCESS(
+                f"{database} {result['period']:%Y-%m}: {result['created']} invoices created in "
+                f"{result['batches']} batches, {result['advanced']} due dates advanced."
+            ))
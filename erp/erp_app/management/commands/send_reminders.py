@@ -0,0 +1,88 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from erp_app import shards
+from erp_app.reminders import (
+    LEASE_REMINDER_DAYS, PAYMENT_REMINDER_DAYS, REMINDER_BATCH_SIZE, REMINDER_CONCURRENCY,
+    EmailSink, WebhookSink, send_reminders,
+)
+
+
+# lease expiry and payment due reminders, meant to run from cron every night
+# every reminder is sent once per due date, failed deliveries are retried by the next run
+# e.g. python manage.py send_reminders --concurrency 50
+#      python manage.py send_reminders --sink webhook --webhook-url https://hooks.example.com/reminders
+class Command(BaseCommand):
+    help = "Send the lease expiry and payment due reminders."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sink", choices=("email", "webhook"), default="email")
+        parser.add_argument("--webhook-url", help="URL the webhook sink POSTs the reminders to.")
+        parser.add_argument(
+            "--email-backend",
+            help="Dotted path of the email backend (defaults to settings.EMAIL_BACKEND).",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=REMINDER_CONCURRENCY,
+            help="Deliveries running at the same time.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=REMINDER_BATCH_SIZE,
+            help="Reminders read and logged per chunk.",
+        )
+        parser.add_argument(
+            "--lease-days",
+            type=int,
+            default=LEASE_REMINDER_DAYS,
+            help="Remind of leases ending within this many days.",
+        )
+        parser.add_argument(
+            "--payment-days",
+            type=int,
+            default=PAYMENT_REMINDER_DAYS,
+            help="Remind of payments due within this many days.",
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Only count the due reminders.")
+        parser.add_argument(
+            "--database",
+            choices=shards.shard_databases(),
+            help="Only remind the tenants on this shard (defaults to every shard).",
+        )
+
+    def handle(self, *args, **options):
+        if options["concurrency"] < 1 or options["batch_size"] < 1:
+            raise CommandError("--concurrency and --batch-size must be positive numbers.")
+
+        if options["sink"] == "webhook":
+            if not options["webhook_url"]:
+                raise CommandError("The webhook sink requires --webhook-url.")
+            sink = WebhookSink(options["webhook_url"])
+        else:
+            sink = EmailSink(options["email_backend"])
+
+        failed = 0
+        for database in [options["database"]] if options["database"] else shards.shard_databases():
+            stats = send_reminders(
+                sink,
+                lease_days=options["lease_days"],
+                payment_days=options["payment_days"],
+                batch_size=options["batch_size"],
+                concurrency=options["concurrency"],
+                dry_run=options["dry_run"],
+                log=self.stdout.write if options["verbosity"] > 1 else None,
+                database=database,
+            )
+            for kind, counts in stats.items():
+                failed += counts["failed"]
+                if options["dry_run"]:
+                    self.stdout.write(f"{database} {kind}: {counts['due']} due")
+                else:
+                    self.stdout.write(f"{database} {kind}: {counts['sent']} sent, {counts['failed']} failed")
+
+        if failed:
+            self.stdout.write(self.style.WARNING(f"{failed} reminders failed, they are retried by the next run."))
+        else:
+            self.stdout.write(self.style.SUCCESS("Done."))
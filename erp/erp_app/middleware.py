@@ -0,0 +1,94 @@
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+
+# brotli is optional, API responses are only gzipped without it
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# responses smaller than this are not worth compressing
+MIN_COMPRESS_LENGTH = 200
+
+# brotli quality 5 compresses about as fast as gzip, 11 is too slow per request
+BROTLI_QUALITY = 5
+
+COMPRESSORS = {"gzip": compress_string}
+if brotli is not None:
+    COMPRESSORS["br"] = lambda content: brotli.compress(content, quality=BROTLI_QUALITY)
+
+
+# the best supported encoding of an Accept-Encoding header, honouring q values
+# e.g. "gzip, br;q=0.9" -> "gzip", "br, gzip" -> "br" (when brotli is installed)
+def negotiate_encoding(accept_encoding: str):
+    best, best_q = None, 0.0
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if name not in COMPRESSORS:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                continue
+        # on a tie brotli wins, it compresses JSON better than gzip
+        if q > best_q or (q == best_q and name == "br"):
+            best, best_q = name, q
+    return best
+
+
+class APICompressionMiddleware:
+    """Compresses the /api/ responses with brotli or gzip, as the client accepts
+
+    Only the API is compressed: the HTML pages carry CSRF tokens, which must
+    not be compressed together with user input (BREACH). Streamed responses,
+    such as the snapshot archive, are left as they are.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if (
+            not request.path_info.startswith("/api/")
+            or response.streaming
+            or response.has_header("Content-Encoding")
+            or len(response.content) < MIN_COMPRESS_LENGTH
+        ):
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        encoding = negotiate_encoding(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        if encoding is None:
+            return response
+
+        compressed = COMPRESSORS[encoding](response.content)
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response.headers["Content-Length"] = str(len(compressed))
+        response.headers["Content-Encoding"] = encoding
+        return response
+
+
+class AuditMiddleware:
+    """Collects the audit events of a request and writes them in one bulk_create
+
+    Must come after AuthenticationMiddleware, the events carry the username.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        from . import audit
+
+        user = getattr(request, "user", None)
+        actor = user.get_username() if user is not None and user.is_authenticated else ""
+        with audit.buffered(actor=actor):
+            return self.get_response(request)
@@ -0,0 +1,44 @@
+# Generated by Django 5.1 on 2026-10-19 10:00
+
+from django.db import migrations
+
+
+# the FTS5 search table only exists on SQLite, other backends search with LIKE
+def create_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS erp_app_search USING fts5("
+        "kind UNINDEXED, object_id UNINDEXED, body, "
+        "tokenize = 'unicode61', prefix = '1 2 3')"
+    )
+    # index the rows that already exist
+    schema_editor.execute(
+        "INSERT INTO erp_app_search (kind, object_id, body) "
+        "SELECT 'tenant', id, COALESCE(name, '') || ' ' || COALESCE(unit, '') FROM erp_app_tenant"
+    )
+    schema_editor.execute(
+        "INSERT INTO erp_app_search (kind, object_id, body) "
+        "SELECT 'property', id, COALESCE(address, '') FROM erp_app_property"
+    )
+    schema_editor.execute(
+        "INSERT INTO erp_app_search (kind, object_id, body) "
+        "SELECT 'unitroom', id, COALESCE(unit_number, '') FROM erp_app_unitroom"
+    )
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS erp_app_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('erp_app', '0005_property_updated_at_tenant_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.1 on 2026-10-19 13:35
+
+import django.core.validators
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('erp_app', '0006_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Invoice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.DateField(db_index=True)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('due_date', models.DateTimeField(db_index=True)),
+                ('status', models.CharField(choices=[('open', 'Open'), ('paid', 'Paid')], default='open', max_length=10)),
+                ('issued_at', models.DateTimeField(auto_now_add=True)),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='invoices', to='erp_app.tenant')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Payment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=14, validators=[django.core.validators.MinValueValidator(0)])),
+                ('paid_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('invoice', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payments', to='erp_app.invoice')),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payments', to='erp_app.tenant')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['tenant', 'status', 'due_date'], name='erp_app_inv_tenant__1b49be_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='invoice',
+            constraint=models.UniqueConstraint(fields=('tenant', 'period'), name='unique_invoice_per_tenant_period'),
+        ),
+    ]
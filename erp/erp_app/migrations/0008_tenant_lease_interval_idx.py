@@ -0,0 +1,17 @@
+# Generated by Django 5.1 on 2026-10-19 13:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('erp_app', '0007_invoice_payment'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='tenant',
+            index=models.Index(fields=['lease_end', 'lease_start'], name='tenant_lease_interval_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1 on 2026-10-19 13:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('erp_app', '0008_tenant_lease_interval_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='unitroom',
+            index=models.Index(condition=models.Q(('tenant__isnull', True)), fields=['property', 'unit_number'], name='unitroom_vacant_idx'),
+        ),
+    ]
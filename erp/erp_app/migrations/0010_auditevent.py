@@ -0,0 +1,32 @@
+# Generated by Django 5.1 on 2026-10-19 13:53
+
+import django.core.serializers.json
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('erp_app', '0009_unitroom_vacant_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(choices=[('tenant_added', 'Tenant added to a property'), ('tenant_removed', 'Tenant removed from a property'), ('tenant_deleted', 'Tenant deleted'), ('lease_renewed', 'Lease renewed'), ('room_assigned', 'Tenant moved into a unit room'), ('room_vacated', 'Tenant moved out of a unit room'), ('room_added', 'Unit room added to a property'), ('room_removed', 'Unit room removed from a property'), ('room_deleted', 'Unit room deleted'), ('property_deleted', 'Property deleted')], max_length=30)),
+                ('object_type', models.CharField(max_length=30)),
+                ('object_id', models.IntegerField()),
+                ('object_repr', models.CharField(blank=True, max_length=200)),
+                ('property_id', models.IntegerField(blank=True, null=True)),
+                ('actor', models.CharField(blank=True, max_length=150)),
+                ('data', models.JSONField(blank=True, default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['object_type', 'object_id', 'created_at'], name='audit_object_idx'), models.Index(fields=['property_id', 'created_at'], name='audit_property_idx'), models.Index(fields=['created_at'], name='audit_created_idx')],
+            },
+        ),
+    ]
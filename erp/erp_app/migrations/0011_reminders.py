@@ -0,0 +1,47 @@
+# Generated by Django 5.1 on 2026-10-19 13:56
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('erp_app', '0010_auditevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReminderLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('lease_expiry', 'Lease expiry'), ('payment_due', 'Payment due')], max_length=20)),
+                ('due_at', models.DateTimeField()),
+                ('sent_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='leasemanager',
+            name='email',
+            field=models.EmailField(blank=True, max_length=254),
+        ),
+        migrations.AddField(
+            model_name='tenant',
+            name='email',
+            field=models.EmailField(blank=True, max_length=254),
+        ),
+        migrations.AddIndex(
+            model_name='tenant',
+            index=models.Index(fields=['next_payment_due'], name='tenant_next_payment_due_idx'),
+        ),
+        migrations.AddField(
+            model_name='reminderlog',
+            name='tenant',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reminders', to='erp_app.tenant'),
+        ),
+        migrations.AddConstraint(
+            model_name='reminderlog',
+            constraint=models.UniqueConstraint(fields=('tenant', 'kind', 'due_at'), name='unique_reminder'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1 on 2026-10-19 14:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('erp_app', '0011_reminders'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedTenant',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=60)),
+                ('lease_start', models.DateTimeField()),
+                ('lease_end', models.DateTimeField()),
+                ('next_payment_due', models.DateTimeField(blank=True, null=True)),
+                ('monthly_rent', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('unit', models.CharField(blank=True, max_length=10)),
+                ('email', models.EmailField(blank=True, max_length=254)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('properties', models.ManyToManyField(blank=True, related_name='archived_tenants', to='erp_app.property')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['lease_end', 'lease_start'], name='archived_lease_interval_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1 on 2026-10-19 14:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('erp_app', '0012_archivedtenant'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ManagerShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('manager_id', models.BigIntegerField(unique=True)),
+                ('database', models.CharField(max_length=50)),
+                ('moved_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1 on 2026-10-19 16:20
+
+from django.db import migrations
+
+# rowid = object_id * 8 + the number of the kind, see erp_app.search.KIND_NUMBERS
+SEARCH_SOURCES = [
+    ("tenant", 1, "erp_app_tenant", "COALESCE(name, '') || ' ' || COALESCE(unit, '')"),
+    ("archivedtenant", 2, "erp_app_archivedtenant", "COALESCE(name, '') || ' ' || COALESCE(unit, '')"),
+    ("property", 3, "erp_app_property", "COALESCE(address, '')"),
+    ("unitroom", 4, "erp_app_unitroom", "COALESCE(unit_number, '')"),
+]
+
+
+# re-indexes every document under the rowid of its kind and object id
+def rekey_search_documents(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute("DELETE FROM erp_app_search")
+    for kind, number, table, body in SEARCH_SOURCES:
+        schema_editor.execute(
+            f"INSERT INTO erp_app_search (rowid, kind, object_id, body) "
+            f"SELECT id * 8 + {number}, '{kind}', id, {body} FROM {table}"
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('erp_app', '0013_managershard'),
+    ]
+
+    operations = [
+        migrations.RunPython(rekey_search_documents, migrations.RunPython.noop),
+    ]
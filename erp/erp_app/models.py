@@ -1,7 +1,9 @@
-from django.db import models
-from django.db.models import Sum, Q, F, QuerySet
+from django.db import IntegrityError, models, transaction
+from django.db.models import Sum, Q, F, QuerySet, Count, Avg, OuterRef, Subquery, FloatField, ExpressionWrapper
+from django.db.models.functions import Coalesce, TruncMonth, TruncWeek
 from django.utils import timezone
 from django.core.exceptions import ValidationError, ObjectDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import (
     MinValueValidator,
     MaxValueValidator,
@@ -10,7 +12,48 @@ from django.core.validators import (
 # implement a uuid for 
 from django.utils.timezone import make_aware
 from datetime import datetime, timedelta
+import re
 import uuid
+from collections import Counter
+
+
+class TenantQuerySet(models.QuerySet):
+    """Lease interval lookups
+
+    Both lookups are served by the composite (lease_end, lease_start) index:
+    the range on lease_end is an index range scan and lease_start is checked
+    from the same index entry, without reading the table rows.
+
+    Methods:
+        active_on: leases covering a given date
+        overlapping: leases overlapping the window [start, end]
+        for_manager: the tenants of a lease manager, on the manager's shard
+    """
+
+    # a date covers the whole day, a datetime is used as is
+    @staticmethod
+    def _bounds(value) -> tuple[datetime, datetime]:
+        if isinstance(value, datetime):
+            return value, value
+        start = make_aware(datetime.combine(value, datetime.min.time()))
+        return start, start + timedelta(days=1) - timedelta(microseconds=1)
+
+    def active_on(self, value):
+        day_start, day_end = self._bounds(value)
+        return self.filter(lease_end__gte=day_start, lease_start__lte=day_end)
+
+    # either end of the window can be None for an open-ended window
+    def overlapping(self, start, end):
+        queryset = self
+        if start is not None:
+            queryset = queryset.filter(lease_end__gte=self._bounds(start)[0])
+        if end is not None:
+            queryset = queryset.filter(lease_start__lte=self._bounds(end)[1])
+        return queryset
+
+    # the portfolio of a lease manager lives on the manager's database, see erp_app.shards
+    def for_manager(self, lease_manager):
+        return self.using(lease_manager._state.db).filter(properties__lease_manager=lease_manager).distinct()
 
 
 class Tenant(models.Model):
@@ -92,17 +135,40 @@ class Tenant(models.Model):
         blank=False, 
     )
     
+    # where the lease and payment reminders are sent, see erp_app.reminders
+    email = models.EmailField(blank=True)
+    
+    # bumped on every save, used as the version stamp of cached table rows
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    objects = TenantQuerySet.as_manager()
+    
+    class Meta:
+        indexes = [
+            # interval index for active_on / overlapping
+            models.Index(fields=["lease_end", "lease_start"], name="tenant_lease_interval_idx"),
+            # range scans of the payment reminders and of the due date rollover
+            models.Index(fields=["next_payment_due"], name="tenant_next_payment_due_idx"),
+        ]
+    
     def save(self, *args, **kwargs):
         if not self.next_payment_due:
-            self.next_payment_due = self.lease_start + timedelta(days=31)
+            from .billing import add_months
+
+            # one calendar month after the lease start, rolled over by rollover_due_dates
+            self.next_payment_due = add_months(self.lease_start, 1)
         super(Tenant, self).save(*args, **kwargs)
     
     def renew_lease(self, extended_date: datetime) -> None:
+        from . import audit
+
         extended_date = make_aware(extended_date)
         
         if self.lease_end < extended_date:
+            previous_lease_end = self.lease_end
             self.lease_end = extended_date
             self.save()
+            audit.record(AuditEvent.LEASE_RENEWED, self, previous_lease_end=previous_lease_end, lease_end=extended_date)
         else:
             raise ValidationError("Extended date must be greater than the current lease end")
     
@@ -121,6 +187,195 @@ class Tenant(models.Model):
         return self.name
   
     
+class PropertyQuerySet(models.QuerySet):
+    """Set-based operations over many properties at once
+
+    Every method runs a fixed number of queries no matter how many properties,
+    tenants or rooms are involved (used by the admin bulk actions).
+
+    Methods:
+        with_stats: annotates tenant_count, total_rent and occupancy_rate
+        with_occupancy: annotates tenant_count and occupancy_rate
+        assign_lease_manager: moves every property to a single lease manager
+        release_units: removes every tenant from the properties and their rooms
+        recount_current_units: recomputes current_units from the occupied rooms
+        create_with_rooms: creates a property and all of its unit rooms at once
+        taken_errors: the address and unit numbers already used by other properties
+        delete_with_rooms: releases the tenants and deletes the properties and their rooms
+        for_manager: the properties of a lease manager, on the manager's shard
+    """
+
+    def for_manager(self, lease_manager):
+        return self.using(lease_manager._state.db).filter(lease_manager=lease_manager)
+
+    # the same figures as calculate_total_rent and calculate_occupancy_rate
+    # computed in the database for every row at once
+    def with_stats(self):
+        this_month = timezone.now().replace(day=1)
+        return self.with_occupancy().annotate(
+            total_rent=Coalesce(
+                Sum(
+                    "tenants__monthly_rent",
+                    filter=Q(tenants__lease_end__gte=this_month) & ~Q(tenants__unit=""),
+                ),
+                0,
+                output_field=models.DecimalField(max_digits=14, decimal_places=2),
+            ),
+        )
+
+    # tenant_count and occupancy_rate only, without the rent sum of with_stats
+    def with_occupancy(self):
+        return self.annotate(
+            tenant_count=Count("tenants", distinct=True),
+        ).annotate(
+            occupancy_rate=ExpressionWrapper(
+                F("tenant_count") * 100.0 / F("units"),
+                output_field=FloatField(),
+            ),
+        )
+
+    # number of unit rooms without a tenant, from the unit rooms themselves
+    # (current_units is a counter that can drift)
+    def with_vacant_units(self):
+        vacant = UnitRoom.objects.vacant().filter(
+            property=OuterRef("pk"),
+        ).values("property").annotate(total=Count("id")).values("total")
+        return self.annotate(vacant_units=Coalesce(Subquery(vacant), 0))
+
+    # average monthly rent of the current tenants, used as the rent band of a property
+    def with_average_rent(self):
+        average = Property.tenants.through.objects.filter(
+            property=OuterRef("pk"),
+        ).values("property").annotate(average=Avg("tenant__monthly_rent")).values("average")
+        return self.annotate(average_rent=Subquery(average, output_field=models.DecimalField(max_digits=14, decimal_places=2)))
+
+    # a property belongs to at most one lease manager, so the old links are replaced
+    def assign_lease_manager(self, lease_manager) -> int:
+        through = LeaseManager.properties.through
+        property_ids = list(self.values_list("id", flat=True))
+        with transaction.atomic():
+            through.objects.filter(property_id__in=property_ids).delete()
+            through.objects.bulk_create([
+                through(leasemanager_id=lease_manager.id, property_id=property_id)
+                for property_id in property_ids
+            ])
+            self.model.objects.filter(id__in=property_ids).update(updated_at=timezone.now())
+        return len(property_ids)
+
+    # empties every unit room of the properties, unlinks their tenants
+    # and clears the unit string of those tenants
+    def release_units(self) -> int:
+        from . import search
+
+        now = timezone.now()
+        with transaction.atomic():
+            property_ids = self.values("id")
+            tenant_ids = Tenant.objects.filter(
+                Q(properties__in=property_ids) | Q(tenant__property__in=property_ids)
+            ).values("id")
+            tenants = Tenant.objects.filter(id__in=list(tenant_ids.values_list("id", flat=True)))
+
+            UnitRoom.objects.filter(property__in=property_ids).update(tenant=None)
+            self.model.tenants.through.objects.filter(property_id__in=property_ids).delete()
+            released = tenants.update(unit="", updated_at=now)
+            self.model.objects.filter(id__in=property_ids).update(current_units=0, updated_at=now)
+            search.index_queryset(tenants)
+        return released
+
+    # current_units is a counter that can drift, the occupied unit rooms are the truth
+    def recount_current_units(self) -> int:
+        occupied = UnitRoom.objects.filter(
+            property=OuterRef("pk"),
+            tenant__isnull=False,
+        ).values("property").annotate(total=Count("id")).values("total")
+        return self.update(
+            current_units=Coalesce(Subquery(occupied), 0),
+            updated_at=timezone.now(),
+        )
+
+    # deletes the properties and their unit rooms after releasing their tenants
+    # the rooms are removed with one DELETE and their search documents with another,
+    # instead of the per-room post_delete signals the CASCADE would send
+    def delete_with_rooms(self) -> int:
+        from . import audit, search
+
+        with transaction.atomic():
+            property_ids = list(self.values_list("id", flat=True))
+            properties = self.model.objects.filter(id__in=property_ids)
+
+            rooms = {}
+            for property_id, unit_number, tenant_id in UnitRoom.objects.filter(
+                property_id__in=property_ids,
+            ).values_list("property_id", "unit_number", "tenant_id"):
+                rooms.setdefault(property_id, []).append((unit_number, tenant_id))
+            for property in properties:
+                audit.record(AuditEvent.PROPERTY_DELETED, property, unit_rooms=rooms.get(property.id, []))
+
+            properties.release_units()
+
+            rooms = UnitRoom.objects.filter(property_id__in=property_ids)
+            search.unindex_queryset(rooms)
+            # no signal receiver and no model depends on the deleted rooms
+            rooms._raw_delete(rooms.db)
+
+            properties.delete()
+        return len(property_ids)
+
+    # onboarding of a whole building: one uniqueness query for the address and all the
+    # unit numbers, then the property and a single bulk_create of its rooms in one transaction
+    # units defaults to the number of rooms, raises ValidationError with a message per field
+    # the property is created on the database of the queryset, e.g. Property.objects.db_manager(shard)
+    def create_with_rooms(self, address, unit_numbers, units=None, **fields) -> "Property":
+        from . import search
+
+        db = self.db
+        unit_numbers = list(unit_numbers)
+        units = len(unit_numbers) if units is None else units
+        errors = {}
+
+        if not Property.MINIMUM_UNITS <= units <= Property.MAXIMUM_UNITS:
+            errors["units"] = f"Units must be between {Property.MINIMUM_UNITS} and {Property.MAXIMUM_UNITS}."
+        elif len(unit_numbers) > units:
+            errors["unit_numbers"] = f"{len(unit_numbers)} unit rooms do not fit in {units} units."
+
+        duplicates = sorted(number for number, count in Counter(unit_numbers).items() if count > 1)
+        too_long = [number for number in unit_numbers if not number or len(number) > UnitRoom.UNIT_NUMBER_LENGTH]
+        if duplicates:
+            errors["unit_numbers"] = f"Repeated unit numbers: {', '.join(duplicates)}"
+        elif too_long:
+            errors["unit_numbers"] = f"Unit numbers must be 1 to {UnitRoom.UNIT_NUMBER_LENGTH} characters."
+        for field, message in self.taken_errors(address, unit_numbers).items():
+            errors.setdefault(field, message)
+        if errors:
+            raise ValidationError(errors)
+
+        # a concurrent request can take the address or a unit number after the checks above,
+        # the unique constraints then roll the whole building back and the checks run again
+        try:
+            with transaction.atomic(using=db):
+                property = self.model.objects.using(db).create(address=address, units=units, **fields)
+                UnitRoom.objects.using(db).bulk_create([
+                    UnitRoom(unit_number=number, property=property) for number in unit_numbers
+                ])
+                # bulk_create skips the post_save signal that indexes the rooms
+                search.index_queryset(property.unit_rooms.all())
+        except IntegrityError:
+            raise ValidationError(self.taken_errors(address, unit_numbers) or {
+                "address": "The property could not be created, please retry.",
+            })
+        return property
+
+    # the address and unit numbers already used by other properties, as ValidationError messages per field
+    def taken_errors(self, address, unit_numbers) -> dict:
+        errors = {}
+        taken = list(UnitRoom.objects.using(self.db).filter(unit_number__in=unit_numbers).values_list("unit_number", flat=True))
+        if taken:
+            errors["unit_numbers"] = f"Unit numbers already taken: {', '.join(sorted(taken))}"
+        if self.model.objects.using(self.db).filter(address=address).exists():
+            errors["address"] = "A property with this address already exists."
+        return errors
+
+
 class Property(models.Model):
     """Property Model
     
@@ -208,6 +463,12 @@ class Property(models.Model):
         related_name='properties',
     )
     
+    # bumped on every save (and by signals when its tenants change),
+    # used as the version stamp of cached table rows
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    objects = PropertyQuerySet.as_manager()
+    
     
     def add_tenant(self, tenant: Tenant, unit_room: "UnitRoom"):
         """
@@ -218,6 +479,7 @@ class Property(models.Model):
             tenant: Singel Model object
             preffered_unit: Single Model object <UnitRoom: DOG001>
         """
+        from . import audit
         
         # # check if the preferred unit is NOT available and valid
         # if preffered_unit < 1 or preffered_unit > self.units:
@@ -254,38 +516,55 @@ class Property(models.Model):
             tenant.save()
             self.current_units +=1 
             self.save()
+            audit.record(AuditEvent.TENANT_ADDED, tenant, property=self, unit_number=unit_room.unit_number)
         else:
             raise ValidationError("wRONG FIELDS!")
         print(self.current_units)
     
     # Removes the passed tenant object from the tenants attribute and also removes the tenant's room
+    # a fixed number of statements: the link, one UPDATE of the rooms and a recount
     def remove_tenant(self, tenant):
-        if tenant and self.current_units > 0:
+        from . import audit, search
+
+        if not tenant:
+            return
+
+        with transaction.atomic():
             # Remove the tenant from the tenants list
             self.tenants.remove(tenant)
 
-            # Access and clear the tenant's unit room(s)
-            # Assuming each tenant has one unit room, but adjust for multiple unit rooms if needed
-            tenant_unit_rooms = tenant.tenant.all()  # Retrieves all unit rooms associated with the tenant
-            print(f"tenant room: {tenant_unit_rooms}")
-            for unit_room in tenant_unit_rooms:
-                unit_room.tenant = None  # Remove the tenant from the unit room
-                unit_room.save()  # Save the change to the database
-            
-            self.current_units -= 1
-            self.save()  # Save changes to the property model
+            # clear the tenant's unit room(s) of this property in one UPDATE
+            rooms = self.unit_rooms.filter(tenant=tenant)
+            released = list(rooms.values_list("unit_number", flat=True))
+            rooms.update(tenant=None)
+
+            # the tenant no longer lives in the released unit
+            if tenant.unit and tenant.unit in released:
+                Tenant.objects.filter(id=tenant.id).update(unit="", updated_at=timezone.now())
+                tenant.unit = ""
+                search.index_object(tenant)
+
+            Property.objects.filter(id=self.id).recount_current_units()
+            self.refresh_from_db(fields=["current_units", "updated_at"])
+            audit.record(AuditEvent.TENANT_REMOVED, tenant, property=self, unit_numbers=released)
     
     # foreign key add
     def add_room(self, room):
+        from . import audit
+
         if self.unit_rooms.count() >= self.units:
             raise ValueError("Property units already full!")
         print(self.unit_rooms.count())
         room.property = self
         room.save()
+        audit.record(AuditEvent.ROOM_ADDED, room, property=self)
     
     def remove_room(self, room):
+        from . import audit
+
         room.property = None
         room.save()
+        audit.record(AuditEvent.ROOM_REMOVED, room, property=self)
         
     
     # calculate the occupancy rate of the property
@@ -307,21 +586,42 @@ class Property(models.Model):
         )['total_units'] or 0
         return total
 
+    # the figures of the property rows: tenant count, total rent and occupancy rate
+    def stats(self) -> dict:
+        tenant_count = self.tenants.count()
+        return {
+            "tenant_count": tenant_count,
+            "total_rent": self.calculate_total_rent(),
+            "occupancy_rate": round(tenant_count / self.units * 100, 2),
+        }
+
+    # stats() through the cache, computed once per change of the property, see erp_app.caching
+    def cached_stats(self) -> dict:
+        from .caching import property_stats
+        return property_stats(self)
+
     def get_number_of_vacant_units(self):
         # can add a filter to tenants to only who has unit rooms
         return self.units - self.tenants.count()
     
+    # releases every tenant and deletes the property with its unit rooms, see delete_with_rooms
     def delete_property(self):
-        if self.tenants.all():
-            for t in self.tenants.all():
-                t.unit = ""
-                t.save()
-        self.delete()
+        Property.objects.filter(id=self.id).delete_with_rooms()
     
     def __str__(self) -> str:
         return self.address
 
 
+class UnitRoomQuerySet(models.QuerySet):
+    # unit rooms that belong to a property and have no tenant
+    # served by the partial unitroom_vacant_idx index
+    def vacant(self):
+        return self.filter(tenant__isnull=True, property__isnull=False)
+
+    def for_manager(self, lease_manager):
+        return self.using(lease_manager._state.db).filter(property__lease_manager=lease_manager)
+
+
 class UnitRoom(models.Model):
     """A placeholder for UnitRoom or unit of Tenant Class Model
 
@@ -337,8 +637,9 @@ class UnitRoom(models.Model):
     id = models.AutoField(primary_key=True, editable=False)
     
     # Unit Number for Tenant's unit attribute
+    UNIT_NUMBER_LENGTH = 10
     unit_number = models.CharField(
-        max_length=10, 
+        max_length=UNIT_NUMBER_LENGTH, 
         unique=True,
     )
     
@@ -361,26 +662,65 @@ class UnitRoom(models.Model):
         db_index=True,
     )
     
+    objects = UnitRoomQuerySet.as_manager()
+    
+    class Meta:
+        indexes = [
+            # only the vacant rooms are indexed, a vacancy search never reads the occupied ones
+            models.Index(
+                fields=["property", "unit_number"],
+                condition=Q(tenant__isnull=True),
+                name="unitroom_vacant_idx",
+            ),
+        ]
+    
     def __str__(self) -> str:
         return self.unit_number
 
+    # unit numbers of a range pattern, the width of the first number is kept
+    # e.g. "A-01..A-12" -> A-01, A-02, ..., A-12 and "B1..B3" -> B1, B2, B3
+    PATTERN_RE = re.compile(r"^(?P<prefix>.*?)(?P<start>\d+)\.\.(?P=prefix)(?P<end>\d+)$")
+
+    @classmethod
+    def expand_pattern(cls, pattern: str) -> list[str]:
+        match = cls.PATTERN_RE.match(pattern.strip())
+        if match is None:
+            raise ValidationError(f"Invalid unit pattern: {pattern} (expected e.g. A-01..A-100)")
+        start, end = int(match["start"]), int(match["end"])
+        if end < start:
+            raise ValidationError(f"Invalid unit pattern: {pattern} (the range is empty)")
+        if end - start >= Property.MAXIMUM_UNITS:
+            raise ValidationError(f"Invalid unit pattern: {pattern} (more than {Property.MAXIMUM_UNITS} units)")
+        width = len(match["start"])
+        return [f"{match['prefix']}{number:0{width}d}" for number in range(start, end + 1)]
+
     def add_property(self, property):
         self.property = property
         self.save()
     
+    # detaching a room also frees it, in a single UPDATE
     def remove_property(self):
+        from . import audit
+
+        audit.record(AuditEvent.ROOM_REMOVED, self, property=self.property_id, tenant_id=self.tenant_id)
+        UnitRoom.objects.filter(id=self.id).update(property=None, tenant=None)
         self.property = None
-        self.remove_tenant()
-        self.save()
+        self.tenant = None
         
     def add_tenant(self, tenant):
+        from . import audit
+
         self.tenant = tenant
         self.save()
+        audit.record(AuditEvent.ROOM_ASSIGNED, tenant, property=self.property_id, unit_number=self.unit_number)
     
     def remove_tenant(self):
+        from . import audit
+
         if self.tenant:
+            audit.record(AuditEvent.ROOM_VACATED, self.tenant, property=self.property_id, unit_number=self.unit_number)
+            UnitRoom.objects.filter(id=self.id).update(tenant=None)
             self.tenant = None
-            self.save()
     
 
 class LeaseManager(models.Model):
@@ -399,6 +739,9 @@ class LeaseManager(models.Model):
         related_name='lease_manager',
     )
     
+    # copied on the reminders sent to the tenants of the manager's properties
+    email = models.EmailField(blank=True)
+    
     # add property to the lease manager by passing a property model object
     
     def add_property(self, property):
@@ -426,19 +769,64 @@ class LeaseManager(models.Model):
             result.append(property)
         return result
 
+    # unit-level vacancy: every room of this lease manager's properties without a tenant
+    
+    def vacant_unit_rooms(self) -> QuerySet["UnitRoom"]:
+        return UnitRoom.objects.for_manager(self).vacant()
+    
+    # the properties of this lease manager with at least one vacant room
+    # annotated with vacant_units and average_rent
+    
+    def vacant_units_by_property(self) -> QuerySet[Property]:
+        return self.properties.with_vacant_units().with_average_rent().filter(vacant_units__gt=0)
+    
     # generate a lease expiry report in between dates
 
     def generate_lease_expiry_report(self, start_lease_date, end_lease_date, properties):
         start_lease_date = make_aware(start_lease_date)
         end_lease_date = make_aware(end_lease_date)
         
+        # properties=None reports on every property of this lease manager
+        if properties is None:
+            properties = self.properties.all()
+        else:
+            properties = [properties]
+        
         try:
-            return Tenant.objects.filter(lease_end__range=(start_lease_date, end_lease_date),
-                                         properties=properties,
-                                         )
+            return Tenant.objects.using(self._state.db).filter(lease_end__range=(start_lease_date, end_lease_date),
+                                         properties__in=properties,
+                                         ).distinct()
         except self.DoesNotExist:
             return None
     
+    # number of leases ending per week or month, per property, computed by the database
+    # in a single GROUP BY query over the property/tenant links
+    # returns rows of {bucket, property_id, property__address, property__property_type, leases}
+    
+    EXPIRY_BUCKETS = {
+        "week": TruncWeek,
+        "month": TruncMonth,
+    }
+    
+    def lease_expiry_histogram(self, start, end, bucket="month"):
+        if bucket not in self.EXPIRY_BUCKETS:
+            raise ValidationError(f"Unknown histogram bucket: {bucket}")
+        
+        return Property.tenants.through.objects.using(self._state.db).filter(
+            property__lease_manager=self,
+            tenant__lease_end__gte=start,
+            tenant__lease_end__lt=end,
+        ).annotate(
+            bucket=self.EXPIRY_BUCKETS[bucket]("tenant__lease_end"),
+        ).values(
+            "bucket",
+            "property_id",
+            "property__address",
+            "property__property_type",
+        ).annotate(
+            leases=Count("id"),
+        ).order_by("bucket", "property_id")
+    
     # calculate the total revenue of every property that the lease manager possess
     
     def calculate_total_revenue(self) -> int:
@@ -447,6 +835,47 @@ class LeaseManager(models.Model):
             total += p.calculate_total_rent()
         return total
     
+    # the figures of the whole portfolio in three queries
+    # total_revenue is the same figure as calculate_total_revenue
+    
+    def portfolio_stats(self) -> dict:
+        this_month = timezone.now().replace(day=1)
+        properties = self.properties.aggregate(
+            property_count=Count("id"),
+            units=Coalesce(Sum("units"), 0),
+            occupied_units=Coalesce(Sum("current_units"), 0),
+        )
+        links = Property.tenants.through.objects.using(self._state.db).filter(property__lease_manager=self)
+        total_revenue = links.filter(
+            tenant__lease_end__gte=this_month,
+        ).exclude(
+            tenant__unit="",
+        ).aggregate(total=Sum("tenant__monthly_rent"))["total"] or 0
+        units = properties["units"]
+        return {
+            **properties,
+            "tenant_count": links.values("tenant_id").distinct().count(),
+            "total_revenue": total_revenue,
+            "occupancy_rate": round(properties["occupied_units"] * 100 / units, 2) if units else 0,
+        }
+    
+    # portfolio_stats() through the cache, recomputed by a single request at a time, see erp_app.caching
+    
+    def cached_stats(self) -> dict:
+        from .caching import manager_stats
+        return manager_stats(self)
+    
+    # month-by-month expected revenue of the properties of this lease manager
+    # see erp_app.forecasting.forecast_revenue for the arguments
+    
+    def forecast_revenue(self, months=12, renewal_probability=0.0) -> dict:
+        from .forecasting import forecast_revenue
+        return forecast_revenue(
+            months=months,
+            renewal_probability=renewal_probability,
+            lease_manager=self,
+        )
+    
     # find and return a list of tenants that their lease_end is past by the current date
     
     def find_tenants_with_overdue_rent(self) -> list[Tenant]:
@@ -467,4 +896,273 @@ class LeaseManager(models.Model):
         return overdue_tenants
     
     def __str__(self) -> str:
-        return self.name
\ No newline at end of file
+        return self.name
+
+class Invoice(models.Model):
+    """A monthly rent invoice of a tenant, generated by the run_billing command
+
+    Attrs:
+        tenant: the billed tenant
+        period: first day of the billed month, a tenant has at most one invoice per period
+        amount: the tenant's monthly rent at the time of billing
+        due_date: when the invoice has to be paid
+        status: open until the payments cover the amount
+    """
+    OPEN = "open"
+    PAID = "paid"
+
+    STATUS_CHOICES = {
+        OPEN: "Open",
+        PAID: "Paid",
+    }
+
+    tenant = models.ForeignKey(
+        Tenant,
+        on_delete=models.CASCADE,
+        related_name="invoices",
+    )
+    period = models.DateField(db_index=True)
+    amount = models.DecimalField(max_digits=14, decimal_places=2)
+    due_date = models.DateTimeField(db_index=True)
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=OPEN,
+    )
+    issued_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            # makes billing runs idempotent, re-running a month skips the existing invoices
+            models.UniqueConstraint(fields=["tenant", "period"], name="unique_invoice_per_tenant_period"),
+        ]
+        indexes = [
+            models.Index(fields=["tenant", "status", "due_date"]),
+        ]
+
+    # records a payment against this invoice and closes it once fully paid
+    def record_payment(self, amount, paid_at=None) -> "Payment":
+        from .billing import add_months
+
+        # the payment and the tenant are on the shard of the invoice
+        database = self._state.db or "default"
+        with transaction.atomic(using=database):
+            payment = Payment.objects.using(database).create(
+                invoice=self,
+                tenant_id=self.tenant_id,
+                amount=amount,
+                paid_at=paid_at or timezone.now(),
+            )
+            paid = self.payments.aggregate(total=Sum("amount"))["total"] or 0
+            if paid >= self.amount and self.status != self.PAID:
+                self.status = self.PAID
+                self.save(update_fields=["status"])
+                # the next due date is the oldest invoice still open, or the month
+                # after the latest invoice when everything is paid (at most the lease end)
+                # see erp_app.billing.rollover_due_dates for the other writers
+                next_due = Invoice.objects.using(database).filter(
+                    tenant_id=self.tenant_id, status=Invoice.OPEN,
+                ).order_by("due_date").values_list("due_date", flat=True).first()
+                if next_due is None:
+                    latest = Invoice.objects.using(database).filter(tenant_id=self.tenant_id).order_by("-due_date").first()
+                    next_due = min(add_months(latest.due_date, 1), self.tenant.lease_end)
+                Tenant.objects.using(database).filter(id=self.tenant_id).update(
+                    next_payment_due=next_due,
+                    updated_at=timezone.now(),
+                )
+        return payment
+
+    def __str__(self) -> str:
+        return f"{self.tenant} {self.period:%Y-%m}"
+
+
+class Payment(models.Model):
+    """A payment made by a tenant against one of their invoices"""
+    invoice = models.ForeignKey(
+        Invoice,
+        on_delete=models.CASCADE,
+        related_name="payments",
+    )
+    tenant = models.ForeignKey(
+        Tenant,
+        on_delete=models.CASCADE,
+        related_name="payments",
+    )
+    amount = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        validators=[MinValueValidator(0)],
+    )
+    paid_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self) -> str:
+        return f"{self.tenant} paid {self.amount}"
+
+
+class AuditEventQuerySet(models.QuerySet):
+    # every lookup below is served by one of the AuditEvent indexes
+
+    # events of an object, e.g. for_object(tenant) or for_object("unitroom", 12)
+    def for_object(self, obj, object_id=None):
+        if object_id is None:
+            obj, object_id = obj._meta.model_name, obj.pk
+        return self.filter(object_type=obj, object_id=object_id)
+
+    def for_property(self, property):
+        return self.filter(property_id=getattr(property, "pk", property))
+
+    # events in [start, end), either bound may be None
+    def between(self, start=None, end=None):
+        queryset = self
+        if start is not None:
+            queryset = queryset.filter(created_at__gte=start)
+        if end is not None:
+            queryset = queryset.filter(created_at__lt=end)
+        return queryset
+
+
+class AuditEvent(models.Model):
+    """Append-only record of a change made to the tenants, properties and unit rooms
+
+    Events are recorded by erp_app.audit.record() and written in batches,
+    see erp_app.audit. The object and property are stored as plain ids,
+    so the events of deleted objects remain readable.
+
+    Attrs:
+        action: what happened, one of ACTION_CHOICES
+        object_type / object_id / object_repr: the changed object (model name, id, str())
+        property_id: the property involved, if any
+        actor: username of the user who made the change, "" outside of a request
+        data: details of the change (unit numbers, dates, ...)
+        created_at: when the change was made (not when the event was written)
+    """
+    TENANT_ADDED = "tenant_added"
+    TENANT_REMOVED = "tenant_removed"
+    TENANT_DELETED = "tenant_deleted"
+    LEASE_RENEWED = "lease_renewed"
+    ROOM_ASSIGNED = "room_assigned"
+    ROOM_VACATED = "room_vacated"
+    ROOM_ADDED = "room_added"
+    ROOM_REMOVED = "room_removed"
+    ROOM_DELETED = "room_deleted"
+    PROPERTY_DELETED = "property_deleted"
+    ACTION_CHOICES = {
+        TENANT_ADDED: "Tenant added to a property",
+        TENANT_REMOVED: "Tenant removed from a property",
+        TENANT_DELETED: "Tenant deleted",
+        LEASE_RENEWED: "Lease renewed",
+        ROOM_ASSIGNED: "Tenant moved into a unit room",
+        ROOM_VACATED: "Tenant moved out of a unit room",
+        ROOM_ADDED: "Unit room added to a property",
+        ROOM_REMOVED: "Unit room removed from a property",
+        ROOM_DELETED: "Unit room deleted",
+        PROPERTY_DELETED: "Property deleted",
+    }
+
+    action = models.CharField(max_length=30, choices=ACTION_CHOICES)
+    object_type = models.CharField(max_length=30)
+    object_id = models.IntegerField()
+    object_repr = models.CharField(max_length=200, blank=True)
+    property_id = models.IntegerField(null=True, blank=True)
+    actor = models.CharField(max_length=150, blank=True)
+    data = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    objects = AuditEventQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["object_type", "object_id", "created_at"], name="audit_object_idx"),
+            models.Index(fields=["property_id", "created_at"], name="audit_property_idx"),
+            models.Index(fields=["created_at"], name="audit_created_idx"),
+        ]
+
+    # events are never changed once written
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise ValidationError("Audit events cannot be changed.")
+        super().save(*args, **kwargs)
+
+    def __str__(self) -> str:
+        return f"{self.created_at:%Y-%m-%d %H:%M} {self.action} {self.object_type} {self.object_repr}"
+
+
+class ReminderLog(models.Model):
+    """A reminder already sent, so every reminder goes out once
+
+    A reminder is identified by its tenant, its kind and the date it is about
+    (the lease end or the payment due date), a new due date is a new reminder.
+    """
+    LEASE_EXPIRY = "lease_expiry"
+    PAYMENT_DUE = "payment_due"
+    KIND_CHOICES = {
+        LEASE_EXPIRY: "Lease expiry",
+        PAYMENT_DUE: "Payment due",
+    }
+
+    tenant = models.ForeignKey(
+        Tenant,
+        on_delete=models.CASCADE,
+        related_name="reminders",
+    )
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    due_at = models.DateTimeField()
+    sent_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["tenant", "kind", "due_at"], name="unique_reminder"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.kind} reminder to {self.tenant} for {self.due_at:%Y-%m-%d}"
+
+
+class ArchivedTenant(models.Model):
+    """A tenant moved out of the live Tenant table long after its lease ended
+
+    Written by the archive_tenants command (see erp_app.archive), keeps the id,
+    the lease and the properties the tenant was linked to, so historical
+    reports can still read it. active_on / overlapping work on the archive too.
+    """
+    # the id of the archived Tenant row
+    id = models.IntegerField(primary_key=True)
+    name = models.CharField(max_length=Tenant.NAME_MAX_LENGTH)
+    lease_start = models.DateTimeField()
+    lease_end = models.DateTimeField()
+    next_payment_due = models.DateTimeField(blank=True, null=True)
+    monthly_rent = models.DecimalField(max_digits=14, decimal_places=2)
+    unit = models.CharField(max_length=10, blank=True)
+    email = models.EmailField(blank=True)
+    # the former property/tenant links
+    properties = models.ManyToManyField(
+        Property,
+        related_name="archived_tenants",
+        blank=True,
+    )
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    objects = TenantQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["lease_end", "lease_start"], name="archived_lease_interval_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.name} (archived)"
+
+
+class ManagerShard(models.Model):
+    """Shard map entry: the database holding a lease manager's portfolio
+
+    Only written when a portfolio is moved by the move_portfolio command,
+    every other manager lives on the database its id range belongs to,
+    see erp_app.shards. Always stored on the default database.
+    """
+    manager_id = models.BigIntegerField(unique=True)
+    database = models.CharField(max_length=50)
+    moved_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self) -> str:
+        return f"manager {self.manager_id} on {self.database}"
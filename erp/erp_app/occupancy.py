@@ -0,0 +1,121 @@
+from datetime import timedelta
+
+import numpy as np
+from django.db.models.functions import TruncDate
+
+from .models import Property
+
+# bucket sizes of the timeline, in days
+TIMELINE_STEPS = {
+    "day": 1,
+    "week": 7,
+}
+
+# upper bound of buckets per timeline, keeps a single request bounded
+MAX_TIMELINE_BUCKETS = 1200
+
+
+# lease links (property, first day, last day) as int64 day numbers, in one query
+def load_lease_days(properties=None, lease_manager=None):
+    links = Property.tenants.through.objects.all()
+    if lease_manager is not None:
+        links = links.using(lease_manager._state.db).filter(property__lease_manager=lease_manager)
+    if properties is not None:
+        links = links.filter(property__in=properties)
+
+    rows = links.annotate(
+        start_day=TruncDate("tenant__lease_start"),
+        end_day=TruncDate("tenant__lease_end"),
+    ).values_list("property_id", "start_day", "end_day")
+
+    columns = list(zip(*rows)) or [(), (), ()]
+    property_ids, start_days, end_days = columns
+    return (
+        np.array(property_ids, dtype=np.int64),
+        np.array(start_days, dtype="datetime64[D]").astype(np.int64),
+        np.array(end_days, dtype="datetime64[D]").astype(np.int64),
+    )
+
+
+# occupied units of every property on every sample day, by sweeping sorted lease events
+#
+# every lease adds a +1 event on its first day and a -1 event the day after its last day.
+# the events are sorted once by (property, day), so the running sum of the deltas is the
+# number of active leases of that property, and it drops back to 0 at the end of every
+# property's events. the count on day d is the running sum at the last event <= d, found
+# with a single searchsorted for all (property, day) pairs: O((n + p * b) log n)
+# groups (sorted property ids, a superset of property_ids) gives a row of zeros to the
+# properties without leases; by default the rows are the properties of the leases
+def sweep_counts(property_ids, start_days, end_days, sample_days, groups=None):
+    if groups is None:
+        groups, group_index = np.unique(property_ids, return_inverse=True)
+    else:
+        group_index = np.searchsorted(groups, property_ids)
+    if not len(start_days):
+        return groups, np.zeros((len(groups), len(sample_days)), dtype=np.int32)
+
+    origin = min(start_days.min(), sample_days.min())
+    span = max(end_days.max() + 1, sample_days.max()) - origin + 2
+
+    event_keys = np.concatenate([
+        group_index * span + (start_days - origin),
+        group_index * span + (end_days + 1 - origin),
+    ])
+    deltas = np.concatenate([
+        np.ones(len(start_days), dtype=np.int64),
+        -np.ones(len(end_days), dtype=np.int64),
+    ])
+    order = np.argsort(event_keys, kind="stable")
+    event_keys = event_keys[order]
+    running = np.cumsum(deltas[order])
+
+    query_keys = (np.arange(len(groups))[:, np.newaxis] * span + (sample_days - origin)[np.newaxis, :])
+    positions = np.searchsorted(event_keys, query_keys.ravel(), side="right") - 1
+    counts = np.where(positions >= 0, running[np.clip(positions, 0, None)], 0)
+    return groups, counts.reshape(len(groups), len(sample_days)).astype(np.int32)
+
+
+# occupancy timeline between two dates (inclusive)
+# step "day" or "week", weekly values are the occupied units on the first day of each week
+# every property of the manager / of `properties` (of the default database without either)
+# has a row, the ones without a lease in the range are all zeros
+# returns a compact, chart ready structure: the sample dates once and one count row per property
+def occupancy_timeline(start, end, step="day", properties=None, lease_manager=None) -> dict:
+    if step not in TIMELINE_STEPS:
+        raise ValueError(f"Unknown timeline step: {step}")
+    if end < start:
+        raise ValueError("The end date must be after the start date.")
+
+    days = TIMELINE_STEPS[step]
+    buckets = (end - start).days // days + 1
+    if buckets > MAX_TIMELINE_BUCKETS:
+        raise ValueError(f"Timeline too long, at most {MAX_TIMELINE_BUCKETS} {step}s are allowed.")
+
+    # the properties are on the database the lease links are read from
+    if lease_manager is not None:
+        database = lease_manager._state.db
+    else:
+        database = properties.db if properties is not None else "default"
+    rows = Property.objects.using(database)
+    if lease_manager is not None:
+        rows = rows.filter(lease_manager=lease_manager)
+    if properties is not None:
+        rows = rows.filter(id__in=properties.values("id"))
+    units = dict(rows.values_list("id", "units"))
+
+    sample_days = np.datetime64(start, "D").astype(np.int64) + np.arange(buckets, dtype=np.int64) * days
+    property_ids, counts = sweep_counts(
+        *load_lease_days(properties=properties, lease_manager=lease_manager),
+        sample_days,
+        groups=np.array(sorted(units), dtype=np.int64),
+    )
+
+    return {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "step": step,
+        "dates": [(start + timedelta(days=days * i)).isoformat() for i in range(buckets)],
+        "property_ids": property_ids.tolist(),
+        "units": [units.get(pid, 0) for pid in property_ids.tolist()],
+        "counts": counts.tolist(),
+    }
@@ -0,0 +1,232 @@
+import asyncio
+import json
+import logging
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Exists, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from .models import LeaseManager, ReminderLog, Tenant
+
+logger = logging.getLogger(__name__)
+
+# how long before the due date a reminder is sent
+LEASE_REMINDER_DAYS = 30
+PAYMENT_REMINDER_DAYS = 3
+
+# reminders read (and then delivered and logged) per chunk
+REMINDER_BATCH_SIZE = 5000
+
+# deliveries running at the same time
+REMINDER_CONCURRENCY = 20
+
+# the tenant column every kind of reminder is about
+REMINDER_FIELDS = {
+    ReminderLog.LEASE_EXPIRY: "lease_end",
+    ReminderLog.PAYMENT_DUE: "next_payment_due",
+}
+
+
+# tenants whose lease ends / payment is due within `days` of now and who were not
+# reminded of that date yet, read in keyset chunks of (due date, id) so every chunk
+# is a range scan of the due date index (tenant_lease_interval_idx, tenant_next_payment_due_idx)
+# yields lists of plain dicts, the delivery never touches the ORM
+def iter_due_reminders(kind, now, days, batch_size=REMINDER_BATCH_SIZE, database="default"):
+    field = REMINDER_FIELDS[kind]
+    sent = ReminderLog.objects.filter(tenant=OuterRef("pk"), kind=kind, due_at=OuterRef(field))
+    manager_email = LeaseManager.objects.filter(
+        properties__tenants=OuterRef("pk"),
+    ).exclude(email="").values("email")[:1]
+
+    due = Tenant.objects.using(database).filter(**{
+        f"{field}__gte": now,
+        f"{field}__lt": now + timedelta(days=days),
+    }).exclude(Exists(sent)).annotate(
+        manager_email=Subquery(manager_email),
+    ).order_by(field, "id")
+
+    last = None
+    while True:
+        chunk = due
+        if last is not None:
+            chunk = due.filter(Q(**{f"{field}__gt": last[0]}) | Q(**{field: last[0], "id__gt": last[1]}))
+        rows = list(chunk.values("id", "name", "email", "unit", "monthly_rent", "manager_email", field)[:batch_size])
+        if not rows:
+            return
+        last = (rows[-1][field], rows[-1]["id"])
+        yield [
+            {
+                "tenant_id": row["id"],
+                "kind": kind,
+                "due_at": row[field],
+                "name": row["name"],
+                "email": row["email"],
+                "manager_email": row["manager_email"],
+                "unit": row["unit"],
+                "monthly_rent": row["monthly_rent"],
+            }
+            for row in rows
+        ]
+
+
+def reminder_text(reminder) -> tuple[str, str]:
+    due = f"{reminder['due_at']:%B %d, %Y}"
+    if reminder["kind"] == ReminderLog.LEASE_EXPIRY:
+        return (
+            f"Your lease ends on {due}",
+            f"Dear {reminder['name']},\n\nthe lease of unit {reminder['unit'] or '-'} ends on {due}. "
+            "Please contact your lease manager to renew it.\n",
+        )
+    return (
+        f"Rent due on {due}",
+        f"Dear {reminder['name']},\n\nyour rent of {reminder['monthly_rent']} is due on {due}.\n",
+    )
+
+
+class EmailSink:
+    """Delivers reminders through a Django email backend
+
+    Every delivery worker keeps one backend connection open for the whole run.
+    Tenants without an email address are reminded through
+    settings.REMINDER_DEFAULT_RECIPIENT, the lease manager is copied.
+
+    Args:
+        backend: dotted path of the email backend, settings.EMAIL_BACKEND by default
+    """
+    # messages handed to the backend per send_messages() call
+    batch_size = 100
+
+    def __init__(self, backend=None):
+        self.backend = backend
+        self.default_recipient = getattr(settings, "REMINDER_DEFAULT_RECIPIENT", settings.DEFAULT_FROM_EMAIL)
+
+    def open(self):
+        connection = get_connection(self.backend)
+        connection.open()
+        return connection
+
+    def send(self, connection, batch) -> None:
+        messages = []
+        for reminder in batch:
+            subject, body = reminder_text(reminder)
+            messages.append(EmailMessage(
+                subject,
+                body,
+                to=[reminder["email"] or self.default_recipient],
+                cc=[reminder["manager_email"]] if reminder["manager_email"] else [],
+            ))
+        connection.send_messages(messages)
+
+    def close(self, connection) -> None:
+        connection.close()
+
+
+class WebhookSink:
+    """Delivers reminders as JSON POSTs of up to batch_size reminders to a URL
+
+    Any status other than 2xx fails the whole batch, which is retried by the next run.
+    """
+    batch_size = 500
+
+    def __init__(self, url, timeout=10):
+        self.url = url
+        self.timeout = timeout
+
+    def open(self):
+        return None
+
+    def send(self, connection, batch) -> None:
+        payload = []
+        for reminder in batch:
+            subject, body = reminder_text(reminder)
+            payload.append({**reminder, "subject": subject, "body": body})
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps({"reminders": payload}, default=str).encode(),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout):
+            pass
+
+    def close(self, connection) -> None:
+        pass
+
+
+# delivers the reminders of a chunk with `concurrency` workers on an event loop
+# the sinks are blocking (SMTP, urllib), so every worker runs them in its own thread
+# a worker whose sink.open() fails stops, the others deliver the rest of the queue;
+# the batches no worker could take (every open failed) are failed
+# returns the delivered and the failed reminders
+async def deliver(reminders, sink, concurrency=REMINDER_CONCURRENCY):
+    queue = asyncio.Queue()
+    for start in range(0, len(reminders), sink.batch_size):
+        queue.put_nowait(reminders[start:start + sink.batch_size])
+
+    loop = asyncio.get_running_loop()
+    delivered, failed = [], []
+
+    async def worker(executor):
+        try:
+            connection = await loop.run_in_executor(executor, sink.open)
+        except Exception:
+            logger.exception("A reminder delivery worker could not open its connection.")
+            return
+        try:
+            while not queue.empty():
+                batch = queue.get_nowait()
+                try:
+                    await loop.run_in_executor(executor, sink.send, connection, batch)
+                except Exception:
+                    failed.extend(batch)
+                else:
+                    delivered.extend(batch)
+        finally:
+            await loop.run_in_executor(executor, sink.close, connection)
+
+    workers = min(concurrency, queue.qsize())
+    if workers:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # an error closing a connection must not lose the batches the other workers delivered
+            results = await asyncio.gather(*(worker(executor) for _ in range(workers)), return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error("A reminder delivery worker failed.", exc_info=result)
+    while not queue.empty():
+        failed.extend(queue.get_nowait())
+    return delivered, failed
+
+
+# finds, delivers and logs every due reminder, chunk by chunk
+# a failed delivery is not logged, so it is retried by the next run
+# dry_run only counts the due reminders
+def send_reminders(sink, now=None, lease_days=LEASE_REMINDER_DAYS, payment_days=PAYMENT_REMINDER_DAYS,
+                   batch_size=REMINDER_BATCH_SIZE, concurrency=REMINDER_CONCURRENCY,
+                   dry_run=False, log=None, database="default") -> dict:
+    now = now or timezone.now()
+    stats = {}
+    for kind, days in ((ReminderLog.LEASE_EXPIRY, lease_days), (ReminderLog.PAYMENT_DUE, payment_days)):
+        stats[kind] = {"due": 0, "sent": 0, "failed": 0}
+        for reminders in iter_due_reminders(kind, now, days, batch_size, database):
+            stats[kind]["due"] += len(reminders)
+            if dry_run:
+                continue
+
+            delivered, failed = asyncio.run(deliver(reminders, sink, concurrency))
+            ReminderLog.objects.using(database).bulk_create(
+                [
+                    ReminderLog(tenant_id=r["tenant_id"], kind=kind, due_at=r["due_at"], sent_at=now)
+                    for r in delivered
+                ],
+                batch_size=batch_size,
+                ignore_conflicts=True,
+            )
+            stats[kind]["sent"] += len(delivered)
+            stats[kind]["failed"] += len(failed)
+            if log:
+                log(f"{kind}: {len(delivered)} sent, {len(failed)} failed")
+    return stats
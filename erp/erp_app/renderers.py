@@ -0,0 +1,46 @@
+import datetime
+import decimal
+import json
+
+from rest_framework.renderers import BaseRenderer
+
+# orjson is optional, the standard json module is used without it
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# the same representations as the DRF fields: decimals as strings,
+# aware datetimes in ISO 8601 with "Z" for UTC
+def encode_default(value):
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    if isinstance(value, datetime.datetime):
+        return value.isoformat().replace("+00:00", "Z")
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(data) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data, default=encode_default, option=orjson.OPT_UTC_Z)
+    return json.dumps(data, default=encode_default, separators=(",", ":")).encode()
+
+
+class FastJSONRenderer(BaseRenderer):
+    """Compact JSON renderer for plain dicts and lists, orjson when installed
+
+    Meant for the rows built by SparseFieldsMixin.values_rows(), which are
+    already plain Python values, so there is no indentation or browsable
+    API handling.
+    """
+    media_type = "application/json"
+    format = "json"
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return dumps(data)
@@ -0,0 +1,117 @@
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import django
+from django.db import connections
+from django.utils import timezone
+
+# output formats of the month end reports
+REPORT_FORMATS = ("csv", "json")
+
+# columns of every report, in file order
+REPORT_COLUMNS = {
+    "lease_expiry": ["tenant_id", "name", "unit", "lease_end", "monthly_rent"],
+    "overdue": ["tenant_id", "name", "unit", "next_payment_due", "monthly_rent"],
+    "revenue": ["property_id", "address", "property_type", "tenant_count", "total_rent"],
+}
+
+# every lease manager is one task of a ProcessPoolExecutor. a worker must not reuse a
+# database connection inherited from its parent, so the parent closes its connections
+# before the pool starts and every worker opens its own on first use. the models are
+# imported inside the tasks, so the workers also run with the "spawn" start method
+def init_worker():
+    django.setup()
+    connections.close_all()
+
+
+# the rows of the three reports of a single lease manager, a few queries each
+def manager_report_rows(lease_manager, start: datetime, end: datetime) -> dict:
+    from .models import Property, Tenant
+
+    expiring = lease_manager.generate_lease_expiry_report(start, end, None).order_by("lease_end", "id")
+    overdue = Tenant.objects.for_manager(lease_manager).filter(
+        next_payment_due__lt=timezone.now(),
+    ).order_by("next_payment_due", "id")
+    revenue = Property.objects.for_manager(lease_manager).with_stats().order_by("id")
+
+    return {
+        "lease_expiry": list(expiring.values_list("id", "name", "unit", "lease_end", "monthly_rent")),
+        "overdue": list(overdue.values_list("id", "name", "unit", "next_payment_due", "monthly_rent")),
+        "revenue": list(revenue.values_list("id", "address", "property_type", "tenant_count", "total_rent")),
+    }
+
+
+def write_csv(path, columns, rows) -> None:
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(columns)
+        writer.writerows(rows)
+
+
+# generates and writes the reports of one lease manager, runs inside a worker process
+# csv: one file per report, json: a single file with every report
+# returns the manager, the written files, the number of rows and the time spent
+def generate_manager_reports(manager_id: int, start: datetime, end: datetime,
+                             output_dir: str, fmt: str = "csv") -> dict:
+    from .shards import get_manager
+
+    started = time.perf_counter()
+    lease_manager = get_manager(manager_id)
+    reports = manager_report_rows(lease_manager, start, end)
+
+    files = []
+    if fmt == "csv":
+        for name, rows in reports.items():
+            path = os.path.join(output_dir, f"manager_{manager_id}_{name}.csv")
+            write_csv(path, REPORT_COLUMNS[name], rows)
+            files.append(path)
+    else:
+        path = os.path.join(output_dir, f"manager_{manager_id}.json")
+        with open(path, "w") as file:
+            json.dump({
+                "lease_manager": {"id": lease_manager.id, "name": lease_manager.name},
+                "start": start.isoformat(),
+                "end": end.isoformat(),
+                **{
+                    name: [dict(zip(REPORT_COLUMNS[name], row)) for row in rows]
+                    for name, rows in reports.items()
+                },
+            }, file, default=str, indent=2)
+        files.append(path)
+
+    return {
+        "manager_id": manager_id,
+        "name": lease_manager.name,
+        "files": files,
+        "rows": sum(len(rows) for rows in reports.values()),
+        "seconds": time.perf_counter() - started,
+    }
+
+
+# fans the reports of the lease managers out over `workers` processes
+# workers=1 runs every manager in this process, without a pool
+# yields the result of every manager as soon as it is done
+def generate_reports(manager_ids, start: datetime, end: datetime, output_dir: str,
+                     fmt: str = "csv", workers=None):
+    if fmt not in REPORT_FORMATS:
+        raise ValueError(f"Unknown report format: {fmt}")
+    os.makedirs(output_dir, exist_ok=True)
+
+    if workers == 1:
+        for manager_id in manager_ids:
+            yield generate_manager_reports(manager_id, start, end, output_dir, fmt)
+        return
+
+    # the workers must open their own connections
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+        futures = [
+            pool.submit(generate_manager_reports, manager_id, start, end, output_dir, fmt)
+            for manager_id in manager_ids
+        ]
+        for future in as_completed(futures):
+            yield future.result()
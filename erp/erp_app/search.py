@@ -0,0 +1,152 @@
+import re
+
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+# name of the SQLite FTS5 virtual table created by migration 0006
+SEARCH_TABLE = "erp_app_search"
+
+# searchable text of every indexed model
+# kind: the value stored in the "kind" column of the search table
+SEARCH_FIELDS = {
+    "tenant": ["name", "unit"],
+    "archivedtenant": ["name", "unit"],
+    "property": ["address"],
+    "unitroom": ["unit_number"],
+}
+
+# the rowid of a search document is derived from its kind and object id, so a document
+# is replaced and deleted by rowid (the kind and object_id columns are UNINDEXED,
+# filtering on them scans the whole table)
+# rowid = object_id * KIND_SLOTS + KIND_NUMBERS[kind], migration 0014 uses the same numbers
+KIND_SLOTS = 8
+KIND_NUMBERS = {
+    "tenant": 1,
+    "archivedtenant": 2,
+    "property": 3,
+    "unitroom": 4,
+}
+
+# a search term is split in words, every word is matched as a prefix
+WORD_RE = re.compile(r"\w+")
+
+
+# the FTS5 index only exists on SQLite, every other backend uses the LIKE fallback
+# every shard database has its own index of its rows (see erp_app.shards)
+def fts_enabled(database="default") -> bool:
+    return connections[database].vendor == "sqlite"
+
+
+# builds an FTS5 MATCH expression: every word quoted (no operator injection)
+# and used as a prefix, e.g. "jo sm" -> "jo"* "sm"*
+def build_match_expression(term: str) -> str:
+    return " ".join(f'"{word}"*' for word in WORD_RE.findall(term))
+
+
+def document_rowid(kind, object_id) -> int:
+    return object_id * KIND_SLOTS + KIND_NUMBERS[kind]
+
+
+# the SQL of the rowids of the rows selected by a queryset, and its params
+def _rowids_sql(queryset) -> tuple[str, list]:
+    ids_sql, ids_params = queryset.values("id").query.sql_with_params()
+    number = KIND_NUMBERS[queryset.model._meta.model_name]
+    return f"SELECT id * {KIND_SLOTS} + {number} FROM ({ids_sql})", list(ids_params)
+
+
+def _document(obj) -> str:
+    return " ".join(
+        str(getattr(obj, field) or "") for field in SEARCH_FIELDS[obj._meta.model_name]
+    )
+
+
+# adds or replaces the search document of a Tenant, Property or UnitRoom
+def index_object(obj) -> None:
+    database = obj._state.db or "default"
+    if not fts_enabled(database):
+        return
+    kind = obj._meta.model_name
+    with connections[database].cursor() as cursor:
+        cursor.execute(
+            f"INSERT OR REPLACE INTO {SEARCH_TABLE} (rowid, kind, object_id, body) VALUES (%s, %s, %s, %s)",
+            [document_rowid(kind, obj.pk), kind, obj.pk, _document(obj)],
+        )
+
+
+# removes the search document of a deleted object
+def unindex_object(obj) -> None:
+    database = obj._state.db or "default"
+    if not fts_enabled(database):
+        return
+    with connections[database].cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s",
+            [document_rowid(obj._meta.model_name, obj.pk)],
+        )
+
+
+# rebuilds the whole index of a model from the database in one statement per model
+def rebuild_index(model, using="default") -> None:
+    if not fts_enabled(using):
+        return
+    kind = model._meta.model_name
+    table = model._meta.db_table
+    body = " || ' ' || ".join(f"COALESCE({field}, '')" for field in SEARCH_FIELDS[kind])
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE kind = %s", [kind])
+        cursor.execute(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, kind, object_id, body) "
+            f"SELECT id * {KIND_SLOTS} + {KIND_NUMBERS[kind]}, %s, id, {body} FROM {table}",
+            [kind],
+        )
+
+
+# re-indexes every row of a queryset without loading it, for bulk .update() calls
+# that bypass the post_save signal
+def index_queryset(queryset) -> None:
+    if not fts_enabled(queryset.db):
+        return
+    model = queryset.model
+    kind = model._meta.model_name
+    body = " || ' ' || ".join(f"COALESCE({field}, '')" for field in SEARCH_FIELDS[kind])
+    ids_sql, ids_params = queryset.values("id").query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(
+            f"INSERT OR REPLACE INTO {SEARCH_TABLE} (rowid, kind, object_id, body) "
+            f"SELECT id * {KIND_SLOTS} + {KIND_NUMBERS[kind]}, %s, id, {body} "
+            f"FROM {model._meta.db_table} WHERE id IN ({ids_sql})",
+            [kind, *ids_params],
+        )
+
+
+# removes the search documents of every row of a queryset, before a bulk delete
+def unindex_queryset(queryset) -> None:
+    if not fts_enabled(queryset.db):
+        return
+    rowids_sql, rowids_params = _rowids_sql(queryset)
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({rowids_sql})", rowids_params)
+
+
+# filters a Tenant, ArchivedTenant, Property or UnitRoom queryset down to the rows matching the term
+# an empty term returns the queryset untouched
+def search(queryset, term):
+    if not term or not WORD_RE.search(term):
+        return queryset
+
+    kind = queryset.model._meta.model_name
+
+    if fts_enabled(queryset.db):
+        return queryset.filter(id__in=RawSQL(
+            f"SELECT object_id FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s AND kind = %s",
+            [build_match_expression(term), kind],
+        ))
+
+    # LIKE fallback: every word must appear in one of the searchable fields
+    for word in WORD_RE.findall(term):
+        condition = Q()
+        for field in SEARCH_FIELDS[kind]:
+            condition |= Q(**{f"{field}__icontains": word})
+        queryset = queryset.filter(condition)
+    return queryset
@@ -1,7 +1,130 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Prefetch
 from rest_framework import serializers
-from erp_app.models import Tenant, Property
+from erp_app.models import Tenant, Property, UnitRoom, AuditEvent
+
+
+# comma separated names of a query parameter, e.g. ?fields=id,name -> {"id", "name"}
+def query_param_set(request, name):
+    if request is None or not request.query_params.get(name):
+        return None
+    return {value.strip() for value in request.query_params[name].split(",") if value.strip()}
+
+
+class SparseFieldsMixin:
+    """Serializer mixin for ?fields=a,b and ?expand=relation on the list APIs
+
+    ?fields= keeps only the listed fields (every field by default) and ?expand=
+    embeds the listed relations as nested objects. setup_queryset() applies the
+    same choice to the queryset, so unrequested columns are deferred and
+    unrequested relations and computed fields are never queried.
+
+    Attrs:
+        expandable: name -> (nested serializer class, source) of the relations ?expand= embeds
+    """
+    expandable = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # nested serializers have no request yet and keep every field
+        fields, expand = self.requested_fields(self.context.get("request"))
+        for name in list(self.fields):
+            if name not in fields:
+                self.fields.pop(name)
+        for name in expand:
+            serializer_class, source = self.expandable[name]
+            options = {"source": source} if source != name else {}
+            self.fields[name] = serializer_class(many=True, read_only=True, **options)
+
+    # the serialized fields, in Meta.fields order, and the expanded relations
+    # unknown names are a 400 rather than silently empty objects
+    @classmethod
+    def requested_fields(cls, request):
+        requested = query_param_set(request, "fields")
+        expanded = query_param_set(request, "expand") or set()
+        unknown = {
+            "fields": (requested or set()) - {*cls.Meta.fields, *cls.expandable},
+            "expand": expanded - set(cls.expandable),
+        }
+        errors = {name: f"Unknown names: {', '.join(sorted(names))}." for name, names in unknown.items() if names}
+        if errors:
+            raise serializers.ValidationError(errors)
+        expand = [name for name in cls.expandable if name in expanded]
+        fields = [name for name in cls.Meta.fields if requested is None or name in requested]
+        fields += [name for name in expand if name not in fields]
+        return fields, expand
+
+    # defers every model column that is not serialized, then lets the serializer
+    # add the prefetches and annotations of the requested fields
+    @classmethod
+    def setup_queryset(cls, queryset, request):
+        fields, expand = cls.requested_fields(request)
+        columns = {field.name for field in queryset.model._meta.concrete_fields}
+        queryset = queryset.only("id", *(name for name in fields if name in columns))
+        return cls.optimize_queryset(queryset, fields, expand)
+
+    @classmethod
+    def optimize_queryset(cls, queryset, fields, expand):
+        return queryset
+
+    # fast path of the list APIs (no ?expand=): the requested fields as plain dicts,
+    # read with .values() instead of going through the serializer fields per object
+    @classmethod
+    def values_rows(cls, queryset, request) -> list[dict]:
+        fields, _ = cls.requested_fields(request)
+        columns = {field.name for field in queryset.model._meta.concrete_fields}
+        queryset = cls.values_queryset(queryset.prefetch_related(None), fields)
+        names = [name for name in fields if name in columns or name in queryset.query.annotations]
+        rows = list(queryset.values("id", *names))
+
+        related = cls.related_values([row["id"] for row in rows], fields)
+        return [
+            {
+                name: related[name].get(row["id"], []) if name in related else row[name]
+                for name in fields
+            }
+            for row in rows
+        ]
+
+    # annotations of the computed fields read by values_rows
+    @classmethod
+    def values_queryset(cls, queryset, fields):
+        return queryset
+
+    # {field: {object id: value}} of the relation fields read by values_rows
+    @classmethod
+    def related_values(cls, ids, fields) -> dict:
+        return {}
+
+
+class UnitRoomSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UnitRoom
+        fields = [
+            "id",
+            "unit_number",
+            "property",
+            "tenant",
+        ]
+
+
+class PropertySummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Property
+        fields = [
+            "id",
+            "address",
+            "property_type",
+        ]
+
+
+class TenantSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    # UnitRoom.tenant has related_name="tenant", the rooms of a tenant are tenant.tenant
+    expandable = {
+        "unit_rooms": (UnitRoomSerializer, "tenant"),
+        "properties": (PropertySummarySerializer, "properties"),
+    }
 
-class TenantSerializer(serializers.ModelSerializer):
     class Meta:
         model = Tenant
         fields = [
@@ -14,9 +137,28 @@ class TenantSerializer(serializers.ModelSerializer):
             "unit",
         ]
 
+    @classmethod
+    def optimize_queryset(cls, queryset, fields, expand):
+        if "unit_rooms" in expand:
+            queryset = queryset.prefetch_related(Prefetch(
+                "tenant",
+                queryset=UnitRoom.objects.only(*UnitRoomSerializer.Meta.fields).order_by("unit_number"),
+            ))
+        if "properties" in expand:
+            queryset = queryset.prefetch_related(Prefetch(
+                "properties",
+                queryset=Property.objects.only(*PropertySummarySerializer.Meta.fields),
+            ))
+        return queryset
+
 
-class PropertySerializer(serializers.ModelSerializer):
+class PropertySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     occupancy_rate = serializers.SerializerMethodField()
+
+    expandable = {
+        "tenants": (TenantSerializer, "tenants"),
+        "unit_rooms": (UnitRoomSerializer, "unit_rooms"),
+    }
     
     class Meta:
         model = Property
@@ -30,5 +172,137 @@ class PropertySerializer(serializers.ModelSerializer):
             "occupancy_rate",
         ]
     
+    # annotated by optimize_queryset, computed per object otherwise
     def get_occupancy_rate(self, obj):
-        return obj.calculate_occupancy_rate()
\ No newline at end of file
+        if hasattr(obj, "occupancy_rate"):
+            return round(obj.occupancy_rate, 2)
+        return obj.calculate_occupancy_rate()
+
+    # the tenant ids (or the expanded tenants) come from a single prefetch
+    # and the occupancy rate from an annotation, only when they are requested
+    @classmethod
+    def optimize_queryset(cls, queryset, fields, expand):
+        if "tenants" in expand:
+            queryset = queryset.prefetch_related(Prefetch(
+                "tenants",
+                queryset=Tenant.objects.only(*TenantSerializer.Meta.fields),
+            ))
+        elif "tenants" in fields:
+            queryset = queryset.prefetch_related(Prefetch("tenants", queryset=Tenant.objects.only("id")))
+        if "unit_rooms" in expand:
+            queryset = queryset.prefetch_related(Prefetch(
+                "unit_rooms",
+                queryset=UnitRoom.objects.only(*UnitRoomSerializer.Meta.fields).order_by("unit_number"),
+            ))
+        if "occupancy_rate" in fields:
+            queryset = queryset.with_occupancy()
+        return queryset
+
+    @classmethod
+    def values_rows(cls, queryset, request) -> list[dict]:
+        rows = super().values_rows(queryset, request)
+        if rows and "occupancy_rate" in rows[0]:
+            for row in rows:
+                row["occupancy_rate"] = round(row["occupancy_rate"], 2)
+        return rows
+
+    @classmethod
+    def values_queryset(cls, queryset, fields):
+        if "occupancy_rate" in fields:
+            queryset = queryset.with_occupancy()
+        return queryset
+
+    # the tenant ids of every property in one query over the link table
+    @classmethod
+    def related_values(cls, ids, fields) -> dict:
+        if "tenants" not in fields:
+            return {}
+        tenants = {}
+        links = Property.tenants.through.objects.filter(property_id__in=ids).order_by("property_id", "tenant_id")
+        for property_id, tenant_id in links.values_list("property_id", "tenant_id"):
+            tenants.setdefault(property_id, []).append(tenant_id)
+        return {"tenants": tenants}
+
+
+class VacantUnitSerializer(serializers.ModelSerializer):
+    property_id = serializers.IntegerField()
+    address = serializers.CharField(source="property.address")
+    property_type = serializers.CharField(source="property.property_type")
+
+    class Meta:
+        model = UnitRoom
+        fields = [
+            "id",
+            "unit_number",
+            "property_id",
+            "address",
+            "property_type",
+        ]
+
+
+# expects a queryset annotated by with_vacant_units() and with_average_rent()
+class VacantPropertySerializer(serializers.ModelSerializer):
+    vacant_units = serializers.IntegerField()
+    average_rent = serializers.DecimalField(max_digits=14, decimal_places=2, allow_null=True)
+
+    class Meta:
+        model = Property
+        fields = [
+            "id",
+            "address",
+            "property_type",
+            "units",
+            "vacant_units",
+            "average_rent",
+        ]
+
+
+# a property and all of its unit rooms in one request, the rooms come from
+# a pattern ("A-01..A-100") or an explicit list of unit numbers
+class PropertyBulkCreateSerializer(serializers.Serializer):
+    address = serializers.CharField(max_length=200)
+    property_type = serializers.ChoiceField(choices=list(Property.PROPERTY_TYPE_CHOICES.items()), default=Property.PRIVATE)
+    units = serializers.IntegerField(required=False)
+    pattern = serializers.CharField(required=False)
+    unit_numbers = serializers.ListField(child=serializers.CharField(), required=False)
+
+    def validate(self, data):
+        if ("pattern" in data) == ("unit_numbers" in data):
+            raise serializers.ValidationError("Give either a pattern or a list of unit_numbers.")
+        if "pattern" in data:
+            try:
+                data["unit_numbers"] = UnitRoom.expand_pattern(data.pop("pattern"))
+            except DjangoValidationError as e:
+                raise serializers.ValidationError({"pattern": e.messages})
+        return data
+
+    def create(self, validated_data):
+        try:
+            return Property.objects.create_with_rooms(**validated_data)
+        except DjangoValidationError as e:
+            raise serializers.ValidationError(e.message_dict)
+
+    def to_representation(self, instance):
+        return {
+            "id": instance.id,
+            "address": instance.address,
+            "property_type": instance.property_type,
+            "units": instance.units,
+            "unit_rooms": list(instance.unit_rooms.order_by("id").values_list("unit_number", flat=True)),
+        }
+
+
+class AuditEventSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = AuditEvent
+        fields = [
+            "id",
+            "created_at",
+            "action",
+            "object_type",
+            "object_id",
+            "object_repr",
+            "property_id",
+            "actor",
+            "data",
+        ]
@@ -0,0 +1,439 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections, models, transaction
+from django.db.models import Count, DecimalField, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+
+from . import search
+from .models import (
+    ArchivedTenant, Invoice, LeaseManager, ManagerShard, Payment, Property, ReminderLog, Tenant, UnitRoom,
+)
+
+# every shard allocates the ids of its rows from its own range, shard k (its index in
+# settings.SHARD_DATABASES) from k * SHARD_ID_RANGE + 1, see reserve_id_range
+# ids stay unique across the shards, so a portfolio can move without renumbering
+# and the id of a lease manager tells the shard it was created on
+SHARD_ID_RANGE = 10 ** 12
+
+# how long a process keeps the shard map of the moved portfolios, in seconds
+SHARD_MAP_TTL = 60
+
+# rows copied per query when a portfolio moves
+MOVE_BATCH_SIZE = 2000
+
+# leases ending within this many days count as expiring in the portfolio figures
+EXPIRING_DAYS = 30
+
+# the summed figures of portfolio_rows
+PORTFOLIO_FIGURES = (
+    "property_count", "units", "occupied_units", "tenant_count", "total_rent", "overdue", "expiring",
+)
+
+# models stored on the default database only, next to the other apps (auth, sessions, admin)
+PINNED_MODELS = {"managershard", "auditevent"}
+
+_shard_map = {"loaded_at": None, "entries": {}}
+
+# the databases every entry point reads and writes:
+#   - the shard of a lease manager (database_for_manager): the manager pages, reports,
+#     forecasts and the occupancy timeline with ?manager=, move_portfolio
+#   - the shard of an object (locate): the property, tenant and unit room pages, their
+#     forms and the delete / renew / unit room views
+#   - every shard: the home dashboard, the portfolio report, the forecast of the whole
+#     portfolio, the lease manager list (a page at a time, ShardedList), the snapshot export
+#     and the commands run_billing, rollover_due_dates, send_reminders, check_occupancy,
+#     archive_tenants and rebuild_search_index (--database limits them to one)
+#   - one shard, ?database=<alias> (database_from_request, "default" when missing): the
+#     property and tenant lists, the list APIs and the typeahead pickers
+#   - the shard with the fewest lease managers (create_manager): a lease manager created
+#     from the UI, its properties move there with it
+#   - the default database only: the properties, tenants and rooms created from the UI and
+#     the bulk API (new stock starts there, create_manager and move_portfolio spread it),
+#     the occupancy timeline of the whole portfolio (without ?manager=), the audit log and
+#     the shard map
+
+
+class ShardRouter:
+    """Keeps the shard map, the audit log and the other apps on the default database
+
+    The portfolio models are not routed: a lease manager is read from its shard
+    with get_manager(), and Django keeps every object related to it (its
+    properties, their rooms and tenants) on the same database. The
+    manager-scoped helpers (Property.objects.for_manager(...) etc.) do the same
+    for the querysets. Every shard gets the portfolio tables.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != "erp_app" or model._meta.model_name in PINNED_MODELS:
+            return "default"
+        return None
+
+    db_for_write = db_for_read
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == "default" or db not in shard_databases():
+            return None
+        return app_label == "erp_app" and model_name not in PINNED_MODELS
+
+
+def shard_databases() -> list[str]:
+    return list(getattr(settings, "SHARD_DATABASES", ["default"]))
+
+
+# {manager id: database} of the portfolios moved off their id range's shard
+def shard_map() -> dict:
+    now = time.monotonic()
+    if _shard_map["loaded_at"] is None or now - _shard_map["loaded_at"] > SHARD_MAP_TTL:
+        _shard_map["entries"] = dict(ManagerShard.objects.values_list("manager_id", "database"))
+        _shard_map["loaded_at"] = now
+    return _shard_map["entries"]
+
+
+def invalidate_shard_map() -> None:
+    _shard_map["loaded_at"] = None
+
+
+def database_for_manager(manager_id) -> str:
+    databases = shard_databases()
+    if len(databases) == 1:
+        return databases[0]
+    manager_id = int(manager_id)
+    if manager_id in shard_map():
+        return shard_map()[manager_id]
+    index = (manager_id - 1) // SHARD_ID_RANGE
+    return databases[index] if 0 <= index < len(databases) else "default"
+
+
+def get_manager(manager_id) -> LeaseManager:
+    return LeaseManager.objects.using(database_for_manager(manager_id)).get(id=manager_id)
+
+
+def get_manager_or_404(manager_id) -> LeaseManager:
+    try:
+        database = database_for_manager(manager_id)
+    except (TypeError, ValueError):
+        raise Http404("No LeaseManager matches the given query.")
+    return get_object_or_404(LeaseManager.objects.using(database), id=manager_id)
+
+
+# the database holding the row `pk` of a portfolio model: the shard of the id's range
+# first, then the others (a moved portfolio keeps its ids); None when no shard has it
+def locate(model, pk):
+    databases = shard_databases()
+    if len(databases) == 1:
+        return databases[0]
+    pk = int(pk)
+    index = (pk - 1) // SHARD_ID_RANGE
+    if 0 <= index < len(databases):
+        databases.insert(0, databases.pop(index))
+    for database in databases:
+        if model.objects.using(database).filter(pk=pk).exists():
+            return database
+    return None
+
+
+def get_object_or_404_on_shard(model, pk):
+    try:
+        database = locate(model, pk)
+    except (TypeError, ValueError):
+        database = None
+    if database is None:
+        raise Http404(f"No {model._meta.object_name} matches the given query.")
+    return get_object_or_404(model.objects.using(database), pk=pk)
+
+
+# the shard picked by ?database=<alias> of a list view, "default" when missing
+def database_from_request(request) -> str:
+    database = request.GET.get("database") or "default"
+    if database not in shard_databases():
+        raise Http404(f"{database} is not one of the shard databases.")
+    return database
+
+
+# runs fn(database) on every shard, in parallel threads by default
+# every thread opens its own connections and closes them when done
+# returns {database: result}
+def scatter(fn, databases=None, parallel=True) -> dict:
+    databases = databases or shard_databases()
+    if not parallel or len(databases) == 1:
+        return {database: fn(database) for database in databases}
+
+    def run(database):
+        try:
+            return fn(database)
+        finally:
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=len(databases)) as pool:
+        return dict(zip(databases, pool.map(run, databases)))
+
+
+# the lease managers of every shard, by id
+def all_managers() -> list[LeaseManager]:
+    managers = scatter(lambda database: list(LeaseManager.objects.using(database)), parallel=False)
+    return sorted((manager for rows in managers.values() for manager in rows), key=lambda manager: manager.id)
+
+
+class ShardedList:
+    """The rows of a queryset on every shard as one sequence, for django.core.paginator.Paginator
+
+    The rows are listed shard by shard (in the order of settings.SHARD_DATABASES), in the
+    order of the queryset within a shard. The length is one COUNT per shard, a page is
+    read with one sliced query per shard it covers, no other row is loaded.
+    """
+
+    def __init__(self, queryset):
+        self.queryset = queryset
+        self._counts = None
+
+    def counts(self) -> list[tuple[str, int]]:
+        if self._counts is None:
+            self._counts = [(database, self.queryset.using(database).count()) for database in shard_databases()]
+        return self._counts
+
+    def count(self) -> int:
+        return sum(count for _, count in self.counts())
+
+    def __len__(self) -> int:
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop, _ = index.indices(len(self))
+        rows = []
+        offset = 0
+        for database, count in self.counts():
+            if start < offset + count and stop > offset:
+                rows.extend(self.queryset.using(database)[max(start - offset, 0):stop - offset])
+            offset += count
+            if offset >= stop:
+                break
+        return rows
+
+
+# new lease managers go to the shard with the fewest managers, unless a database is given
+# the properties (unassigned, from one database) are assigned to the new manager: it is
+# created next to them and its portfolio moves to the chosen shard with move_portfolio
+# (it stays next to them when one of their tenants is shared with another portfolio)
+def create_manager(name, database=None, properties=(), **fields) -> LeaseManager:
+    if database is None:
+        counts = scatter(lambda database: LeaseManager.objects.using(database).count())
+        database = min(counts, key=counts.get)
+    properties = list(properties)
+    if not properties:
+        return LeaseManager.objects.using(database).create(name=name, **fields)
+
+    source = properties[0]._state.db
+    with transaction.atomic(using=source):
+        manager = LeaseManager.objects.using(source).create(name=name, **fields)
+        manager.properties.add(*properties)
+    if source != database:
+        try:
+            move_portfolio(manager.pk, database)
+        except ValueError:
+            return manager
+    return get_manager(manager.pk)
+
+
+# moves the id sequences of a shard's tables to the start of its id range (SQLite only)
+def reserve_id_range(database, index) -> int:
+    connection = connections[database]
+    if connection.vendor != "sqlite" or index == 0:
+        return 0
+    floor = index * SHARD_ID_RANGE
+    tables = [
+        model._meta.db_table
+        for model in apps.get_app_config("erp_app").get_models(include_auto_created=True)
+        if isinstance(model._meta.pk, models.fields.AutoFieldMixin)
+        and model._meta.model_name not in PINNED_MODELS
+    ]
+    with connection.cursor() as cursor:
+        for table in tables:
+            cursor.execute(
+                "UPDATE sqlite_sequence SET seq = %s WHERE name = %s AND seq < %s",
+                [floor, table, floor],
+            )
+            cursor.execute(
+                "INSERT INTO sqlite_sequence (name, seq) SELECT %s, %s "
+                "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = %s)",
+                [table, floor, table],
+            )
+    return len(tables)
+
+
+# per lease manager figures of one shard, one query: properties, units, occupied units,
+# tenants, the current monthly rent, tenants with an overdue payment and expiring leases
+def portfolio_rows(database) -> list[dict]:
+    now = timezone.now()
+    this_month = now.replace(day=1)
+    properties = Property.objects.filter(lease_manager=OuterRef("pk")).values("lease_manager")
+    links = Property.tenants.through.objects.filter(property__lease_manager=OuterRef("pk")).values(
+        "property__lease_manager",
+    )
+    # the same leases as Property.calculate_total_rent
+    current = links.filter(tenant__lease_end__gte=this_month).exclude(tenant__unit="")
+
+    return list(LeaseManager.objects.using(database).annotate(
+        property_count=Coalesce(Subquery(properties.annotate(total=Count("id")).values("total")), 0),
+        units=Coalesce(Subquery(properties.annotate(total=Sum("units")).values("total")), 0),
+        occupied_units=Coalesce(Subquery(properties.annotate(total=Sum("current_units")).values("total")), 0),
+        tenant_count=Coalesce(
+            Subquery(links.annotate(total=Count("tenant_id", distinct=True)).values("total")), 0,
+        ),
+        total_rent=Coalesce(
+            Subquery(current.annotate(total=Sum("tenant__monthly_rent")).values("total")),
+            Decimal(0),
+            output_field=DecimalField(max_digits=14, decimal_places=2),
+        ),
+        # the same tenants as LeaseManager.find_tenants_with_overdue_rent
+        overdue=Coalesce(Subquery(
+            links.filter(tenant__next_payment_due__lt=now).annotate(
+                total=Count("tenant_id", distinct=True),
+            ).values("total"),
+        ), 0),
+        expiring=Coalesce(Subquery(
+            links.filter(
+                tenant__lease_end__gte=now,
+                tenant__lease_end__lt=now + timedelta(days=EXPIRING_DAYS),
+            ).annotate(total=Count("tenant_id", distinct=True)).values("total"),
+        ), 0),
+    ).order_by("id").values(
+        "id", "name", "property_count", "units", "occupied_units", "tenant_count", "total_rent",
+        "overdue", "expiring",
+    ))
+
+
+# portfolio report over every shard by scatter-gather: every shard computes its rows
+# in its own thread, the rows are merged and totalled here
+def portfolio_report(parallel=True) -> dict:
+    started = time.perf_counter()
+    results = scatter(portfolio_rows, parallel=parallel)
+
+    managers = sorted(
+        ({**row, "database": database} for database, rows in results.items() for row in rows),
+        key=lambda row: row["id"],
+    )
+    totals = {
+        key: sum((row[key] for row in managers), Decimal(0) if key == "total_rent" else 0)
+        for key in PORTFOLIO_FIGURES
+    }
+    totals["occupancy_rate"] = round(totals["occupied_units"] * 100 / totals["units"], 2) if totals["units"] else 0
+    return {
+        "databases": list(results),
+        "managers": managers,
+        "totals": totals,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def _batches(ids, batch_size=MOVE_BATCH_SIZE):
+    ids = list(ids)
+    for start in range(0, len(ids), batch_size):
+        yield ids[start:start + batch_size]
+
+
+# deletes the rows of a portfolio's tables from a database, dependent rows first
+# the archived tenants are left in place, they may be linked to other portfolios too
+def _delete_portfolio_rows(database, tables) -> None:
+    for model, column, ids in reversed(tables):
+        if model is ArchivedTenant:
+            continue
+        for batch in _batches(ids):
+            rows = model.objects.using(database).filter(**{f"{column}__in": batch})
+            if model in (Property, Tenant, UnitRoom):
+                search.unindex_queryset(rows)
+            # every dependent row is in the tables, no CASCADE or signal is needed
+            rows._raw_delete(database)
+
+
+# moves a lease manager with its properties, rooms, tenants, links, invoices, payments
+# and reminders to another shard, copying the rows with their ids, then records the
+# new home in the shard map. the target commits first; when a later step fails, the
+# copy is deleted from the target again before the error is raised, the portfolio is
+# still served from the source and the move can be retried
+# raises ValueError when one of the tenants is also linked to another portfolio
+def move_portfolio(manager_id, target) -> dict:
+    if target not in shard_databases():
+        raise ValueError(f"{target} is not one of the shard databases.")
+    source = database_for_manager(manager_id)
+    if source == target:
+        return {}
+    manager = LeaseManager.objects.using(source).get(id=manager_id)
+
+    properties = Property.objects.for_manager(manager)
+    links = Property.tenants.through.objects.using(source).filter(property__in=properties)
+    rooms = UnitRoom.objects.using(source).filter(property__in=properties)
+    tenants = Tenant.objects.using(source).filter(
+        Q(id__in=links.values("tenant_id")) | Q(id__in=rooms.values("tenant_id")),
+    )
+    if (
+        Property.tenants.through.objects.using(source).filter(tenant__in=tenants).exclude(property__in=properties).exists()
+        or UnitRoom.objects.using(source).filter(tenant__in=tenants).exclude(property__in=properties).exists()
+    ):
+        raise ValueError("Some tenants are also linked to properties of another portfolio.")
+
+    property_ids = list(properties.values_list("id", flat=True))
+    tenant_ids = list(tenants.values_list("id", flat=True))
+    archive_links = ArchivedTenant.properties.through.objects.using(source).filter(property_id__in=property_ids)
+    archived_ids = list(archive_links.values_list("archivedtenant_id", flat=True).distinct())
+
+    # model, key column, ids; in insert order
+    tables = [
+        (LeaseManager, "id", [manager.id]),
+        (Property, "id", property_ids),
+        (Tenant, "id", tenant_ids),
+        (UnitRoom, "property_id", property_ids),
+        (Property.tenants.through, "property_id", property_ids),
+        (LeaseManager.properties.through, "leasemanager_id", [manager.id]),
+        (Invoice, "tenant_id", tenant_ids),
+        (Payment, "tenant_id", tenant_ids),
+        (ReminderLog, "tenant_id", tenant_ids),
+        (ArchivedTenant, "id", archived_ids),
+        (ArchivedTenant.properties.through, "property_id", property_ids),
+    ]
+
+    counts = {}
+    copied = False
+    try:
+        with transaction.atomic(using=source), transaction.atomic(using="default"):
+            with transaction.atomic(using=target):
+                for model, column, ids in tables:
+                    counts[model._meta.model_name] = 0
+                    for batch in _batches(ids):
+                        rows = model.objects.using(source).filter(**{f"{column}__in": batch}).values()
+                        # archived tenants may be linked to other portfolios too, they are copied, not moved
+                        created = model.objects.using(target).bulk_create(
+                            [model(**row) for row in rows],
+                            ignore_conflicts=model is ArchivedTenant,
+                        )
+                        counts[model._meta.model_name] += len(created)
+                for model, column, ids in ((Property, "id", property_ids), (Tenant, "id", tenant_ids),
+                                           (UnitRoom, "property_id", property_ids),
+                                           (ArchivedTenant, "id", archived_ids)):
+                    for batch in _batches(ids):
+                        search.index_queryset(model.objects.using(target).filter(**{f"{column}__in": batch}))
+            copied = True
+
+            _delete_portfolio_rows(source, tables)
+            ManagerShard.objects.update_or_create(
+                manager_id=manager.id,
+                defaults={"database": target, "moved_at": timezone.now()},
+            )
+    except Exception:
+        # the source and the shard map rolled back, the committed copy would make a retry
+        # fail on its primary keys
+        if copied:
+            with transaction.atomic(using=target):
+                _delete_portfolio_rows(target, tables)
+        raise
+    invalidate_shard_map()
+    return counts
@@ -0,0 +1,102 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import dashboard, search
+from .models import LeaseManager, ManagerShard, Property, Tenant, UnitRoom
+
+
+# the property rows display the tenant count, total rent and occupancy rate,
+# so any change to a tenant must also bump the updated_at of its properties
+# (queryset .update() skips auto_now, so the stamp is set explicitly)
+# `using` is the database of the tenant, its properties are on the same shard
+
+@receiver(post_save, sender=Tenant)
+def touch_tenant_properties(sender, instance, using, **kwargs):
+    Property.objects.using(using).filter(tenants=instance).update(updated_at=timezone.now())
+
+
+@receiver(pre_delete, sender=Tenant)
+def touch_deleted_tenant_properties(sender, instance, using, **kwargs):
+    Property.objects.using(using).filter(tenants=instance).update(updated_at=timezone.now())
+
+
+# and the tenant rows display the addresses of their properties
+
+@receiver(post_save, sender=Property)
+def touch_property_tenants_on_save(sender, instance, using, **kwargs):
+    Tenant.objects.using(using).filter(properties=instance).update(updated_at=timezone.now())
+
+
+@receiver(pre_delete, sender=Property)
+def touch_deleted_property_tenants(sender, instance, using, **kwargs):
+    Tenant.objects.using(using).filter(properties=instance).update(updated_at=timezone.now())
+
+
+# adding or removing tenants changes the rows on both sides of the relationship
+
+@receiver(m2m_changed, sender=Property.tenants.through)
+def touch_property_tenants(sender, instance, action, reverse, pk_set, using, **kwargs):
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+
+    now = timezone.now()
+    if reverse:
+        # instance is a Tenant, pk_set holds Property ids
+        tenant_ids = [instance.pk]
+        property_ids = pk_set or Property.objects.using(using).filter(tenants=instance).values_list("id", flat=True)
+    else:
+        # instance is a Property, pk_set holds Tenant ids
+        property_ids = [instance.pk]
+        tenant_ids = pk_set or instance.tenants.values_list("id", flat=True)
+
+    Property.objects.using(using).filter(id__in=list(property_ids)).update(updated_at=now)
+    Tenant.objects.using(using).filter(id__in=list(tenant_ids)).update(updated_at=now)
+
+
+# keep the search index in sync with the searchable models
+
+@receiver(post_save, sender=Tenant)
+@receiver(post_save, sender=Property)
+@receiver(post_save, sender=UnitRoom)
+def index_searchable(sender, instance, **kwargs):
+    search.index_object(instance)
+
+
+@receiver(post_delete, sender=Tenant)
+@receiver(post_delete, sender=Property)
+@receiver(post_delete, sender=UnitRoom)
+def unindex_searchable(sender, instance, **kwargs):
+    search.unindex_object(instance)
+
+
+# a deleted lease manager leaves the shard map
+@receiver(post_delete, sender=LeaseManager)
+def forget_manager_shard(sender, instance, **kwargs):
+    from . import shards
+
+    if ManagerShard.objects.filter(manager_id=instance.pk).delete()[0]:
+        shards.invalidate_shard_map()
+
+
+# any change to the portfolio marks the home view dashboard stale, a request recomputes it
+# (within dashboard.DASHBOARD_MIN_AGE of its last computation)
+# (set-based updates skip the signals, the dashboard times out or is refreshed by cron then)
+
+@receiver(post_save, sender=Tenant)
+@receiver(post_save, sender=Property)
+@receiver(post_save, sender=UnitRoom)
+@receiver(post_save, sender=LeaseManager)
+@receiver(post_delete, sender=Tenant)
+@receiver(post_delete, sender=Property)
+@receiver(post_delete, sender=UnitRoom)
+@receiver(post_delete, sender=LeaseManager)
+def expire_dashboard(sender, **kwargs):
+    dashboard.mark_changed()
+
+
+@receiver(m2m_changed, sender=Property.tenants.through)
+@receiver(m2m_changed, sender=LeaseManager.properties.through)
+def expire_dashboard_links(sender, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        dashboard.mark_changed()
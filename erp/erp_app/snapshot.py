@@ -0,0 +1,174 @@
+import csv
+import io
+import time
+import zipfile
+
+from django.db import models
+
+from . import shards
+from .models import LeaseManager, Property, Tenant, UnitRoom
+
+# pyarrow is optional, without it the snapshot is a bundle of compressed CSV files
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# rows read per query and written per Parquet row group / CSV block
+SNAPSHOT_BATCH_SIZE = 50000
+
+SNAPSHOT_FORMATS = ("parquet", "csv")
+
+# every table of the snapshot: model and exported columns
+# the two link tables hold the property/tenant and manager/property relationships
+SNAPSHOT_TABLES = {
+    "tenants": (Tenant, ["id", "name", "unit", "lease_start", "lease_end", "next_payment_due", "monthly_rent"]),
+    "properties": (Property, ["id", "address", "property_type", "units", "current_units"]),
+    "unit_rooms": (UnitRoom, ["id", "unit_number", "property_id", "tenant_id"]),
+    "lease_managers": (LeaseManager, ["id", "name"]),
+    "property_tenants": (Property.tenants.through, ["id", "property_id", "tenant_id"]),
+    "manager_properties": (LeaseManager.properties.through, ["id", "leasemanager_id", "property_id"]),
+}
+
+
+def default_format() -> str:
+    return "parquet" if pa is not None else "csv"
+
+
+# the rows of a table on every shard as lists of tuples, read by keyset pagination
+# on the id, one shard after the other
+def iter_chunks(model, columns, batch_size=SNAPSHOT_BATCH_SIZE):
+    for database in shards.shard_databases():
+        queryset = model.objects.using(database).order_by("id").values_list(*columns)
+        last_id = 0
+        while True:
+            rows = list(queryset.filter(id__gt=last_id)[:batch_size])
+            if not rows:
+                break
+            yield rows
+            last_id = rows[-1][0]
+
+
+# Arrow type of a model column, so every row group of a table has the same schema
+# (a chunk full of NULLs would otherwise be inferred as the null type)
+def arrow_type(field):
+    if isinstance(field, models.ForeignKey):
+        return pa.int64()
+    if isinstance(field, models.DecimalField):
+        return pa.decimal128(field.max_digits, field.decimal_places)
+    if isinstance(field, models.DateTimeField):
+        return pa.timestamp("us", tz="UTC")
+    if isinstance(field, models.DateField):
+        return pa.date32()
+    if isinstance(field, (models.AutoField, models.IntegerField)):
+        return pa.int64()
+    return pa.string()
+
+
+def arrow_schema(model, columns):
+    return pa.schema([
+        (column, arrow_type(model._meta.get_field(column)))
+        for column in columns
+    ])
+
+
+# the writers yield the number of rows of every chunk once it is written
+
+def write_parquet(file, model, columns, batch_size):
+    schema = arrow_schema(model, columns)
+    with pq.ParquetWriter(file, schema, compression="zstd") as writer:
+        count = 0
+        for rows in iter_chunks(model, columns, batch_size):
+            arrays = [pa.array(values, type=schema.field(i).type) for i, values in enumerate(zip(*rows))]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            count += len(rows)
+            yield len(rows)
+        if not count:
+            writer.write_table(schema.empty_table())
+
+
+def write_csv(file, model, columns, batch_size):
+    text = io.TextIOWrapper(file, encoding="utf-8", newline="", write_through=True)
+    writer = csv.writer(text)
+    writer.writerow(columns)
+    for rows in iter_chunks(model, columns, batch_size):
+        writer.writerows(rows)
+        yield len(rows)
+    # the zip member is closed by the caller
+    text.detach()
+
+
+def check_format(fmt=None) -> str:
+    fmt = fmt or default_format()
+    if fmt not in SNAPSHOT_FORMATS:
+        raise ValueError(f"Unknown snapshot format: {fmt}")
+    if fmt == "parquet" and pa is None:
+        raise ValueError("The parquet format requires pyarrow.")
+    return fmt
+
+
+# writes every table to its zip member, one member per table:
+# - parquet: <table>.parquet, zstd compressed columns (members stored as is)
+# - csv: <table>.csv, deflate (gzip) compressed
+# only one chunk of a table is held in memory at a time, yields (table, rows) per chunk.
+# the member sizes are not known up front, so they always get zip64 headers
+def write_tables(archive, fmt, batch_size):
+    for table, (model, columns) in SNAPSHOT_TABLES.items():
+        member = zipfile.ZipInfo(f"{table}.{fmt}", date_time=time.localtime()[:6])
+        if fmt == "parquet":
+            member.compress_type = zipfile.ZIP_STORED
+            writer = write_parquet
+        else:
+            member.compress_type = zipfile.ZIP_DEFLATED
+            writer = write_csv
+        with archive.open(member, "w", force_zip64=True) as file:
+            for rows in writer(file, model, columns, batch_size):
+                yield table, rows
+
+
+# writes the whole portfolio to a zip archive at `path` (or a file object)
+# returns the number of rows of every table
+def export_snapshot(path, fmt=None, batch_size=SNAPSHOT_BATCH_SIZE) -> dict:
+    fmt = check_format(fmt)
+    counts = dict.fromkeys(SNAPSHOT_TABLES, 0)
+    with zipfile.ZipFile(path, "w") as archive:
+        for table, rows in write_tables(archive, fmt, batch_size):
+            counts[table] += rows
+    return counts
+
+
+class StreamBuffer(io.RawIOBase):
+    """A write-only, unseekable file keeping what is written until it is drained
+
+    zipfile writes to an unseekable file with data descriptors after every member,
+    so the archive goes out as it is written.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+# the zip archive of export_snapshot as an iterator of bytes, for a StreamingHttpResponse
+# yields the compressed data of every chunk as soon as it is written, so a response
+# starts at once and never holds more than a chunk. the format is checked by the caller
+def stream_snapshot(fmt, batch_size=SNAPSHOT_BATCH_SIZE):
+    buffer = StreamBuffer()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for _ in write_tables(archive, fmt, batch_size):
+            data = buffer.drain()
+            if data:
+                yield data
+    yield buffer.drain()
@@ -0,0 +1,16 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from erp_app.caching import render_cached_rows
+
+register = template.Library()
+
+
+# usage: {% cached_rows page_obj "erp_app/components/rows/tenant_cells.html" "tenant" as rows %}
+# then {% for tenant, cells in rows %} ... {{ cells }} ... {% endfor %}
+@register.simple_tag
+def cached_rows(objects, template_name, context_name):
+    return [
+        (obj, mark_safe(html))
+        for obj, html in render_cached_rows(objects, template_name, context_name)
+    ]
@@ -1,3 +1,1179 @@
-from django.test import TestCase
+import threading
+import time
+from datetime import date, datetime, timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from rest_framework.pagination import PageNumberPagination
+from django.utils import timezone
+
+from . import audit, caching, dashboard, search, shards, throttling
+from .archive import archive_tenants
+from .billing import rollover_due_dates, run_billing
+from .consistency import check_occupancy
+from .forms import AddPropertyToLeaseManagerForm, LeaseManagerForm, PropertyAddTenantForm
+from .forecasting import forecast_revenue
+from .models import ArchivedTenant, AuditEvent, Invoice, LeaseManager, ManagerShard, Property, ReminderLog, Tenant, UnitRoom
+from .reminders import EmailSink, send_reminders
+from .views import TenantListAPIView
+
+# the settings cache is django_redis, the tests run on a local memory cache
+LOCMEM_CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+}
+
+
+def make_tenant(name="Tenant", days=365, rent=1000, using="default", **kwargs):
+    now = timezone.now()
+    return Tenant.objects.db_manager(using).create(
+        name=name,
+        lease_start=kwargs.pop("lease_start", now - timedelta(days=30)),
+        lease_end=kwargs.pop("lease_end", now + timedelta(days=days)),
+        monthly_rent=rent,
+        unit=kwargs.pop("unit", ""),
+        **kwargs,
+    )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RowStampTests(TestCase):
+    def test_property_save_bumps_its_tenants(self):
+        property = Property.objects.create(address="1 Main St", units=5)
+        tenant = make_tenant()
+        property.tenants.add(tenant)
+        stamp = Tenant.objects.get(pk=tenant.pk).updated_at
+
+        property.address = "2 Main St"
+        property.save()
+        self.assertGreater(Tenant.objects.get(pk=tenant.pk).updated_at, stamp)
+
+    def test_property_delete_bumps_its_tenants(self):
+        property = Property.objects.create(address="1 Main St", units=5)
+        tenant = make_tenant()
+        property.tenants.add(tenant)
+        stamp = Tenant.objects.get(pk=tenant.pk).updated_at
+
+        property.delete()
+        self.assertGreater(Tenant.objects.get(pk=tenant.pk).updated_at, stamp)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SearchIndexTests(TestCase):
+    def find(self, model, term):
+        return list(search.search(model.objects.all(), term).values_list("id", flat=True))
+
+    def test_save_replaces_the_document(self):
+        tenant = make_tenant(name="John Smith")
+        self.assertEqual(self.find(Tenant, "smi"), [tenant.pk])
+
+        tenant.name = "John Doe"
+        tenant.save()
+        self.assertEqual(self.find(Tenant, "smi"), [])
+        self.assertEqual(self.find(Tenant, "doe"), [tenant.pk])
+
+    def test_kinds_with_the_same_id_are_separate_documents(self):
+        property = Property.objects.create(address="Oak Street", units=5)
+        room = UnitRoom.objects.create(unit_number="Oak", property=property)
+        room.delete()
+        self.assertEqual(self.find(UnitRoom, "oak"), [])
+        self.assertEqual(self.find(Property, "oak"), [property.pk])
+
+    def test_queryset_index_and_unindex(self):
+        tenants = [make_tenant(name="Jane Roe"), make_tenant(name="Jane Poe")]
+        Tenant.objects.filter(name="Jane Roe").update(name="Jane Moe")
+        search.index_queryset(Tenant.objects.filter(pk=tenants[0].pk))
+        self.assertEqual(self.find(Tenant, "moe"), [tenants[0].pk])
+        self.assertEqual(self.find(Tenant, "roe"), [])
+
+        search.unindex_queryset(Tenant.objects.all())
+        self.assertEqual(self.find(Tenant, "jane"), [])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TypeaheadTests(TestCase):
+    def test_pages_of_unassigned_rows(self):
+        for i in range(25):
+            make_tenant(name=f"Tenant {i:02}")
+        Property.objects.create(address="1 Main St", units=5).tenants.add(make_tenant(name="Tenant Taken"))
+        url = reverse("typeahead_api", kwargs={"source": "tenant"})
+
+        first = self.client.get(url, {"q": "tenant"}).json()
+        self.assertEqual(len(first["results"]), 20)
+        self.assertTrue(first["has_more"])
+        second = self.client.get(url, {"q": "tenant", "page": 2}).json()
+        self.assertEqual([row["text"] for row in second["results"]], [f"Tenant {i}" for i in range(20, 25)])
+        self.assertFalse(second["has_more"])
+
+        self.assertEqual(self.client.get(url, {"q": "taken"}).json()["results"], [])
+        self.assertEqual(self.client.get(reverse("typeahead_api", kwargs={"source": "nope"})).status_code, 404)
+
+    def test_only_the_selected_options_are_rendered(self):
+        property = Property.objects.create(address="1 Main St", units=5)
+        tenants = [make_tenant(name="Jane Roe"), make_tenant(name="John Doe")]
+        form = PropertyAddTenantForm(data={"tenant": tenants[1].pk}, instance=property, property_id=property.pk)
+        html = str(form["tenant"])
+        self.assertIn("John Doe", html)
+        self.assertNotIn("Jane Roe", html)
+
+    def test_invalid_submitted_values_render_without_a_query_error(self):
+        property = Property.objects.create(address="1 Main St", units=5)
+        manager = LeaseManager.objects.create(name="Alice")
+        forms = [
+            PropertyAddTenantForm(data={"tenant": "abc"}, instance=property, property_id=property.pk),
+            AddPropertyToLeaseManagerForm(data={"properties": "abc"}, instance=manager, lease_manager=manager),
+            LeaseManagerForm(data={"name": "Bob", "properties": ["abc", str(property.pk)]}),
+        ]
+        for form in forms:
+            self.assertFalse(form.is_valid())
+            self.assertIn("<select", str(form))
+
+        response = self.client.post(
+            reverse("property_add_tenant_view", kwargs={"pk": property.pk}), {"tenant": "abc"},
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class PropertyAdminTests(TestCase):
+    def setUp(self):
+        from django.contrib.auth.models import User
+
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "secret"))
+        self.url = reverse("admin:erp_app_property_changelist")
+
+    def add_property(self, address):
+        number = address.split()[0]
+        property = Property.objects.create_with_rooms(address, [f"{number}A", f"{number}B"])
+        tenant = make_tenant(name=f"Tenant of {address}", rent=1000)
+        property.add_tenant(tenant, property.unit_rooms.get(unit_number=f"{number}A"))
+        return property
+
+    def changelist_queries(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {"o": "-5"})
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelist_query_count_does_not_grow_with_the_rows(self):
+        self.add_property("1 Main St")
+        one = self.changelist_queries()
+        for i in range(2, 6):
+            self.add_property(f"{i} Main St")
+        self.assertEqual(self.changelist_queries(), one)
+
+    def test_bulk_actions(self):
+        properties = [self.add_property("1 Main St"), self.add_property("2 Main St")]
+        manager = LeaseManager.objects.create(name="Alice")
+        ids = [p.pk for p in properties]
+
+        self.client.post(self.url, {"action": "reassign_lease_manager", "_selected_action": ids, "lease_manager": manager.pk})
+        self.assertEqual(set(manager.properties.values_list("id", flat=True)), set(ids))
+
+        Property.objects.filter(pk__in=ids).update(current_units=7)
+        self.client.post(self.url, {"action": "recount_current_units", "_selected_action": ids})
+        self.assertEqual(set(Property.objects.values_list("current_units", flat=True)), {1})
+
+        self.client.post(self.url, {"action": "release_all_units", "_selected_action": ids})
+        self.assertFalse(UnitRoom.objects.filter(tenant__isnull=False).exists())
+        self.assertFalse(Property.tenants.through.objects.exists())
+        self.assertEqual(set(Tenant.objects.values_list("unit", flat=True)), {""})
+        self.assertEqual(set(Property.objects.values_list("current_units", flat=True)), {0})
+
+
+class Interrupted(Exception):
+    pass
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class BillingRunTests(TestCase):
+    def setUp(self):
+        self.period = timezone.localdate().replace(day=1)
+        self.tenants = [make_tenant(name=f"Tenant {i}", rent=1000 + i) for i in range(5)]
+
+    def interrupt_after_first_batch(self, message):
+        raise Interrupted(message)
+
+    def test_interrupted_run_resumes_with_the_missing_tenants(self):
+        with self.assertRaises(Interrupted):
+            run_billing(self.period, batch_size=2, log=self.interrupt_after_first_batch)
+        self.assertEqual(Invoice.objects.count(), 2)
+
+        result = run_billing(self.period, batch_size=2)
+        self.assertEqual(result["created"], 3)
+        self.assertEqual(
+            sorted(Invoice.objects.values_list("tenant_id", flat=True)),
+            sorted(t.pk for t in self.tenants),
+        )
+        self.assertEqual(run_billing(self.period, batch_size=2)["created"], 0)
+        self.assertEqual(Invoice.objects.count(), 5)
+
+    def test_invoice_of_a_high_id_tenant_does_not_skip_the_lower_ones(self):
+        last = self.tenants[-1]
+        Invoice.objects.create(tenant=last, period=self.period, amount=last.monthly_rent, due_date=timezone.now())
+        self.assertEqual(run_billing(self.period)["created"], 4)
+        self.assertEqual(Invoice.objects.filter(period=self.period).count(), 5)
+
+
+# the whole portfolio forecast reads every shard in its own thread
+@override_settings(CACHES=LOCMEM_CACHES)
+class ForecastTests(TransactionTestCase):
+    databases = "__all__"
+
+    def test_property_with_two_managers_is_counted_once(self):
+        shared = Property.objects.create(address="1 Main St", units=5)
+        own = Property.objects.create(address="2 Main St", units=5)
+        unmanaged = Property.objects.create(address="3 Main St", units=5)
+        shared.tenants.add(make_tenant(rent=1000, unit="1A"))
+        own.tenants.add(make_tenant(rent=500, unit="2A"))
+        unmanaged.tenants.add(make_tenant(rent=200, unit="3A"))
+        alice = LeaseManager.objects.create(name="Alice")
+        bob = LeaseManager.objects.create(name="Bob")
+        alice.properties.add(shared, own)
+        bob.properties.add(shared)
+
+        forecast = forecast_revenue(months=1)
+        self.assertEqual(forecast["total"], [1700.0])
+        self.assertEqual(forecast["by_property"], {shared.pk: [1000.0], own.pk: [500.0], unmanaged.pk: [200.0]})
+        self.assertEqual(forecast["by_manager"], {-1: [200.0], alice.pk: [1500.0], bob.pk: [1000.0]})
+
+        self.assertEqual(bob.forecast_revenue(months=1)["by_manager"], {bob.pk: [1000.0]})
+        self.assertEqual(alice.forecast_revenue(months=1)["total"], [1500.0])
+
+    def test_first_month_matches_the_revenue_figure(self):
+        property = Property.objects.create_with_rooms("1 Main St", ["A1", "A2"])
+        manager = LeaseManager.objects.create(name="Alice")
+        manager.properties.add(property)
+        property.add_tenant(make_tenant(rent=1000), property.unit_rooms.get(unit_number="A1"))
+        # linked to the property without a room, pays no rent
+        property.tenants.add(make_tenant(rent=700))
+
+        self.assertEqual(manager.calculate_total_revenue(), 1000)
+        self.assertEqual(manager.forecast_revenue(months=1)["total"], [1000.0])
+        self.assertEqual(self.client.get(reverse("revenue-forecast-api"), {"months": 1}).json()["total"], [1000.0])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class OccupancyTimelineAPITests(TestCase):
+    def test_invalid_parameters_are_rejected(self):
+        url = reverse("occupancy-timeline-api")
+        for params in ({"start": "2024-13-45"}, {"end": "someday"}, {"property": "abc"}):
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn("error", response.json())
+
+    def test_timeline_of_a_property(self):
+        property = Property.objects.create(address="1 Main St", units=5)
+        property.tenants.add(make_tenant())
+        start = timezone.localdate()
+        response = self.client.get(reverse("occupancy-timeline-api"), {
+            "start": start.isoformat(), "end": (start + timedelta(days=2)).isoformat(), "property": property.pk,
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["property_ids"], [property.pk])
+        self.assertEqual(response.json()["counts"], [[1, 1, 1]])
+
+    def test_properties_without_leases_have_zero_rows(self):
+        leased = Property.objects.create(address="1 Main St", units=5)
+        leased.tenants.add(make_tenant())
+        empty = Property.objects.create(address="2 Main St", units=3)
+        other = Property.objects.create(address="3 Main St", units=4)
+        manager = LeaseManager.objects.create(name="Alice")
+        manager.properties.add(leased, empty)
+
+        start = timezone.localdate()
+        response = self.client.get(reverse("occupancy-timeline-api"), {
+            "start": start.isoformat(), "end": (start + timedelta(days=1)).isoformat(), "manager": manager.pk,
+        })
+        timeline = response.json()
+        self.assertEqual(timeline["property_ids"], [leased.pk, empty.pk])
+        self.assertEqual(timeline["units"], [5, 3])
+        self.assertEqual(timeline["counts"], [[1, 1], [0, 0]])
+
+        timeline = self.client.get(reverse("occupancy-timeline-api"), {"property": other.pk}).json()
+        self.assertEqual(timeline["property_ids"], [other.pk])
+        self.assertEqual(set(timeline["counts"][0]), {0})
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class LeaseIntervalTests(TestCase):
+    def setUp(self):
+        today = timezone.localdate()
+        midnight = timezone.make_aware(datetime.combine(today, datetime.min.time()))
+        self.today = today
+        self.current = make_tenant("Current")
+        self.ended = make_tenant("Ended", lease_start=midnight - timedelta(days=60), lease_end=midnight - timedelta(seconds=1))
+        self.ends_today = make_tenant("Ends today", lease_start=midnight - timedelta(days=60), lease_end=midnight)
+        self.upcoming = make_tenant("Upcoming", lease_start=midnight + timedelta(days=1), lease_end=midnight + timedelta(days=90))
+
+    def test_active_on_includes_the_whole_day(self):
+        self.assertEqual(
+            set(Tenant.objects.active_on(self.today)),
+            {self.current, self.ends_today},
+        )
+        self.assertEqual(
+            set(Tenant.objects.active_on(self.today + timedelta(days=1))),
+            {self.current, self.upcoming},
+        )
+
+    def test_overlapping_windows(self):
+        self.assertEqual(
+            set(Tenant.objects.overlapping(self.today, self.today + timedelta(days=1))),
+            {self.current, self.ends_today, self.upcoming},
+        )
+        self.assertEqual(set(Tenant.objects.overlapping(None, self.today - timedelta(days=1))), {self.current, self.ended, self.ends_today})
+        self.assertEqual(set(Tenant.objects.overlapping(self.today + timedelta(days=2), None)), {self.current, self.upcoming})
+
+    def test_api_filters(self):
+        url = reverse("tenant-api")
+        names = lambda params: {row["name"] for row in self.client.get(url, params).json()}
+        self.assertEqual(names({"active_on": self.today.isoformat()}), {"Current", "Ends today"})
+        self.assertEqual(
+            names({"active_from": self.today.isoformat(), "active_to": (self.today + timedelta(days=1)).isoformat()}),
+            {"Current", "Ends today", "Upcoming"},
+        )
+        self.assertEqual(self.client.get(url, {"active_on": "someday"}).status_code, 400)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class LeaseExpiryBucketTests(TestCase):
+    def setUp(self):
+        from .billing import add_months
+
+        self.manager = LeaseManager.objects.create(name="Alice")
+        self.property = Property.objects.create(address="1 Main St", units=5)
+        self.manager.properties.add(self.property)
+        # next month, and leases ending on its first instant, its last one and the next month's first
+        self.month = add_months(timezone.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0), 1)
+        self.next_month = add_months(self.month, 1)
+        for name, lease_end in (
+            ("First", self.month),
+            ("Last", self.next_month - timedelta(microseconds=1)),
+            ("Next", self.next_month),
+        ):
+            self.property.tenants.add(make_tenant(name, lease_end=lease_end))
+
+    def bucket(self, **params):
+        return self.client.get(reverse("lease_expiry_bucket_view", kwargs={"manager_id": self.manager.pk}), params)
+
+    def test_histogram_buckets(self):
+        response = self.client.get(reverse("lease_expiry_histogram_view", kwargs={"manager_id": self.manager.pk}))
+        totals = {entry["start"]: entry["total"] for entry in response.context["buckets"]}
+        self.assertEqual(totals, {self.month: 2, self.next_month: 1})
+
+    def test_drill_down_matches_the_bucket(self):
+        response = self.bucket(start=self.month.date().isoformat())
+        self.assertEqual([tenant.name for tenant in response.context["page_obj"]], ["First", "Last"])
+        response = self.bucket(start=self.month.date().isoformat(), bucket="week", property=self.property.pk)
+        self.assertEqual([tenant.name for tenant in response.context["page_obj"]], ["First"])
+
+    def test_invalid_parameters(self):
+        histogram = reverse("lease_expiry_histogram_view", kwargs={"manager_id": self.manager.pk})
+        self.assertRedirects(self.bucket(start="someday"), histogram)
+        self.assertRedirects(self.bucket(start=self.month.date().isoformat(), property="abc"), histogram)
+        other = Property.objects.create(address="2 Main St", units=5)
+        self.assertEqual(self.bucket(start=self.month.date().isoformat(), property=other.pk).status_code, 404)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class VacantUnitFilterTests(TestCase):
+    def setUp(self):
+        # average rents 800, 2000 and 1500 (commercial), the last property has no tenants
+        for address, rents, property_type in (
+            ("1 Main St", [600, 1000], Property.PRIVATE),
+            ("2 Main St", [2000], Property.PRIVATE),
+            ("3 Main St", [1500], Property.COMMERICIAL),
+            ("4 Main St", [], Property.PRIVATE),
+        ):
+            number = address.split()[0]
+            unit_numbers = [f"{number}{letter}" for letter in "ABC"[:len(rents) + 1]]
+            property = Property.objects.create_with_rooms(address, unit_numbers, property_type=property_type)
+            for unit_number, rent in zip(unit_numbers, rents):
+                property.add_tenant(make_tenant(rent=rent), property.unit_rooms.get(unit_number=unit_number))
+
+    def vacant(self, **params):
+        response = self.client.get(reverse("vacant-units-api"), params)
+        self.assertEqual(response.status_code, 200)
+        return [row["unit_number"] for row in response.json()["results"]]
+
+    def test_rent_band(self):
+        self.assertEqual(self.vacant(), ["1C", "2B", "3B", "4A"])
+        self.assertEqual(self.vacant(min_rent=1000), ["2B", "3B"])
+        self.assertEqual(self.vacant(max_rent=1000), ["1C"])
+        self.assertEqual(self.vacant(min_rent=800, max_rent=1500), ["1C", "3B"])
+        self.assertEqual(self.vacant(min_rent=900, max_rent=1500, property_type=Property.PRIVATE), [])
+        self.assertEqual(self.client.get(reverse("vacant-units-api"), {"min_rent": "abc"}).status_code, 400)
+
+    def test_counts_per_property_use_the_same_band(self):
+        response = self.client.get(reverse("vacant-properties-api"), {"min_rent": 800, "max_rent": 1500})
+        rows = response.json()["results"]
+        self.assertEqual([row["address"] for row in rows], ["1 Main St", "3 Main St"])
+        self.assertEqual([row["vacant_units"] for row in rows], [1, 1])
+        self.assertEqual([float(row["average_rent"]) for row in rows], [800.0, 1500.0])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ReportCommandTests(TestCase):
+    # the managers are listed from every shard
+    databases = "__all__"
+
+    def setUp(self):
+        import shutil
+        import tempfile
+
+        self.output = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output)
+        now = timezone.now()
+        self.manager = LeaseManager.objects.create(name="Alice")
+        self.other = LeaseManager.objects.create(name="Bob")
+        property = Property.objects.create_with_rooms("1 Main St", ["1A", "1B"])
+        self.manager.properties.add(property)
+        expiring = make_tenant(
+            "Expiring", rent=1200, next_payment_due=now + timedelta(days=10),
+            lease_end=timezone.make_aware(datetime(2030, 1, 31, 12)),
+        )
+        late = make_tenant("Late", rent=800, next_payment_due=now - timedelta(days=3), lease_end=now + timedelta(days=365))
+        property.add_tenant(expiring, property.unit_rooms.get(unit_number="1A"))
+        property.add_tenant(late, property.unit_rooms.get(unit_number="1B"))
+
+    def generate(self, *args):
+        from io import StringIO
+
+        from django.core.management import call_command
+
+        call_command("generate_reports", "--output", self.output, "--workers", "1", *args, stdout=StringIO())
+
+    def read_csv(self, name):
+        import csv
+
+        with open(f"{self.output}/manager_{self.manager.pk}_{name}.csv", newline="") as file:
+            return list(csv.DictReader(file))
+
+    def test_csv_reports(self):
+        import os
+
+        self.generate("--month", "2030-01", "--managers", str(self.manager.pk))
+        self.assertEqual([row["name"] for row in self.read_csv("lease_expiry")], ["Expiring"])
+        self.assertEqual([row["name"] for row in self.read_csv("overdue")], ["Late"])
+        revenue = self.read_csv("revenue")
+        self.assertEqual([(row["address"], row["tenant_count"]) for row in revenue], [("1 Main St", "2")])
+        self.assertEqual(float(revenue[0]["total_rent"]), 2000)
+        # --managers leaves the other managers out
+        self.assertFalse(os.path.exists(f"{self.output}/manager_{self.other.pk}_revenue.csv"))
+
+    def test_json_report_of_every_manager(self):
+        import json
+
+        self.generate("--month", "2029-12", "--format", "json")
+        with open(f"{self.output}/manager_{self.manager.pk}.json") as file:
+            report = json.load(file)
+        self.assertEqual(report["lease_manager"], {"id": self.manager.pk, "name": "Alice"})
+        self.assertEqual(report["lease_expiry"], [])
+        self.assertEqual([row["tenant_id"] for row in report["overdue"]], [Tenant.objects.get(name="Late").pk])
+        with open(f"{self.output}/manager_{self.other.pk}.json") as file:
+            self.assertEqual(json.load(file)["revenue"], [])
+
+    def test_invalid_options(self):
+        from django.core.management import CommandError
+
+        with self.assertRaises(CommandError):
+            self.generate("--month", "January")
+        with self.assertRaises(CommandError):
+            self.generate("--workers", "0")
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SnapshotTests(TestCase):
+    # the snapshot reads every shard
+    databases = "__all__"
+
+    def setUp(self):
+        property = Property.objects.create_with_rooms("1 Main St", ["1A", "1B"])
+        for name, unit_number in (("Jane Roe", "1A"), ("John Doe", "1B")):
+            property.add_tenant(make_tenant(name), property.unit_rooms.get(unit_number=unit_number))
+
+    def download(self, fmt):
+        import io
+        import zipfile
+
+        response = self.client.get(reverse("snapshot-api"), {"format": fmt})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertIn(f"-{fmt}.zip", response["Content-Disposition"])
+        return zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content)))
+
+    def test_csv_archive_is_streamed(self):
+        import csv
+        import io
+
+        archive = self.download("csv")
+        self.assertEqual(len(archive.namelist()), 6)
+        rows = list(csv.DictReader(io.TextIOWrapper(archive.open("tenants.csv"), encoding="utf-8")))
+        self.assertEqual([row["name"] for row in rows], ["Jane Roe", "John Doe"])
+        self.assertEqual(archive.read("unit_rooms.csv").decode().count("\n"), 3)
+
+    def test_parquet_archive(self):
+        from . import snapshot
+
+        if snapshot.pa is None:
+            self.skipTest("pyarrow is not installed")
+        import io
+
+        table = snapshot.pq.read_table(io.BytesIO(self.download("parquet").read("tenants.parquet")))
+        self.assertEqual(table.column("name").to_pylist(), ["Jane Roe", "John Doe"])
+
+    def test_chunks_are_sent_as_they_are_written(self):
+        import io
+        import zipfile
+
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        from .snapshot import SNAPSHOT_TABLES, stream_snapshot
+
+        # the first piece goes out after the first chunk, before the other tables are read
+        pieces = stream_snapshot("csv", batch_size=1)
+        with CaptureQueriesContext(connection) as queries:
+            first = next(pieces)
+        self.assertEqual(len(queries), 1)
+        archive = zipfile.ZipFile(io.BytesIO(first + b"".join(pieces)))
+        self.assertEqual(archive.namelist(), [f"{table}.csv" for table in SNAPSHOT_TABLES])
+        self.assertEqual(self.client.get(reverse("snapshot-api"), {"format": "nope"}).status_code, 400)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SparseFieldsTests(TestCase):
+    def setUp(self):
+        self.property = Property.objects.create_with_rooms("1 Main St", ["1A", "1B"])
+        self.tenant = make_tenant("Jane Roe")
+        self.property.add_tenant(self.tenant, self.property.unit_rooms.get(unit_number="1A"))
+
+    def get(self, name, **params):
+        response = self.client.get(reverse(name), params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_fields_keep_only_the_listed_columns(self):
+        self.assertEqual(self.get("tenant-api", fields="name,id"), [{"id": self.tenant.pk, "name": "Jane Roe"}])
+        self.assertEqual(
+            self.get("property-api", fields="id,tenants,occupancy_rate"),
+            [{"id": self.property.pk, "tenants": [self.tenant.pk], "occupancy_rate": 50.0}],
+        )
+
+    def test_expand_embeds_the_relations(self):
+        rows = self.get("tenant-api", fields="id", expand="unit_rooms,properties")
+        self.assertEqual(rows[0]["unit_rooms"][0]["unit_number"], "1A")
+        self.assertEqual(rows[0]["properties"], [{"id": self.property.pk, "address": "1 Main St", "property_type": Property.PRIVATE}])
+
+        rows = self.get("property-api", fields="address", expand="tenants")
+        self.assertEqual(set(rows[0]), {"address", "tenants"})
+        self.assertEqual([tenant["name"] for tenant in rows[0]["tenants"]], ["Jane Roe"])
+
+    def test_unknown_names_are_rejected(self):
+        for name, params in (
+            ("tenant-api", {"fields": "nope"}),
+            ("tenant-api", {"fields": "id,nope"}),
+            ("tenant-api", {"expand": "nope"}),
+            ("property-api", {"fields": "name"}),
+        ):
+            response = self.client.get(reverse(name), params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn(next(iter(params)), response.json())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class FastListParityTests(TestCase):
+    def setUp(self):
+        property = Property.objects.create_with_rooms("1 Main St", ["1A", "1B", "1C"])
+        Property.objects.create(address="2 Main St", units=4)
+        now = timezone.now().replace(microsecond=123456)
+        for name, rent, unit_number in (("Jane Roe", "1234.50", "1A"), ("John Doe", 999, "1B")):
+            tenant = make_tenant(name, rent=rent, lease_start=now - timedelta(days=40))
+            property.add_tenant(tenant, property.unit_rooms.get(unit_number=unit_number))
+        make_tenant("No Room", rent="0.05")
+
+    # the rows of the serializer path, rendered by DRF
+    def serialized(self, serializer_class, queryset, params):
+        import json
+
+        from rest_framework.renderers import JSONRenderer
+        from rest_framework.request import Request
+        from rest_framework.test import APIRequestFactory
+
+        request = Request(APIRequestFactory().get("/", params))
+        queryset = serializer_class.setup_queryset(queryset, request)
+        data = serializer_class(queryset, many=True, context={"request": request}).data
+        return json.loads(JSONRenderer().render(data))
+
+    def test_fast_rows_match_the_serializer(self):
+        from .serializers import PropertySerializer, TenantSerializer
+
+        for name, serializer_class, queryset, fields in (
+            ("tenant-api", TenantSerializer, Tenant.objects.order_by("id"), "id,monthly_rent,lease_start"),
+            ("property-api", PropertySerializer, Property.objects.order_by("id"), "id,tenants,occupancy_rate"),
+        ):
+            for params in ({}, {"fields": fields}):
+                with mock.patch.object(serializer_class, "values_rows", side_effect=serializer_class.values_rows) as values_rows:
+                    fast = self.client.get(reverse(name), params).json()
+                values_rows.assert_called_once()
+                self.assertEqual(
+                    sorted(fast, key=lambda row: row["id"]),
+                    self.serialized(serializer_class, queryset, params),
+                    (name, params),
+                )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TeardownTests(TestCase):
+    # a property with every unit room rented by its own tenant
+    def building(self, number, units):
+        property = Property.objects.create_with_rooms(f"{number} Main St", [f"{number}-{i}" for i in range(units)])
+        for room in property.unit_rooms.order_by("id"):
+            property.add_tenant(make_tenant(f"Tenant {room.unit_number}"), room)
+        return property
+
+    def queries(self, operation, property):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            operation(property)
+        return len(queries)
+
+    def test_delete_property(self):
+        property = self.building(1, 3)
+        tenant_ids = list(property.tenants.values_list("id", flat=True))
+        room_ids = list(property.unit_rooms.values_list("id", flat=True))
+        indexed = lambda: sorted(search.search(UnitRoom.objects.all(), "1").values_list("id", flat=True))
+        self.assertEqual(indexed(), room_ids)
+        property.delete_property()
+
+        self.assertFalse(Property.objects.filter(pk=property.pk).exists())
+        self.assertFalse(UnitRoom.objects.filter(id__in=room_ids).exists())
+        self.assertEqual(set(Tenant.objects.filter(id__in=tenant_ids).values_list("unit", flat=True)), {""})
+        self.assertEqual(indexed(), [])
+
+    def test_remove_tenant(self):
+        property = self.building(1, 3)
+        tenant = property.tenants.order_by("id").first()
+        property.remove_tenant(tenant)
+
+        self.assertEqual(property.current_units, 2)
+        self.assertFalse(property.unit_rooms.filter(tenant=tenant).exists())
+        self.assertFalse(property.tenants.filter(pk=tenant.pk).exists())
+        self.assertEqual(Tenant.objects.get(pk=tenant.pk).unit, "")
+
+    def test_remove_property_frees_the_room(self):
+        room = self.building(1, 1).unit_rooms.get()
+        self.assertEqual(self.queries(lambda room: room.remove_property(), room), 1)
+        room = UnitRoom.objects.get(pk=room.pk)
+        self.assertIsNone(room.property_id)
+        self.assertIsNone(room.tenant_id)
+
+    def test_query_counts_do_not_grow_with_the_units(self):
+        for operation in (
+            lambda property: property.delete_property(),
+            lambda property: property.remove_tenant(property.tenants.first()),
+        ):
+            small = self.queries(operation, self.building(1, 2))
+            large = self.queries(operation, self.building(2, 8))
+            self.assertEqual(small, large)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AuditRecordTests(TransactionTestCase):
+    # the events are written by transaction.on_commit, which needs real commits
+    databases = "__all__"
+
+    def setUp(self):
+        self.tenant = make_tenant("Jane Roe")
+
+    def test_written_on_commit(self):
+        from django.db import transaction
+
+        with transaction.atomic():
+            audit.record(AuditEvent.LEASE_RENEWED, self.tenant, lease_end="2030-01-01")
+            self.assertFalse(AuditEvent.objects.exists())
+        event = AuditEvent.objects.get()
+        self.assertEqual((event.object_type, event.object_id), ("tenant", self.tenant.pk))
+        self.assertEqual(event.data, {"lease_end": "2030-01-01"})
+
+    def test_discarded_on_rollback(self):
+        from django.db import transaction
+
+        with self.assertRaises(Interrupted):
+            with transaction.atomic():
+                audit.record(AuditEvent.LEASE_RENEWED, self.tenant)
+                raise Interrupted
+        self.assertFalse(AuditEvent.objects.exists())
+
+    def test_buffered_events_are_written_together(self):
+        with audit.buffered(actor="run_billing"):
+            for action in (AuditEvent.LEASE_RENEWED, AuditEvent.TENANT_DELETED):
+                audit.record(action, self.tenant)
+            self.assertFalse(AuditEvent.objects.exists())
+        self.assertEqual(
+            sorted(AuditEvent.objects.values_list("action", "actor")),
+            [(AuditEvent.LEASE_RENEWED, "run_billing"), (AuditEvent.TENANT_DELETED, "run_billing")],
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ConsistencyTests(TestCase):
+    def test_links_without_a_room_are_reported_not_repaired(self):
+        property = Property.objects.create(address="1 Main St", units=5)
+        tenant = make_tenant()
+        property.tenants.add(tenant)
+        Property.objects.filter(pk=property.pk).update(current_units=3)
+
+        result = check_occupancy(repair=True)
+        self.assertEqual(result["checks"]["orphan_links"]["count"], 1)
+        self.assertEqual(result["checks"]["current_units"]["count"], 1)
+        self.assertTrue(property.tenants.filter(pk=tenant.pk).exists())
+        self.assertEqual(Property.objects.get(pk=property.pk).current_units, 0)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CreateWithRoomsTests(TestCase):
+    def test_taken_unit_numbers_are_rejected(self):
+        Property.objects.create_with_rooms("1 Main St", ["A1", "A2"])
+        with self.assertRaises(ValidationError) as raised:
+            Property.objects.create_with_rooms("2 Main St", ["A2", "A3"])
+        self.assertEqual(raised.exception.message_dict, {"unit_numbers": ["Unit numbers already taken: A2"]})
+
+    def test_concurrent_create_is_a_validation_error(self):
+        Property.objects.create_with_rooms("1 Main St", ["A1", "A2"])
+        # the other request takes the unit number between the checks and the inserts
+        taken_errors = Property.objects.taken_errors
+        with mock.patch.object(type(Property.objects), "taken_errors", autospec=True,
+                               side_effect=[{}, taken_errors("2 Main St", ["A2", "A3"])]):
+            with self.assertRaises(ValidationError) as raised:
+                Property.objects.create_with_rooms("2 Main St", ["A2", "A3"])
+        self.assertIn("unit_numbers", raised.exception.message_dict)
+        self.assertFalse(Property.objects.filter(address="2 Main St").exists())
+
+
+# an email sink whose first `failures` connections can not be opened
+class FlakyEmailSink(EmailSink):
+    batch_size = 2
+
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+        self.lock = threading.Lock()
+
+    def open(self):
+        with self.lock:
+            self.failures -= 1
+            if self.failures >= 0:
+                raise ConnectionRefusedError("SMTP server unavailable")
+        return super().open()
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ReminderDeliveryTests(TestCase):
+    def setUp(self):
+        # leases ending in 10 days, the next payments are more than 3 days away
+        for i in range(6):
+            make_tenant(name=f"Tenant {chr(65 + i)}", days=10, email=f"tenant{i}@example.com",
+                        lease_start=timezone.now() - timedelta(days=10))
+
+    def test_a_worker_failing_to_connect_leaves_the_batches_to_the_others(self):
+        with self.assertLogs("erp_app.reminders", "ERROR"):
+            stats = send_reminders(FlakyEmailSink(failures=1), concurrency=3)
+        self.assertEqual(stats[ReminderLog.LEASE_EXPIRY], {"due": 6, "sent": 6, "failed": 0})
+        self.assertEqual(len(mail.outbox), 6)
+        self.assertEqual(ReminderLog.objects.count(), 6)
+
+    def test_batches_no_worker_could_take_are_failed_and_retried(self):
+        with self.assertLogs("erp_app.reminders", "ERROR"):
+            stats = send_reminders(FlakyEmailSink(failures=3), concurrency=3)
+        self.assertEqual(stats[ReminderLog.LEASE_EXPIRY], {"due": 6, "sent": 0, "failed": 6})
+        self.assertEqual(ReminderLog.objects.count(), 0)
+
+        stats = send_reminders(FlakyEmailSink(failures=0), concurrency=3)
+        self.assertEqual(stats[ReminderLog.LEASE_EXPIRY], {"due": 6, "sent": 6, "failed": 0})
+        self.assertEqual(len(mail.outbox), 6)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class DueDateTests(TestCase):
+    def setUp(self):
+        self.tenant = make_tenant(
+            lease_start=timezone.make_aware(datetime(2024, 1, 15)),
+            lease_end=timezone.make_aware(datetime(2024, 3, 20)),
+        )
+        for month in (1, 2, 3):
+            run_billing(date(2024, month, 1))
+
+    def pay(self, month):
+        invoice = Invoice.objects.get(tenant=self.tenant, period=date(2024, month, 1))
+        invoice.record_payment(invoice.amount)
+
+    def next_payment_due(self):
+        return Tenant.objects.get(pk=self.tenant.pk).next_payment_due
+
+    def test_payments_never_move_the_due_date_past_the_lease_end(self):
+        self.pay(1)
+        self.assertEqual(self.next_payment_due(), timezone.make_aware(datetime(2024, 2, 15)))
+        self.pay(2)
+        self.pay(3)
+        self.assertEqual(self.next_payment_due(), self.tenant.lease_end)
+
+    def test_rollover_stops_at_the_lease_end(self):
+        for month in (1, 2, 3):
+            self.pay(month)
+        Tenant.objects.filter(pk=self.tenant.pk).update(next_payment_due=timezone.make_aware(datetime(2024, 1, 15)))
+
+        result = rollover_due_dates(now=timezone.make_aware(datetime(2024, 4, 1)))
+        self.assertEqual(result["advanced"], 1)
+        self.assertEqual(self.next_payment_due(), self.tenant.lease_end)
+        self.assertEqual(rollover_due_dates(now=timezone.make_aware(datetime(2024, 4, 1)))["advanced"], 0)
+
+
+class TwoPerPage(PageNumberPagination):
+    page_size = 2
+
+
+# the dashboard is computed in a thread per shard, the rows must be committed
+@override_settings(CACHES=LOCMEM_CACHES, API_THROTTLE_RATE=None)
+class ArchiveTests(TransactionTestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        cache.clear()
+        self.property = Property.objects.create(address="1 Main St", units=5)
+        self.manager = LeaseManager.objects.create(name="Alice")
+        self.manager.properties.add(self.property)
+        long_ago = timezone.now() - timedelta(days=800)
+        self.expired = make_tenant(name="Old Tenant", rent=900, lease_start=long_ago, lease_end=long_ago + timedelta(days=30))
+        self.current = make_tenant(name="New Tenant", rent=1000)
+        self.property.tenants.add(self.expired, self.current)
+
+    def test_archiving_expires_the_cached_figures(self):
+        self.assertEqual(dashboard.get_dashboard()["totals"]["tenant_count"], 2)
+        self.assertEqual(self.manager.cached_stats()["tenant_count"], 2)
+
+        with mock.patch("erp_app.dashboard.DASHBOARD_MIN_AGE", 0):
+            self.assertEqual(archive_tenants()["archived"], 1)
+        self.assertEqual(dashboard.get_dashboard()["totals"]["tenant_count"], 1)
+        self.assertEqual(self.manager.cached_stats()["tenant_count"], 1)
+
+    def test_include_archived_rejects_expand(self):
+        archive_tenants()
+        response = self.client.get(reverse("tenant-api"), {"include_archived": "true", "expand": "properties"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("expand", response.json())
+
+    def test_include_archived_is_paginated(self):
+        archive_tenants()
+        make_tenant(name="Other Tenant", rent=500)
+        with mock.patch.object(TenantListAPIView, "pagination_class", TwoPerPage):
+            response = self.client.get(reverse("tenant-api"), {"include_archived": "true", "ordering": "-Monthly Rent"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["count"], 3)
+        self.assertEqual([row["name"] for row in response.json()["results"]], ["New Tenant", "Old Tenant"])
+        self.assertEqual(ArchivedTenant.objects.count(), 1)
+
+    def test_include_archived_pages_are_read_in_sql(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        archive_tenants()
+        make_tenant(name="Other Tenant", rent=500)
+        url = reverse("tenant-api")
+        with mock.patch.object(TenantListAPIView, "pagination_class", TwoPerPage):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, {"include_archived": "true", "ordering": "Monthly Rent", "fields": "name", "page": 2})
+        self.assertEqual(response.json()["results"], [{"name": "New Tenant", "archived": False}])
+        page = [query["sql"] for query in queries if "UNION ALL" in query["sql"] and "LIMIT" in query["sql"]]
+        self.assertEqual(len(page), 1)
+
+        # without ?ordering= the live tenants come first, then the archive, by id
+        rows = self.client.get(url, {"include_archived": "1", "fields": "id,monthly_rent"}).json()
+        self.assertEqual(rows, [
+            {"id": self.current.pk, "monthly_rent": "1000.00", "archived": False},
+            {"id": Tenant.objects.get(name="Other Tenant").pk, "monthly_rent": "500.00", "archived": False},
+            {"id": self.expired.pk, "monthly_rent": "900.00", "archived": True},
+        ])
+
+
+# the shards are tested on several SQLite databases:
+#   python manage.py test erp_app --settings=erp.settings_sharded
+# every test commits, so the threads of shards.scatter see the rows
+@skipUnless(len(settings.SHARD_DATABASES) > 1, "needs several shards, run with --settings=erp.settings_sharded")
+@override_settings(CACHES=LOCMEM_CACHES, API_THROTTLE_RATE=None)
+class ShardTests(TransactionTestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        cache.clear()
+        shards.invalidate_shard_map()
+        for index, database in enumerate(shards.shard_databases()):
+            shards.reserve_id_range(database, index)
+        self.manager = shards.create_manager("Alice", database="shard_1")
+        self.property = Property.objects.db_manager("shard_1").create_with_rooms("1 Main St", ["A1", "A2"])
+        self.manager.properties.add(self.property)
+        self.tenant = make_tenant(name="Jane Roe", using="shard_1")
+        self.property.add_tenant(self.tenant, self.property.unit_rooms.get(unit_number="A1"))
+
+    def tearDown(self):
+        shards.invalidate_shard_map()
+
+    def test_audit_events_follow_the_shard_transaction(self):
+        from django.db import transaction
+
+        with self.assertRaises(Interrupted):
+            with transaction.atomic(using="shard_1"):
+                audit.record(AuditEvent.LEASE_RENEWED, self.tenant)
+                raise Interrupted
+        with transaction.atomic(using="shard_1"):
+            audit.record(AuditEvent.TENANT_DELETED, self.tenant)
+            self.assertFalse(AuditEvent.objects.filter(action=AuditEvent.TENANT_DELETED).exists())
+        self.assertFalse(AuditEvent.objects.filter(action=AuditEvent.LEASE_RENEWED).exists())
+        self.assertEqual(AuditEvent.objects.get(action=AuditEvent.TENANT_DELETED).object_id, self.tenant.pk)
+
+    def test_ids_tell_the_shard(self):
+        self.assertGreater(self.manager.pk, shards.SHARD_ID_RANGE)
+        self.assertEqual(shards.database_for_manager(self.manager.pk), "shard_1")
+
+    def test_move_portfolio(self):
+        counts = shards.move_portfolio(self.manager.pk, "shard_2")
+        self.assertEqual(counts["property"], 1)
+        self.assertEqual(counts["unitroom"], 2)
+        self.assertEqual(shards.get_manager(self.manager.pk)._state.db, "shard_2")
+        self.assertFalse(Property.objects.using("shard_1").exists())
+        self.assertEqual(list(search.search(Tenant.objects.using("shard_2"), "roe")), [self.tenant])
+
+    def test_failed_move_leaves_no_copy_on_the_target(self):
+        with mock.patch.object(type(ManagerShard.objects), "update_or_create", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                shards.move_portfolio(self.manager.pk, "shard_2")
+        for model in (LeaseManager, Property, Tenant, UnitRoom, Property.tenants.through):
+            self.assertFalse(model.objects.using("shard_2").exists(), model)
+        self.assertEqual(shards.get_manager(self.manager.pk)._state.db, "shard_1")
+        self.assertEqual(list(search.search(Tenant.objects.using("shard_2"), "roe")), [])
+
+        # the retry does not conflict with the rows of the failed attempt
+        shards.move_portfolio(self.manager.pk, "shard_2")
+        self.assertEqual(shards.get_manager(self.manager.pk)._state.db, "shard_2")
+        self.assertTrue(Property.objects.using("shard_2").filter(pk=self.property.pk).exists())
+
+    def test_object_pages_read_the_shard_of_the_object(self):
+        response = self.client.get(reverse("property_detail", kwargs={"pk": self.property.pk}))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "1 Main St")
+
+    def test_lists_read_the_requested_shard(self):
+        response = self.client.get(reverse("tenant-api"), {"database": "shard_1"})
+        self.assertEqual([row["name"] for row in response.json()], ["Jane Roe"])
+        self.assertEqual(self.client.get(reverse("tenant-api")).json(), [])
+        self.assertEqual(self.client.get(reverse("tenant-api"), {"database": "nope"}).status_code, 404)
+
+        # the property has a lease manager, the free tenant is offered on its shard only
+        make_tenant(name="Free Tenant", using="shard_1")
+        url = reverse("typeahead_api", kwargs={"source": "tenant"})
+        response = self.client.get(url, {"database": "shard_1", "q": "free"})
+        self.assertEqual([row["text"] for row in response.json()["results"]], ["Free Tenant"])
+        self.assertEqual(self.client.get(url, {"q": "free"}).json()["results"], [])
+
+    def test_batch_jobs_run_on_every_shard(self):
+        period = timezone.localdate().replace(day=1)
+        self.assertEqual(run_billing(period, database="shard_1")["created"], 1)
+        self.assertEqual(run_billing(period)["created"], 0)
+        invoice = Invoice.objects.using("shard_1").get(tenant=self.tenant)
+
+        # the payment is recorded on the shard of the invoice
+        invoice.record_payment(invoice.amount)
+        self.assertEqual(Invoice.objects.using("shard_1").get(pk=invoice.pk).status, Invoice.PAID)
+        self.assertFalse(Invoice.objects.exists())
+
+        self.assertEqual(check_occupancy(database="shard_1")["chunks"], 2)
+
+    def test_occupancy_units_come_from_the_manager_shard(self):
+        # a property on the default database with the same id must not be picked up
+        Property.objects.create(id=self.property.pk, address="Decoy", units=99)
+        response = self.client.get(reverse("occupancy-timeline-api"), {"manager": self.manager.pk})
+        timeline = response.json()
+        self.assertEqual(timeline["property_ids"], [self.property.pk])
+        self.assertEqual(timeline["units"], [self.property.units])
+
+    def test_manager_list_pages_every_shard(self):
+        others = [shards.create_manager(f"Manager {i}", database=database)
+                  for i, database in enumerate(["default", "shard_2", "shard_3", "shard_2", "shard_3"])]
+        pages = [self.client.get(reverse("lease_manager_view"), {"page": page}).context["page_obj"] for page in (1, 2)]
+        self.assertEqual(pages[0].paginator.count, 6)
+        listed = [manager.pk for page in pages for manager in page.object_list]
+        self.assertEqual(sorted(listed), sorted([self.manager.pk, *(m.pk for m in others)]))
+        self.assertEqual(len(pages[1].object_list), 1)
+
+    def test_new_manager_is_placed_on_a_shard(self):
+        # default and shard_1 have a manager, shard_2 is the first empty shard
+        shards.create_manager("Bob", database="default")
+        property = Property.objects.create(address="2 Main St", units=3)
+        response = self.client.post(reverse("lease_manager_create_view"), {
+            "name": "Carol", "email": "carol@example.com", "properties": [property.pk],
+        })
+        self.assertEqual(response.status_code, 302)
+        carol = LeaseManager.objects.using("shard_2").get(name="Carol")
+        self.assertEqual(shards.get_manager(carol.pk)._state.db, "shard_2")
+        self.assertEqual(list(carol.properties.values_list("address", flat=True)), ["2 Main St"])
+        self.assertFalse(Property.objects.filter(pk=property.pk).exists())
+
+    def test_portfolio_forecast_reads_every_shard(self):
+        forecast = forecast_revenue(months=1)
+        self.assertEqual(forecast["total"], [float(self.tenant.monthly_rent)])
+        self.assertEqual(forecast["by_manager"], {self.manager.pk: [float(self.tenant.monthly_rent)]})
+
+
+@override_settings(CACHES=LOCMEM_CACHES, API_THROTTLE_RATE="30/min", API_THROTTLE_BURST=3)
+class ThrottleTests(TestCase):
+    def setUp(self):
+        throttling.local_buckets.clear()
+        self.now = 1_000_000.0
+        patcher = mock.patch.object(throttling.time, "time", side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_burst_then_retry_after_then_refill(self):
+        url = reverse("tenant-api")
+        for _ in range(3):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 429)
+        # one token every 2 seconds
+        self.assertEqual(response["Retry-After"], "2")
+
+        self.now += 2
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.client.get(url).status_code, 429)
+
+    def test_redis_error_falls_back_to_the_local_buckets(self):
+        class DownBuckets:
+            def take(self, *args):
+                raise throttling.RedisError("connection refused")
+
+        with mock.patch.object(throttling, "token_buckets", return_value=DownBuckets()), \
+                mock.patch.dict(throttling._redis, {"down_until": 0.0}), \
+                self.assertLogs("erp_app.throttling", "WARNING"):
+            self.assertEqual(throttling.take_token("client", 1, 1.0), (True, 0.0))
+            self.assertEqual(throttling.take_token("client", 1, 1.0), (False, 1.0))
+            self.assertGreater(throttling._redis["down_until"], time.monotonic())
+
+    def test_local_buckets_drop_the_least_recently_used(self):
+        buckets = throttling.LocalTokenBuckets(max_clients=2)
+        for key in ("a", "b", "a", "c"):
+            buckets.take(key, 3, 1.0, self.now)
+        self.assertEqual(list(buckets.buckets), ["a", "c"])
+        self.assertEqual(buckets.buckets["a"], (1, self.now))
+
+
+# the threads of single_flight run outside of the test transaction
+@override_settings(CACHES=LOCMEM_CACHES)
+class SingleFlightTests(TransactionTestCase):
+    THREADS = 8
+
+    def setUp(self):
+        cache.clear()
+        self.computed = 0
+        self.lock = threading.Lock()
+
+    def compute(self):
+        with self.lock:
+            self.computed += 1
+            value = self.computed
+        # long enough for every thread to ask for the key meanwhile
+        time.sleep(0.2)
+        return value
+
+    def stampede(self):
+        barrier = threading.Barrier(self.THREADS)
+        results = []
+
+        def request():
+            barrier.wait()
+            results.append(caching.single_flight("figures", self.compute, 60))
+
+        threads = [threading.Thread(target=request) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_one_computation_per_expiry(self):
+        # missing: everyone waits for the single computation
+        self.assertEqual(self.stampede(), [1] * self.THREADS)
+        self.assertEqual(self.computed, 1)
+
+        # past its timeout: the stale value is served while a single request recomputes it
+        entry = cache.get("figures")
+        cache.set("figures", {**entry, "expires_at": time.time() - 1}, 60)
+        self.assertEqual(sorted(set(self.stampede())), [1, 2])
+        self.assertEqual(self.computed, 2)
+
+        # marked stale by expire()
+        caching.expire("figures")
+        self.assertEqual(sorted(set(self.stampede())), [2, 3])
+        self.assertEqual(self.computed, 3)
+
+    def test_expire_waits_for_min_age_and_refresh_recomputes(self):
+        now = time.time()
+        with mock.patch.object(caching.time, "time", side_effect=lambda: now):
+            caching.single_flight("figures", self.compute, 600)
+            caching.expire("figures", min_age=30)
+            self.assertEqual(caching.single_flight("figures", self.compute, 600), 1)
+
+            now += 31
+            self.assertEqual(caching.single_flight("figures", self.compute, 600), 2)
+
+            now += 1
+            caching.expire("figures", min_age=30)
+            now += 1
+            self.assertEqual(caching.refresh("figures", self.compute, 600), 3)
+            now += 60
+            self.assertEqual(caching.single_flight("figures", self.compute, 600), 3)
+        self.assertEqual(self.computed, 3)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CacheExpiryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.computed = 0
+
+    def compute(self):
+        self.computed += 1
+        return self.computed
+
+    def test_expire_never_rewrites_the_value(self):
+        caching.single_flight("figures", self.compute, 60)
+        entry = cache.get("figures")
+        caching.expire("figures")
+        self.assertEqual(cache.get("figures"), entry)
+        self.assertEqual(caching.single_flight("figures", self.compute, 60), 2)
+        # the mark is older than the new value
+        self.assertEqual(caching.single_flight("figures", self.compute, 60), 2)
+
+    def test_a_change_during_the_computation_makes_the_value_stale(self):
+        def compute():
+            caching.expire("figures")
+            return self.compute()
+
+        caching.single_flight("figures", compute, 60)
+        self.assertEqual(caching.single_flight("figures", self.compute, 60), 2)
+
+    def test_cache_errors_do_not_break_saves(self):
+        with mock.patch.object(caching, "cache") as broken, self.assertLogs("erp_app.caching", "ERROR"):
+            broken.set.side_effect = ConnectionError
+            Property.objects.create(address="1 Main St", units=5)
+        self.assertTrue(Property.objects.exists())
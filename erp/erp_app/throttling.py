@@ -0,0 +1,175 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+# django_redis is optional, without it (or with another cache backend) every
+# process throttles its clients on its own with LocalTokenBuckets
+try:
+    from django_redis import get_redis_connection
+    from django_redis.cache import RedisCache
+    from redis.exceptions import RedisError
+except ImportError:
+    get_redis_connection = RedisCache = None
+    RedisError = OSError
+
+logger = logging.getLogger(__name__)
+
+# defaults of settings.API_THROTTLE_RATE and settings.API_THROTTLE_BURST:
+# a client may send API_THROTTLE_BURST requests at once, then the bucket refills at the rate
+# API_THROTTLE_RATE = None turns the throttling off
+THROTTLE_RATE = "120/min"
+THROTTLE_BURST = 30
+
+# seconds the local buckets stand in for Redis after a Redis error
+REDIS_RETRY_SECONDS = 30
+
+# local buckets kept, the least recently used ones are dropped beyond that
+# (a dropped client starts again with a full bucket)
+LOCAL_MAX_CLIENTS = 10000
+
+PERIODS = {"s": 1, "m": 60, "h": 60 * 60, "d": 60 * 60 * 24}
+
+# atomic take of `cost` tokens from the bucket hash KEYS[1] ({tokens, at})
+# ARGV: capacity, refill rate per second, now (unix seconds), cost
+# returns {1 if taken, seconds until enough tokens as a string}
+# the bucket expires once it would be full again, idle clients cost no memory
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local bucket = redis.call("HMGET", KEYS[1], "tokens", "at")
+local tokens = tonumber(bucket[1]) or capacity
+local at = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - at) * rate)
+local allowed = 0
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    wait = (cost - tokens) / rate
+end
+redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "at", tostring(now))
+redis.call("EXPIRE", KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(wait)}
+"""
+
+
+# "120/min" -> 2.0 tokens per second, same format as the DRF rates
+def parse_rate(rate) -> float:
+    count, _, period = rate.partition("/")
+    return int(count) / PERIODS[period.strip()[0]]
+
+
+class LocalTokenBuckets:
+    """In-process token buckets, the stand-in for Redis
+
+    Every process keeps its own buckets, so with N workers a client gets up to
+    N times the configured rate. The buckets are kept in least recently used
+    order, at most max_clients of them.
+    """
+
+    def __init__(self, max_clients=LOCAL_MAX_CLIENTS):
+        self.lock = threading.Lock()
+        self.buckets = OrderedDict()
+        self.max_clients = max_clients
+
+    def take(self, key, capacity, rate, now, cost=1) -> tuple[bool, float]:
+        with self.lock:
+            tokens, at = self.buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + max(0.0, now - at) * rate)
+            allowed = tokens >= cost
+            self.buckets[key] = (tokens - cost if allowed else tokens, now)
+            while len(self.buckets) > self.max_clients:
+                self.buckets.popitem(last=False)
+            return allowed, 0.0 if allowed else (cost - tokens) / rate
+
+    def clear(self) -> None:
+        with self.lock:
+            self.buckets.clear()
+
+
+class RedisTokenBuckets:
+    """Token buckets shared by every worker, one Redis hash per client
+
+    The buckets are taken with TOKEN_BUCKET_SCRIPT, one round trip per
+    request. Raises RedisError when Redis can not be reached.
+    """
+
+    def __init__(self, alias="default"):
+        self.alias = alias
+        self.script = None
+
+    def take(self, key, capacity, rate, now, cost=1) -> tuple[bool, float]:
+        if self.script is None:
+            self.script = get_redis_connection(self.alias).register_script(TOKEN_BUCKET_SCRIPT)
+        # Lua prints numbers with 14 digits, milliseconds are stored exactly
+        allowed, wait = self.script(keys=[key], args=[capacity, rate, round(now, 3), cost])
+        return bool(allowed), float(wait)
+
+
+local_buckets = LocalTokenBuckets()
+_redis = {"buckets": None, "down_until": 0.0}
+
+
+# Redis when the default cache is django_redis and answered recently, the local buckets otherwise
+def token_buckets():
+    if RedisCache is None or not isinstance(caches["default"], RedisCache):
+        return local_buckets
+    if time.monotonic() < _redis["down_until"]:
+        return local_buckets
+    if _redis["buckets"] is None:
+        _redis["buckets"] = RedisTokenBuckets()
+    return _redis["buckets"]
+
+
+# takes a token from the bucket of `key`, returns (allowed, seconds to wait)
+# a Redis error switches to the local buckets for REDIS_RETRY_SECONDS, the API stays up
+def take_token(key, capacity, rate, cost=1) -> tuple[bool, float]:
+    buckets = token_buckets()
+    now = time.time()
+    if buckets is local_buckets:
+        return local_buckets.take(key, capacity, rate, now, cost)
+    try:
+        return buckets.take(key, capacity, rate, now, cost)
+    except RedisError:
+        logger.warning("Redis is unavailable, API throttling is per process for %ss.", REDIS_RETRY_SECONDS)
+        _redis["down_until"] = time.monotonic() + REDIS_RETRY_SECONDS
+        return local_buckets.take(key, capacity, rate, now, cost)
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Token bucket throttling of the API, one bucket per client and scope
+
+    Signed in users are throttled per user, anonymous clients per IP address
+    (X-Forwarded-For is honoured as configured by the NUM_PROXIES setting of
+    REST_FRAMEWORK). Throttled requests get a 429 with a Retry-After header.
+    """
+    scope = "api"
+
+    def __init__(self):
+        self.wait_seconds = None
+
+    def get_cache_key(self, request, view) -> str:
+        if request.user and request.user.is_authenticated:
+            ident = f"user:{request.user.pk}"
+        else:
+            ident = f"ip:{self.get_ident(request)}"
+        return f"erp_app:throttle:{self.scope}:{ident}"
+
+    def allow_request(self, request, view) -> bool:
+        rate = getattr(settings, "API_THROTTLE_RATE", THROTTLE_RATE)
+        if rate is None:
+            return True
+        capacity = getattr(settings, "API_THROTTLE_BURST", THROTTLE_BURST)
+        allowed, self.wait_seconds = take_token(self.get_cache_key(request, view), capacity, parse_rate(rate))
+        return allowed
+
+    def wait(self):
+        return self.wait_seconds
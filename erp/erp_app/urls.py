@@ -84,9 +84,40 @@ urlpatterns = [
     # overdue rent 
     path("manager/detail/<int:manager_id>/overdue/", views.find_tenants_with_overdue_rent_view, name="find_overdue_view"),
 
+    # lease expiry histogram of the lease manager's properties and its drill-down
+    path("manager/detail/<int:manager_id>/expiries/", views.lease_expiry_histogram_view, name="lease_expiry_histogram_view"),
+    path("manager/detail/<int:manager_id>/expiries/bucket/", views.lease_expiry_bucket_view, name="lease_expiry_bucket_view"),
+
+    # revenue forecast of the lease manager's properties
+    path("manager/detail/<int:manager_id>/forecast/", views.revenue_forecast_view, name="revenue_forecast_view"),
+
     # API Endpoint
     path("api/tenant/", views.TenantListAPIView.as_view(), name="tenant-api"),
  
     # API Endpoint - Sort Property
     path("api/property/", views.PropertyListAPIView.as_view(), name="property-api"),
+    # API Endpoint - create a property and all of its unit rooms at once
+    path("api/property/bulk/", views.PropertyBulkCreateAPIView.as_view(), name="property-bulk-api"),
+
+    # API Endpoint - vacant unit rooms, and their counts per property
+    path("api/vacant_units/", views.VacantUnitListAPIView.as_view(), name="vacant-units-api"),
+    path("api/vacant_units/by_property/", views.VacantPropertyListAPIView.as_view(), name="vacant-properties-api"),
+
+    # API Endpoint - columnar snapshot of the whole portfolio (?format=parquet|csv)
+    path("api/snapshot/", views.snapshot_api_view, name="snapshot-api"),
+
+    # API Endpoint - audit trail by object, property and time range
+    path("api/audit/", views.AuditEventListAPIView.as_view(), name="audit-api"),
+
+    # API Endpoint - revenue forecast (whole portfolio or ?manager=<id>)
+    path("api/forecast/", views.revenue_forecast_api_view, name="revenue-forecast-api"),
+
+    # API Endpoint - figures of every lease manager, gathered from every shard
+    path("api/portfolio/", views.portfolio_report_api_view, name="portfolio-report-api"),
+
+    # API Endpoint - daily/weekly occupied units per property (JSON or ?format=csv)
+    path("api/occupancy/", views.occupancy_timeline_api_view, name="occupancy-timeline-api"),
+
+    # API Endpoint - options of the typeahead pickers (tenant, property)
+    path("api/typeahead/<str:source>/", views.typeahead_view, name="typeahead_api"),
 ]
@@ -1,5 +1,5 @@
 # routing and rendering
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse, reverse_lazy
 
@@ -11,8 +11,12 @@ from django.views.generic.detail import DetailView # single
 from django.views.generic import CreateView
 
 # for datetime objects (allowing timezones and parsing as datetime)
+from django.utils import timezone
 from django.utils.timezone import make_naive
-from django.utils.dateparse import parse_datetime
+from datetime import datetime, timedelta
+import csv
+from django.db.models import BooleanField, Value
+from django.utils.dateparse import parse_date, parse_datetime
 
 # import messages for alerts in template
 from django.contrib import messages
@@ -26,14 +30,35 @@ from django.views.decorators.cache import cache_page
 
 # Filters
 from django_filters.rest_framework import DjangoFilterBackend
-from erp_app.filters import TenantFilter, PropertyFilter
+from django_filters.utils import translate_validation
+from erp_app.filters import (
+    TenantFilter, PropertyFilter, VacantUnitFilter, VacantPropertyFilter, AuditEventFilter,
+)
 
 # Rest framework
-from rest_framework.generics import ListAPIView
-from erp_app.serializers import TenantSerializer, PropertySerializer
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import CreateAPIView, ListAPIView
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.response import Response
+from erp_app.renderers import FastJSONRenderer
+from erp_app.throttling import TokenBucketThrottle
+from erp_app.serializers import (
+    TenantSerializer, PropertySerializer, VacantUnitSerializer, VacantPropertySerializer,
+    PropertyBulkCreateSerializer, AuditEventSerializer,
+)
 
 # import models
-from .models import Property, Tenant, LeaseManager, UnitRoom
+from .models import Property, Tenant, LeaseManager, UnitRoom, AuditEvent, ArchivedTenant
+
+# full-text prefix search
+from . import search, shards
+
+# cached figures of the home view
+from . import dashboard
+
+# audit trail of the changes made through the views
+from . import audit
 
 # import forms
 from .forms import (
@@ -44,10 +69,29 @@ from .forms import (
 )
 
 
+# detail and update views of a property, tenant or unit room read it from the shard
+# holding it, see erp_app.shards.locate; saving it writes to the same database
+class ShardObjectMixin:
+    def get_queryset(self):
+        database = shards.locate(self.model, self.kwargs[self.pk_url_kwarg]) or "default"
+        return super().get_queryset().using(database)
+
+
+# list views show one shard, ?database=<alias> ("default" when missing)
+class ShardListMixin:
+    def get_database(self) -> str:
+        return shards.database_from_request(self.request)
+
+    def get_queryset(self):
+        return super().get_queryset().using(self.get_database())
+
+
+# the portfolio dashboard, served from the cached figures of erp_app.dashboard
 def home(request):
     return render(
         request,
-        "erp_app/index.html"
+        "erp_app/index.html",
+        {"dashboard": dashboard.get_dashboard()},
     )
 
 # add a property using forms
@@ -66,7 +110,7 @@ class PropertyCreateView(CreateView):
 
 # removes a property from a lease manager
 def property_remove_view(request, lm_id, property_id):
-    manager = get_object_or_404(LeaseManager, id=lm_id)
+    manager = shards.get_manager_or_404(lm_id)
     if request.method == "POST":
             manager.remove_property(property_id)
     
@@ -74,10 +118,10 @@ def property_remove_view(request, lm_id, property_id):
 
 
 def unit_room_delete_view(request, room_id):
-    unit_room = get_object_or_404(UnitRoom, id=room_id)
+    unit_room = shards.get_object_or_404_on_shard(UnitRoom, room_id)
     property_id = unit_room.property.id
     if request.method == "POST":
-        property = Property.objects.get(id=property_id)
+        property = unit_room.property
         property.remove_tenant(unit_room.tenant)
         unit_room.remove_property()
     
@@ -86,8 +130,8 @@ def unit_room_delete_view(request, room_id):
 
 def tenant_unit_room_remove_view(request, pk):
     try:
-        tenant = Tenant.objects.get(id=pk)
-        unit_room = UnitRoom.objects.get(unit_number=tenant.unit)
+        tenant = Tenant.objects.using(shards.locate(Tenant, pk) or "default").get(id=pk)
+        unit_room = UnitRoom.objects.using(tenant._state.db).get(unit_number=tenant.unit)
     except UnitRoom.DoesNotExist or Tenant.DoesNotExist:
         messages.warning(request, "Please Check if Tenant has a valid Unit Room!")
     if request.method == "POST":
@@ -106,14 +150,15 @@ def tenant_unit_room_remove_view(request, pk):
 
 # List of all Properties
 # @method_decorator(cache_page(60 * 15), name='dispatch')
-class PropertyListView(ListView):
+class PropertyListView(ShardListMixin, ListView):
     model = Property
     paginate_by = 5
     template_name = "erp_app/list/property_list.html"
     context_object_name = "properties"
     
     def get_queryset(self):
-        queryset = super().get_queryset()
+        # the lease manager column is rendered outside of the cached row cells
+        queryset = super().get_queryset().prefetch_related("lease_manager")
         self.filterset = PropertyFilter(self.request.GET, queryset=queryset)
         print(self.request.GET.get('ordering', ''))
         return self.filterset.qs
@@ -126,7 +171,7 @@ class PropertyListView(ListView):
 
 # Specific detail of a property
 # includes property attributes, tenants, rooms
-class PropertyDetailView(DetailView):
+class PropertyDetailView(ShardObjectMixin, DetailView):
     model = Property
     template_name = "erp_app/detail/property_detail.html"
     context_object_name = "property"
@@ -156,7 +201,7 @@ class PropertyDetailView(DetailView):
     
 
 # Add a tenant to a property
-class PropertyAddTenantView(UpdateView):
+class PropertyAddTenantView(ShardObjectMixin, UpdateView):
     model = Property
     form_class = PropertyAddTenantForm
     template_name = "erp_app/forms/property_add_tenant.html"
@@ -196,7 +241,7 @@ class PropertyAddTenantView(UpdateView):
 
 
 # Remove a tenant to a property
-class PropertyRemoveTenantView(UpdateView):
+class PropertyRemoveTenantView(ShardObjectMixin, UpdateView):
     model = Property
     form_class = PropertyRemoveTenantForm
     template_name = "erp_app/forms/property_remove_tenant.html"
@@ -231,7 +276,7 @@ class PropertyRemoveTenantView(UpdateView):
 
 
 # Add a room to a property
-class PropertyAddUnitRoomView(UpdateView):
+class PropertyAddUnitRoomView(ShardObjectMixin, UpdateView):
     model = Property
     form_class = PropertyAddUnitRoomForm
     template_name = "erp_app/forms/property_add_room.html"
@@ -291,12 +336,16 @@ class UnitRoomCreateView(CreateView):
 # Deletes a unit room in the database
 def delete_unit_room_view(request, property_id, id):
     try:
-        unit_room = get_object_or_404(UnitRoom, id=id)
+        unit_room = shards.get_object_or_404_on_shard(UnitRoom, id)
     except Exception as e:
         messages.warning(request, "Unit Room not found!")
         
     if request.method == "POST":
         if unit_room:
+            audit.record(
+                AuditEvent.ROOM_DELETED, unit_room,
+                property=unit_room.property_id, tenant_id=unit_room.tenant_id,
+            )
             unit_room.delete()
             messages.success(request, "Unit Room Successfuly deleted!")
         else:
@@ -308,7 +357,7 @@ def delete_unit_room_view(request, property_id, id):
 # deletes a property in the database 
 def property_delete_view(request, property_id):
     try:
-        property = get_object_or_404(Property, id=property_id)
+        property = shards.get_object_or_404_on_shard(Property, property_id)
     except Exception as e:
         messages.warning(request, "Property not found!")
         
@@ -325,12 +374,13 @@ def property_delete_view(request, property_id):
 # deletes the tenant object
 def tenant_delete_view(request, tenant_id):
     try:
-        tenant = get_object_or_404(Tenant, id=tenant_id)
+        tenant = shards.get_object_or_404_on_shard(Tenant, tenant_id)
     except Exception as e:
         messages.warning(request, "Tenant not found!")
         
     if request.method == "POST":
         if tenant:
+            audit.record(AuditEvent.TENANT_DELETED, tenant, unit=tenant.unit)
             tenant.delete()
             messages.success(request, "Tenant Successfuly deleted!")
         else:
@@ -341,7 +391,7 @@ def tenant_delete_view(request, tenant_id):
 
 # list of all tenants (WILL CHANGE URL TO tenant)
 
-class TenantListView(ListView):
+class TenantListView(ShardListMixin, ListView):
     model = Tenant
     # queryset = Tenant.objects.all()
     paginate_by = 5
@@ -375,7 +425,7 @@ class TenantListView(ListView):
         
 
 # Specific detail of a tenant
-class TenantDetailView(DetailView):
+class TenantDetailView(ShardObjectMixin, DetailView):
     model = Tenant
     template_name = "erp_app/detail/tenant_detail.html"
     context_object_name = "tenant"
@@ -391,7 +441,7 @@ class TenantDetailView(DetailView):
 
         if "form_add" in request.POST and form_add.is_valid():
             if self.object.unit == "":
-                unit_room = UnitRoom.objects.get(id=form_add.cleaned_data["unit_room"].id)
+                unit_room = UnitRoom.objects.using(self.object._state.db).get(id=form_add.cleaned_data["unit_room"].id)
                 unit_room.add_tenant(self.object)
                 self.object.add_unit(unit_room.unit_number)
                 messages.success(request, "Adding a Unit Room to Tenat success!")
@@ -404,7 +454,7 @@ class TenantDetailView(DetailView):
 # A VIEW FOR UPDATING THE LEASE END DATETIME OF A TENANT
 class TenantRenewLeaseView(View):
     def post(self, request, tenant_id):
-        tenant = get_object_or_404(Tenant, id=tenant_id)
+        tenant = shards.get_object_or_404_on_shard(Tenant, tenant_id)
         selected_lease_end = request.POST.get("lease_end")
         if selected_lease_end:
             extended_date = parse_datetime(selected_lease_end)
@@ -418,12 +468,13 @@ class LeaseManagerCreateView(CreateView):
     model = LeaseManager
     form_class = LeaseManagerForm
     template_name = "erp_app/forms/lease_manager_form.html"
+    success_url = reverse_lazy("lease_manager_view")
     
     
 # delete a lease manager
 def lease_manager_remove_view(request, id):
     try:
-        lease_manager = get_object_or_404(LeaseManager, id=id)
+        lease_manager = shards.get_manager_or_404(id)
     except Exception as e:
         messages.warning(request, "Lease Manager not found!")
         
@@ -452,7 +503,8 @@ def lease_manager_view(request):
     else:
         form = LeaseManagerForm(prefix="form")
 
-    lease_manager = LeaseManager.objects.all().order_by("id")  # Get all LeaseManager instances
+    # the lease managers of every shard, only the rows of the page are read
+    lease_manager = shards.ShardedList(LeaseManager.objects.order_by("id"))
     properties = Property.objects.all()  # Get all Property instances
     paginator = Paginator(lease_manager, 5)
     page_number = request.GET.get("page")
@@ -468,7 +520,7 @@ def lease_manager_view(request):
 
 def generate_report_view(request, id):
     print("in report ")
-    property = get_object_or_404(Tenant, id=id)
+    property = shards.get_object_or_404_on_shard(Tenant, id)
     return render(
         request,
         "erp_app/reports/property_report.html",
@@ -483,14 +535,18 @@ class LeaseManagerDetailView(DetailView):
     template_name = "erp_app/detail/manager_detail.html"
     context_object_name = "manager"
 
+    # the manager is read from its shard, its properties follow it
+    def get_object(self, queryset=None):
+        return shards.get_manager_or_404(self.kwargs["pk"])
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         # add a key form to the context with this specific form
         context['form'] = GenerateLeaseExpiryReportForm(lease_manager=self.object, prefix="form")
         # add a key form_add to the context with this specific form
         context["form_add"] = AddPropertyToLeaseManagerForm(lease_manager=self.object, prefix="form_add")
-        # add the total revenue to the context
-        context["total_revenue"] = self.get_object().calculate_total_revenue()
+        # add the total revenue to the context, cached and recomputed by one request at a time
+        context["total_revenue"] = self.object.cached_stats()["total_revenue"]
         self.get_object().find_tenants_with_overdue_rent()
         # add a page_obj to the context for pagination
         context["page_obj"] = self.get_paginated_properties()
@@ -545,9 +601,12 @@ class LeaseManagerDetailView(DetailView):
         return self.render_to_response(self.get_context_data(form=form))
     
 # find the vacant properties of a lease manager
+# vacancies are counted from the unit rooms and paginated by the database
 def find_vacant_units_view(request, manager_id):
-    lease_manager = LeaseManager.objects.get(id=manager_id)
-    property = lease_manager.find_vacant_units()
+    lease_manager = shards.get_manager_or_404(manager_id)
+    property = lease_manager.vacant_units_by_property().with_stats().prefetch_related(
+        "lease_manager",
+    ).order_by("-vacant_units", "id")
     paginator = Paginator(property, 10)
     page_number = request.GET.get("page")
     page_obj = paginator.get_page(page_number)
@@ -561,7 +620,7 @@ def find_vacant_units_view(request, manager_id):
 # find the tenants under a specific lease manager with overdue rent
 # overdue rent is based on a hypothetical due date which is same-day pay per month 
 def find_tenants_with_overdue_rent_view(request, manager_id):
-    lease_manager = LeaseManager.objects.get(id=manager_id)
+    lease_manager = shards.get_manager_or_404(manager_id)
     tenants = lease_manager.find_tenants_with_overdue_rent()
     paginator = Paginator(tenants, 10)
     page_number = request.GET.get("page")
@@ -573,6 +632,201 @@ def find_tenants_with_overdue_rent_view(request, manager_id):
         { "page_obj": page_obj,},
     )
     
+# how many leases end per week or month over the next two years (?bucket=week|month)
+# per property type and per property, every bucket links to its lease expiry report
+def lease_expiry_histogram_view(request, manager_id):
+    from .billing import add_months
+
+    lease_manager = shards.get_manager_or_404(manager_id)
+    bucket = request.GET.get("bucket", "month")
+    if bucket not in LeaseManager.EXPIRY_BUCKETS:
+        bucket = "month"
+    start = timezone.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    end = add_months(start, 24)
+
+    buckets = {}
+    for row in lease_manager.lease_expiry_histogram(start, end, bucket=bucket):
+        entry = buckets.setdefault(row["bucket"], {
+            "start": row["bucket"],
+            "total": 0,
+            "by_type": dict.fromkeys(Property.PROPERTY_TYPE_CHOICES, 0),
+            "properties": [],
+        })
+        entry["total"] += row["leases"]
+        entry["by_type"][row["property__property_type"]] += row["leases"]
+        entry["properties"].append(row)
+
+    # bar width of every bucket relative to the biggest one
+    peak = max((entry["total"] for entry in buckets.values()), default=0)
+    for entry in buckets.values():
+        entry["width"] = round(entry["total"] * 100 / peak) if peak else 0
+        entry["by_type"] = list(entry["by_type"].items())
+
+    return render(
+        request,
+        "erp_app/reports/lease_expiry_histogram.html",
+        {
+            "manager": lease_manager,
+            "bucket": bucket,
+            "buckets": list(buckets.values()),
+            "property_types": list(Property.PROPERTY_TYPE_CHOICES.values()),
+        },
+    )
+
+
+# drill-down of a histogram bucket: ?bucket=week|month&start=YYYY-MM-DD[&property=<id>]
+# rendered with the existing lease expiry report page
+def lease_expiry_bucket_view(request, manager_id):
+    from .billing import add_months
+
+    lease_manager = shards.get_manager_or_404(manager_id)
+    start_date = parse_date(request.GET.get("start", ""))
+    if start_date is None:
+        messages.error(request, "Please select a valid bucket!")
+        return redirect("lease_expiry_histogram_view", manager_id=manager_id)
+
+    start = datetime.combine(start_date, datetime.min.time())
+    if request.GET.get("bucket") == "week":
+        end = start + timedelta(days=7)
+    else:
+        end = add_months(start, 1)
+
+    properties = None
+    if request.GET.get("property"):
+        try:
+            property_id = int(request.GET["property"])
+        except ValueError:
+            messages.error(request, "Please select a valid property!")
+            return redirect("lease_expiry_histogram_view", manager_id=manager_id)
+        properties = get_object_or_404(lease_manager.properties, id=property_id)
+
+    tenants = lease_manager.generate_lease_expiry_report(
+        start_lease_date=start,
+        end_lease_date=end - timedelta(microseconds=1),
+        properties=properties,
+    ).order_by("lease_end", "id")
+
+    paginator = Paginator(tenants, 10)
+    page_obj = paginator.get_page(request.GET.get("page"))
+    return render(
+        request,
+        "erp_app/reports/property_report.html",
+        {
+            "page_obj": page_obj,
+            "lease_manager_id": lease_manager.id,
+        },
+    )
+
+
+# reads the months and renewal_probability query parameters of the forecast views
+def get_forecast_params(request) -> dict:
+    try:
+        months = int(request.GET.get("months", 12))
+    except ValueError:
+        months = 12
+    try:
+        renewal_probability = float(request.GET.get("renewal_probability", 0))
+    except ValueError:
+        renewal_probability = 0.0
+    return {"months": months, "renewal_probability": renewal_probability}
+
+
+# month by month revenue forecast of a lease manager's properties
+def revenue_forecast_view(request, manager_id):
+    lease_manager = shards.get_manager_or_404(manager_id)
+    forecast = lease_manager.forecast_revenue(**get_forecast_params(request))
+    properties = Property.objects.using(lease_manager._state.db).in_bulk(list(forecast["by_property"]))
+
+    return render(
+        request,
+        "erp_app/reports/revenue_forecast.html",
+        {
+            "manager": lease_manager,
+            "forecast": forecast,
+            "monthly_totals": list(zip(forecast["months"], forecast["total"])),
+            "property_totals": [
+                (properties[pid], round(sum(values), 2))
+                for pid, values in forecast["by_property"].items()
+            ],
+        },
+    )
+
+
+# JSON revenue forecast: ?months=12&renewal_probability=0.5[&manager=<id>]
+# without a manager the whole portfolio is forecast
+def revenue_forecast_api_view(request):
+    params = get_forecast_params(request)
+    manager_id = request.GET.get("manager")
+    if manager_id:
+        lease_manager = shards.get_manager_or_404(manager_id)
+        return JsonResponse(lease_manager.forecast_revenue(**params))
+
+    from .forecasting import forecast_revenue
+    return JsonResponse(forecast_revenue(**params))
+
+
+# properties, units, occupancy, tenants and rent of every lease manager and in total
+# computed on every shard in parallel, see erp_app.shards.portfolio_report
+def portfolio_report_api_view(request):
+    return JsonResponse(shards.portfolio_report())
+
+
+# reads an optional YYYY-MM-DD query parameter, None when it is missing
+# raises ValueError when it is malformed or not a valid date (e.g. 2024-13-45)
+def get_date_param(request, name):
+    value = request.GET.get(name)
+    if not value:
+        return None
+    date = parse_date(value)
+    if date is None:
+        raise ValueError(f"{name} is not a YYYY-MM-DD date.")
+    return date
+
+
+# occupied units per property over a date range, for charts and exports
+# ?start=YYYY-MM-DD&end=YYYY-MM-DD&step=day|week[&manager=<id>][&property=<id>][&format=csv]
+def occupancy_timeline_api_view(request):
+    from .occupancy import occupancy_timeline
+
+    try:
+        start = get_date_param(request, "start") or timezone.localdate()
+        end = get_date_param(request, "end") or start + timedelta(days=90)
+        property_id = int(request.GET["property"]) if request.GET.get("property") else None
+    except ValueError:
+        return JsonResponse({"error": "start and end must be valid YYYY-MM-DD dates, property a property id."}, status=400)
+
+    lease_manager = None
+    if request.GET.get("manager"):
+        lease_manager = shards.get_manager_or_404(request.GET["manager"])
+    properties = None
+    if property_id is not None:
+        # a property is looked up on the manager's shard
+        database = lease_manager._state.db if lease_manager is not None else "default"
+        properties = Property.objects.using(database).filter(id=property_id)
+
+    try:
+        timeline = occupancy_timeline(
+            start,
+            end,
+            step=request.GET.get("step", "day"),
+            properties=properties,
+            lease_manager=lease_manager,
+        )
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    if request.GET.get("format") == "csv":
+        response = HttpResponse(content_type="text/csv")
+        response["Content-Disposition"] = 'attachment; filename="occupancy.csv"'
+        writer = csv.writer(response)
+        writer.writerow(["property_id", "units", *timeline["dates"]])
+        for row in zip(timeline["property_ids"], timeline["units"], timeline["counts"]):
+            writer.writerow([row[0], row[1], *row[2]])
+        return response
+
+    return JsonResponse(timeline)
+
+
 # calculate the total revenue based off the current monthly rent of given Lease Manager's tenants
 # def calculate_total_revenue_view(manager_id):
 #     lease_manager = LeaseManager.objects.get(id=manager_id)
@@ -582,14 +836,186 @@ def find_tenants_with_overdue_rent_view(request, manager_id):
 #     return total
 
 
-class TenantListAPIView(ListAPIView):
+# both list APIs accept ?fields=id,name and ?expand=<relation>, see SparseFieldsMixin
+# JSON responses without ?expand= are built from .values() rows and rendered by
+# FastJSONRenderer, the serializers are only used for nested relations and the browsable API
+# unpaginated, so every client is throttled (429 with Retry-After once its bucket is empty)
+# one shard per request, ?database=<alias>
+class FastListAPIView(ShardListMixin, ListAPIView):
+    renderer_classes = (FastJSONRenderer, BrowsableAPIRenderer)
+    filter_backends = (DjangoFilterBackend,)
+    throttle_classes = (TokenBucketThrottle,)
+
+    def get_queryset(self):
+        return self.serializer_class.setup_queryset(super().get_queryset(), self.request)
+
+    def list(self, request, *args, **kwargs):
+        _, expand = self.serializer_class.requested_fields(request)
+        if expand or self.paginator is not None or not isinstance(request.accepted_renderer, FastJSONRenderer):
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.queryset.using(self.get_database()))
+        return Response(self.serializer_class.values_rows(queryset, request))
+
+class TenantListAPIView(FastListAPIView):
     queryset = Tenant.objects.all()
     serializer_class = TenantSerializer
-    filter_backends = (DjangoFilterBackend,)
     filterset_class = TenantFilter
 
-class PropertyListAPIView(ListAPIView):
+    # ?include_archived=true also lists the archived tenants (see erp_app.archive) for
+    # historical reports: the same filters run on both tables and every row gets an
+    # "archived" flag. always the values() path, the archive has no relations to expand,
+    # so ?expand= is a 400. both tables are read as one UNION ALL ordered by ?ordering=,
+    # then live before archived and by id, so a paginator only reads the rows of its page
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get("include_archived", "").lower() not in ("1", "true"):
+            return super().list(request, *args, **kwargs)
+
+        fields, expand = self.serializer_class.requested_fields(request)
+        if expand:
+            raise ValidationError({"expand": "The archived tenants have no relations, expand can not be used with include_archived."})
+
+        # e.g. ?ordering=-Monthly Rent -> ["-monthly_rent"]
+        param_map = self.filterset_class.base_filters["ordering"].param_map
+        ordering = []
+        for key in request.query_params.get("ordering", "").split(","):
+            name = param_map.get(key.strip().lstrip("-"))
+            if name:
+                ordering.append(f"-{name}" if key.strip().startswith("-") else name)
+        # a compound query can only be ordered by selected columns
+        columns = list(dict.fromkeys(["id", *fields, *(key.lstrip("-") for key in ordering)]))
+
+        database = self.get_database()
+        parts = []
+        for queryset, archived in ((self.queryset.using(database), False), (ArchivedTenant.objects.using(database), True)):
+            # the filter backend only accepts querysets of the filterset's model
+            filterset = self.filterset_class(request.query_params, queryset=queryset, request=request)
+            if not filterset.is_valid():
+                raise translate_validation(filterset.errors)
+            parts.append(filterset.qs.order_by().values(*columns).annotate(
+                archived=Value(archived, output_field=BooleanField()),
+            ))
+        rows = parts[0].union(parts[1], all=True).order_by(*ordering, "archived", "id")
+
+        page = self.paginate_queryset(rows)
+        rows = [
+            {**{name: row[name] for name in fields}, "archived": row["archived"]}
+            for row in (rows if page is None else page)
+        ]
+        if page is not None:
+            return self.get_paginated_response(rows)
+        return Response(rows)
+
+class PropertyListAPIView(FastListAPIView):
     queryset = Property.objects.all()
     serializer_class = PropertySerializer
+    filterset_class = PropertyFilter
+
+
+# POST a property with its unit rooms:
+# {"address": "...", "property_type": "Private", "units": 100, "pattern": "A-01..A-100"}
+# or "unit_numbers": ["A-01", "A-02"] instead of the pattern
+class PropertyBulkCreateAPIView(CreateAPIView):
+    serializer_class = PropertyBulkCreateSerializer
+
+
+# typeahead sources for the pickers that used to render every row into a <select>
+# name: (queryset of the selectable rows on a database, field used as the option label)
+TYPEAHEAD_SOURCES = {
+    # tenants not assigned to any property (PropertyAddTenantForm)
+    "tenant": (lambda database: Tenant.objects.using(database).filter(properties__isnull=True), "name"),
+    # properties not assigned to any lease manager (LeaseManagerForm, AddPropertyToLeaseManagerForm)
+    "property": (lambda database: Property.objects.using(database).filter(lease_manager__isnull=True), "address"),
+}
+
+TYPEAHEAD_PAGE_SIZE = 20
+
+
+# paginated JSON options for TypeaheadSelect widgets: ?q=<prefix>&page=<n>[&database=<alias>]
+# one query per call, has_more is found by fetching a single extra row instead of counting
+def typeahead_view(request, source):
+    if source not in TYPEAHEAD_SOURCES:
+        return JsonResponse({"error": "Unknown typeahead source."}, status=404)
+    database = shards.database_from_request(request)
+
+    get_queryset, label_field = TYPEAHEAD_SOURCES[source]
+    queryset = search.search(get_queryset(database), request.GET.get("q", "").strip())
+
+    try:
+        page = max(int(request.GET.get("page", 1)), 1)
+    except ValueError:
+        page = 1
+    offset = (page - 1) * TYPEAHEAD_PAGE_SIZE
+
+    rows = list(
+        queryset.order_by("id").values_list("id", label_field)[offset:offset + TYPEAHEAD_PAGE_SIZE + 1]
+    )
+    return JsonResponse({
+        "results": [{"id": pk, "text": label} for pk, label in rows[:TYPEAHEAD_PAGE_SIZE]],
+        "page": page,
+        "has_more": len(rows) > TYPEAHEAD_PAGE_SIZE,
+    })
+
+
+
+class VacantUnitPagination(PageNumberPagination):
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 500
+
+
+# every vacant unit room of a shard
+# ?manager=<id>&property=<id>&property_type=Private&min_rent=&max_rent=&page=[&database=<alias>]
+class VacantUnitListAPIView(ShardListMixin, ListAPIView):
+    queryset = UnitRoom.objects.vacant().select_related("property").order_by("property_id", "unit_number")
+    serializer_class = VacantUnitSerializer
+    pagination_class = VacantUnitPagination
+    filter_backends = (DjangoFilterBackend,)
+    filterset_class = VacantUnitFilter
+
+
+# vacant unit counts grouped per property, same filters as VacantUnitListAPIView
+class VacantPropertyListAPIView(ShardListMixin, ListAPIView):
+    queryset = Property.objects.with_vacant_units().with_average_rent().filter(
+        vacant_units__gt=0,
+    ).order_by("-vacant_units", "id")
+    serializer_class = VacantPropertySerializer
+    pagination_class = VacantUnitPagination
+    filter_backends = (DjangoFilterBackend,)
+    filterset_class = VacantPropertyFilter
+
+
+
+# the whole portfolio as a zip of columnar tables, for analysts loading it in pandas
+# ?format=parquet|csv, defaults to parquet when pyarrow is installed
+def snapshot_api_view(request):
+    from .snapshot import check_format, stream_snapshot
+
+    try:
+        fmt = check_format(request.GET.get("format"))
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    # the archive is written chunk by chunk while it is sent, the tables are read as it goes
+    filename = f"portfolio-{timezone.localdate():%Y%m%d}-{fmt}.zip"
+    return StreamingHttpResponse(
+        stream_snapshot(fmt),
+        content_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+
+class AuditEventPagination(PageNumberPagination):
+    page_size = 100
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+
+
+# the audit trail, newest first
+# ?object_type=tenant&object_id=<id>, ?property=<id>, ?action=, ?start=&end= (ISO datetimes)
+class AuditEventListAPIView(ListAPIView):
+    queryset = AuditEvent.objects.order_by("-created_at", "-id")
+    serializer_class = AuditEventSerializer
+    pagination_class = AuditEventPagination
     filter_backends = (DjangoFilterBackend,)
-    filterset_class = PropertyFilter
\ No newline at end of file
+    filterset_class = AuditEventFilter
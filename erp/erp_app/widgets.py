@@ -0,0 +1,68 @@
+from django import forms
+from django.core.exceptions import ValidationError
+from django.urls import reverse
+from django.utils.http import urlencode
+
+
+class TypeaheadSelect(forms.Select):
+    """A <select> filled on demand from the typeahead API instead of the full queryset
+
+    Only the empty option and the currently selected value(s) are rendered,
+    static/src/typeahead.js fetches the remaining options while the user types.
+
+    Args:
+        source: the typeahead source name, see views.TYPEAHEAD_SOURCES
+        database: the shard the options are read from, the default database if None
+    """
+
+    def __init__(self, source, attrs=None, database=None):
+        super().__init__(attrs)
+        self.source = source
+        self.database = database
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        url = reverse("typeahead_api", args=[self.source])
+        if self.database:
+            url += "?" + urlencode({"database": self.database})
+        context["widget"]["attrs"]["data-typeahead-url"] = url
+        return context
+
+    # render only the selected rows, the ModelChoiceIterator is never iterated
+    # a bound form re-rendered after a failed validation passes the raw submitted values,
+    # the ones that are not a valid primary key are dropped before the query
+    def optgroups(self, name, value, attrs=None):
+        field = getattr(self.choices, "field", None)
+        selected = []
+        if field is not None:
+            pk = self.choices.queryset.model._meta.pk
+            for v in value:
+                if not v:
+                    continue
+                try:
+                    selected.append(pk.to_python(v))
+                except (ValueError, ValidationError):
+                    pass
+
+        choices = []
+        if not self.allow_multiple_selected and field is not None and field.empty_label is not None:
+            choices.append(("", field.empty_label))
+        if selected and field is not None:
+            choices.extend(
+                self.choices.choice(obj)
+                for obj in self.choices.queryset.filter(pk__in=selected)
+            )
+
+        groups = []
+        for index, (option_value, option_label) in enumerate(choices):
+            is_selected = str(option_value) in value
+            groups.append((
+                None,
+                [self.create_option(name, option_value, option_label, is_selected, index, attrs=attrs)],
+                index,
+            ))
+        return groups
+
+
+class TypeaheadSelectMultiple(TypeaheadSelect, forms.SelectMultiple):
+    pass
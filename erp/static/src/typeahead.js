@@ -0,0 +1,87 @@
+// Typeahead for <select data-typeahead-url="..."> rendered by erp_app.widgets.TypeaheadSelect
+// The server only renders the selected option(s); the rest are fetched while typing.
+(function () {
+    const DEBOUNCE_MS = 250;
+
+    function optionFor(item) {
+        const option = document.createElement("option");
+        option.value = item.id;
+        option.textContent = item.text;
+        return option;
+    }
+
+    function attach(select) {
+        const url = select.dataset.typeaheadUrl;
+        const input = document.createElement("input");
+        input.type = "search";
+        input.placeholder = "Type to search...";
+        input.className = select.className + " mb-2";
+        input.setAttribute("autocomplete", "off");
+        select.parentNode.insertBefore(input, select);
+
+        let timer = null;
+        let page = 1;
+        let controller = null;
+
+        function load(append) {
+            if (controller) {
+                controller.abort();
+            }
+            controller = new AbortController();
+            const params = new URLSearchParams({ q: input.value, page: page });
+            // the url may already carry the ?database= of the widget
+            const separator = url.includes("?") ? "&" : "?";
+            fetch(url + separator + params.toString(), { signal: controller.signal })
+                .then((response) => response.json())
+                .then((data) => {
+                    if (!append) {
+                        // keep the empty option and whatever is already selected
+                        Array.from(select.options).forEach((option) => {
+                            if (option.value && !option.selected) {
+                                option.remove();
+                            }
+                        });
+                    }
+                    const present = new Set(Array.from(select.options).map((option) => option.value));
+                    select.querySelectorAll("option[data-more]").forEach((option) => option.remove());
+                    data.results.forEach((item) => {
+                        if (!present.has(String(item.id))) {
+                            select.appendChild(optionFor(item));
+                        }
+                    });
+                    if (data.has_more) {
+                        const more = document.createElement("option");
+                        more.disabled = true;
+                        more.dataset.more = "1";
+                        more.textContent = "More results, keep typing or scroll...";
+                        select.appendChild(more);
+                    }
+                    select.dataset.hasMore = data.has_more ? "1" : "";
+                })
+                .catch(() => {});
+        }
+
+        input.addEventListener("input", () => {
+            clearTimeout(timer);
+            timer = setTimeout(() => {
+                page = 1;
+                load(false);
+            }, DEBOUNCE_MS);
+        });
+
+        // next page when a multi select list is scrolled to the bottom
+        select.addEventListener("scroll", () => {
+            if (select.dataset.hasMore && select.scrollTop + select.clientHeight >= select.scrollHeight - 4) {
+                select.dataset.hasMore = "";
+                page += 1;
+                load(true);
+            }
+        });
+
+        load(false);
+    }
+
+    document.addEventListener("DOMContentLoaded", () => {
+        document.querySelectorAll("select[data-typeahead-url]").forEach(attach);
+    });
+})();